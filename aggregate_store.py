@@ -0,0 +1,213 @@
+"""
+Хранилище недельных агрегатов для инкрементального пересчета
+
+Каждая неделя окна хранится отдельно (Parquet):
+- consumer/        (клиент, товар): запросы, суммы продаж, прибыль
+- consumer_sketch/ (клиент, товар): скетч цен продажи для медианы
+- item_sketch/     (товар): скетч закупочных цен для p10/p50/p90
+
+Недели отсчитываются от последней даты в данных так же, как в
+DataLoader.get_historical_data: [end - 7k, end - 7(k-1)). При еженедельном
+запуске в один и тот же день недели прошлые недели берутся из хранилища,
+а заново агрегируется только последняя. Клиенты хранятся по имени - для
+совместимости с хранилищами, записанными до постоянного словаря кодов
+(id_dictionary.py); consumer_id берется по имени из загруженных данных.
+"""
+
+import json
+import os
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from config import AGGREGATE_STORE_FOLDER, LOOKBACK_WEEKS, SKETCH_RELATIVE_ACCURACY, DATE_FORMAT
+from quantile_sketch import bucket_counts, merge_bucket_counts, bucket_quantiles
+from structured_logging import get_logger
+
+CONSUMER_KEYS = ['consumerName', 'item_id']
+ITEM_KEYS = ['item_id']
+STORE_KINDS = ['consumer', 'consumer_sketch', 'item_sketch']
+
+
+log = get_logger('aggregate_store')
+
+
+def aggregate_frame(data, alpha=SKETCH_RELATIVE_ACCURACY):
+    """Объединяемые агрегаты набора строк (недели, блока CSV и т.п.)"""
+    consumer = data.groupby(CONSUMER_KEYS, dropna=False, observed=True).agg(
+        reqs=('item_id', 'size'),
+        total_sell_value=('consumerAmount', 'sum'),
+        sell_count=('consumerAmount', 'count'),
+        sales=('all_orders', 'sum'),
+        profit=('Profit', 'sum')
+    ).reset_index()
+
+    return {
+        'consumer': consumer,
+        'consumer_sketch': bucket_counts(data, CONSUMER_KEYS, 'consumerAmount', alpha),
+        'item_sketch': bucket_counts(data, ITEM_KEYS, 'producerAmount', alpha)
+    }
+
+
+def merge_aggregates(partials):
+    """Объединение нескольких наборов агрегатов в один"""
+    def combined(kind):
+        frames = [aggs[kind] for aggs in partials if not aggs[kind].empty]
+        return pd.concat(frames, ignore_index=True) if frames else partials[0][kind].iloc[0:0]
+
+    return {
+        'consumer': combined('consumer').groupby(CONSUMER_KEYS, dropna=False, observed=True).sum().reset_index(),
+        'consumer_sketch': merge_bucket_counts(combined('consumer_sketch'), CONSUMER_KEYS),
+        'item_sketch': merge_bucket_counts(combined('item_sketch'), ITEM_KEYS)
+    }
+
+
+def rollup_aggregates(partials, alpha=SKETCH_RELATIVE_ACCURACY):
+    """Свертка агрегатов в окно
+
+    Возвращает (supplier_costs, hist_agg): закупочные цены в формате
+    calculate_supplier_costs и исторические метрики по consumerName.
+    """
+    merged = merge_aggregates(partials)
+    consumer, consumer_sketch, item_sketch = merged['consumer'], merged['consumer_sketch'], merged['item_sketch']
+
+    sell_p50 = bucket_quantiles(consumer_sketch, CONSUMER_KEYS, [0.5], alpha)
+    hist_agg = consumer.merge(sell_p50, on=CONSUMER_KEYS, how='left')
+    hist_agg = pd.DataFrame({
+        'consumerName': hist_agg['consumerName'],
+        'item_id': hist_agg['item_id'],
+        'reqs_hist': hist_agg['reqs'],
+        'total_sell_value_hist': hist_agg['total_sell_value'],
+        'sell_p50_hist': hist_agg[0.5].astype(float),
+        'sell_pavg_hist': hist_agg['total_sell_value'] / hist_agg['sell_count'].replace(0, np.nan),
+        'sales_hist': hist_agg['sales'],
+        'profit_hist': hist_agg['profit']
+    }).round(4)
+
+    costs = bucket_quantiles(item_sketch, ITEM_KEYS, [0.5, 0.1, 0.9], alpha)
+    # Товары без единой закупочной цены остаются с quotes_count = 0
+    items = pd.DataFrame({'item_id': consumer['item_id'].dropna().unique()})
+    quotes = item_sketch.groupby(ITEM_KEYS, observed=True)['count'].sum().rename('quotes_count').reset_index()
+    supplier_costs = items.merge(quotes, on=ITEM_KEYS, how='left').merge(costs, on=ITEM_KEYS, how='left')
+    supplier_costs['quotes_count'] = supplier_costs['quotes_count'].fillna(0).astype(int)
+    supplier_costs = pd.DataFrame({
+        'item_id': supplier_costs['item_id'],
+        'cost_p50': supplier_costs[0.5].astype(float),
+        'cost_p10': supplier_costs[0.1].astype(float),
+        'cost_p90': supplier_costs[0.9].astype(float),
+        'quotes_count': supplier_costs['quotes_count']
+    }).sort_values('item_id').reset_index(drop=True).round(4)
+
+    return supplier_costs, hist_agg
+
+
+class WeeklyAggregateStore:
+    def __init__(self, folder=AGGREGATE_STORE_FOLDER, alpha=SKETCH_RELATIVE_ACCURACY):
+        self.folder = folder
+        self.alpha = alpha
+        for kind in STORE_KINDS:
+            os.makedirs(os.path.join(folder, kind), exist_ok=True)
+        self._check_meta()
+
+    def _check_meta(self):
+        """Скетчи с разной точностью нельзя объединять"""
+        meta_file = os.path.join(self.folder, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('alpha') != self.alpha:
+                raise ValueError(
+                    f"Хранилище {self.folder} создано с точностью скетчей {meta.get('alpha')}, "
+                    f"а в настройках {self.alpha}. Очистите папку хранилища."
+                )
+        else:
+            with open(meta_file, 'w', encoding='utf-8') as f:
+                json.dump({'alpha': self.alpha}, f)
+
+    def _path(self, kind, week_start):
+        return os.path.join(self.folder, kind, f"week={week_start.strftime(DATE_FORMAT)}.parquet")
+
+    def has_week(self, week_start):
+        """Есть ли неделя в хранилище"""
+        return all(os.path.exists(self._path(kind, week_start)) for kind in STORE_KINDS)
+
+    def weeks(self):
+        """Недели в хранилище (даты начала)"""
+        names = os.listdir(os.path.join(self.folder, 'consumer'))
+        starts = [pd.Timestamp(name[len('week='):-len('.parquet')]) for name in names if name.startswith('week=')]
+        return sorted(start for start in starts if self.has_week(start))
+
+    def week_starts(self, end_date, weeks_back=LOOKBACK_WEEKS):
+        """Начала недель окна, от последней к самой старой"""
+        end_date = pd.Timestamp(end_date).normalize()
+        return [end_date - timedelta(weeks=k) for k in range(1, weeks_back + 1)]
+
+    def weeks_to_load(self, end_date, weeks_back=LOOKBACK_WEEKS):
+        """Сколько последних недель сырых данных нужно загрузить
+
+        Последняя неделя пересчитывается всегда, более старые - только
+        если их нет в хранилище.
+        """
+        starts = self.week_starts(end_date, weeks_back)
+        missing = [k for k, start in enumerate(starts, 1) if k == 1 or not self.has_week(start)]
+        return max(missing)
+
+    def aggregate_week(self, week_data):
+        """Агрегаты одной недели"""
+        return aggregate_frame(week_data, self.alpha)
+
+    def save_week(self, week_start, aggregates):
+        """Атомарная запись агрегатов недели"""
+        for kind in STORE_KINDS:
+            path = self._path(kind, week_start)
+            tmp_path = path + '.tmp'
+            aggregates[kind].to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    def load_week(self, week_start):
+        """Чтение агрегатов недели"""
+        return {kind: pd.read_parquet(self._path(kind, week_start)) for kind in STORE_KINDS}
+
+    def rollup(self, weekly_aggregates):
+        """Свертка недельных агрегатов в окно (см. rollup_aggregates)"""
+        return rollup_aggregates(weekly_aggregates, self.alpha)
+
+    def build_aggregates(self, df, weeks_back=LOOKBACK_WEEKS, covered_from=None):
+        """Окно из хранилища плюс досчитанные по df недели
+
+        Недели, которых нет в хранилище, агрегируются из df и сохраняются,
+        если df покрывает их целиком (данные начинаются не позже начала
+        недели или covered_from). Последняя неделя пересчитывается всегда.
+        Частично покрытые недели используются только в текущем расчете.
+        """
+        end_date = df['dates'].max().normalize()
+        if covered_from is None:
+            covered_from = df['dates'].min().normalize()
+        covered_from = pd.Timestamp(covered_from)
+
+        weekly_aggregates = []
+        ingested = 0
+        for k, week_start in enumerate(self.week_starts(end_date, weeks_back), 1):
+            if k > 1 and self.has_week(week_start):
+                weekly_aggregates.append(self.load_week(week_start))
+                continue
+
+            week_end = week_start + timedelta(weeks=1)
+            week_data = df[(df['dates'] >= week_start) & (df['dates'] < week_end)]
+            aggregates = self.aggregate_week(week_data)
+            if covered_from <= week_start:
+                self.save_week(week_start, aggregates)
+            weekly_aggregates.append(aggregates)
+            ingested += 1
+
+        log.info("Недельные агрегаты: {from_store} из хранилища, {ingested} посчитано заново",
+                 from_store=weeks_back - ingested, ingested=ingested)
+        supplier_costs, hist_agg = self.rollup(weekly_aggregates)
+
+        # consumerName -> consumer_id текущей загрузки
+        consumer_ids = df.groupby('consumerName', observed=True)['consumer_id'].first()
+        hist_agg['consumer_id'] = hist_agg['consumerName'].map(consumer_ids)
+        hist_agg = hist_agg.dropna(subset=['consumer_id'])
+        hist_agg['consumer_id'] = hist_agg['consumer_id'].astype(df['consumer_id'].dtype)
+        hist_agg = hist_agg.drop(columns='consumerName')
+
+        return supplier_costs, hist_agg
@@ -0,0 +1,322 @@
+"""
+Фоновые задания анализа загруженных CSV
+
+Файл из запроса пишется на диск по мере поступления (без буферизации в
+памяти), анализ ставится в ограниченный пул процессов, а клиент получает
+ID задания и опрашивает его статус. Статус хранится в status.json в папке
+задания: его пишет процесс-исполнитель, а читает сервис.
+
+    curl -F "file=@data/export.csv" http://localhost:8000/jobs
+    curl http://localhost:8000/jobs/<job_id>
+    curl -O http://localhost:8000/jobs/<job_id>/result
+"""
+
+import json
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from config import JOBS_FOLDER, JOB_WORKERS, JOB_QUEUE_LIMIT, UPLOAD_MAX_MB
+
+STATUS_FILE = 'status.json'
+INPUT_FILE = 'input.csv'
+RESULT_FILE = 'recommendations.csv'
+
+
+class JobQueueFull(Exception):
+    """Все исполнители заняты и очередь заданий заполнена"""
+
+
+class UploadTooLarge(Exception):
+    """Загружаемый файл больше UPLOAD_MAX_MB"""
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def write_status(job_dir, **fields):
+    """Атомарное обновление status.json задания"""
+    path = os.path.join(job_dir, STATUS_FILE)
+    status = read_status(job_dir) or {}
+    status.update(fields, updated_at=_now())
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+    return status
+
+
+def read_status(job_dir):
+    path = os.path.join(job_dir, STATUS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_job(job_dir):
+    """Анализ загруженного файла (выполняется в процессе пула)"""
+    from id_dictionary import IdDictionary
+    from weekly_pricing import analyze_files
+
+    write_status(job_dir, status='running', stage='starting', progress=0.0, started_at=_now())
+    try:
+        stats = analyze_files(
+            os.path.join(job_dir, INPUT_FILE),
+            os.path.join(job_dir, RESULT_FILE),
+            progress=lambda stage, fraction: write_status(job_dir, stage=stage, progress=fraction),
+            # Разовые загрузки не пополняют общий словарь кодов
+            dictionary=IdDictionary(read_only=True)
+        )
+    except Exception as e:
+        write_status(job_dir, status='failed', error=str(e), finished_at=_now())
+        raise
+    write_status(job_dir, status='done', stage='done', progress=1.0, summary=stats, finished_at=_now())
+    return stats
+
+
+class _MultipartFileWriter:
+    """Потоковый разбор multipart/form-data: первый файл пишется прямо на диск"""
+
+    def __init__(self, path, boundary, max_bytes):
+        from python_multipart.multipart import MultipartParser
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.filename = None
+        self._file = None
+        self._done = False
+        self._headers = {}
+        self._field = b''
+        self._value = b''
+        self.parser = MultipartParser(boundary, {
+            'on_part_begin': self._part_begin,
+            'on_header_field': self._header_field,
+            'on_header_value': self._header_value,
+            'on_header_end': self._header_end,
+            'on_headers_finished': self._headers_finished,
+            'on_part_data': self._part_data,
+            'on_part_end': self._part_end
+        })
+
+    def _part_begin(self):
+        self._headers = {}
+        self._field = self._value = b''
+
+    def _header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b''
+
+    def _headers_finished(self):
+        from python_multipart.multipart import parse_options_header
+
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        if b'filename' in options and not self._done:
+            self.filename = options[b'filename'].decode('utf-8', 'replace')
+            self._file = open(self.path, 'wb')
+
+    def _part_data(self, data, start, end):
+        if self._file is not None:
+            self.written += end - start
+            if self.written > self.max_bytes:
+                raise UploadTooLarge(f"Файл больше {self.max_bytes // 2**20} МБ")
+            self._file.write(data[start:end])
+
+    def _part_end(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._done = True
+
+    def write(self, chunk):
+        self.parser.write(chunk)
+
+    def close(self):
+        self.parser.finalize()
+        if self._file is not None:
+            self._file.close()
+        return self._done
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _BodyFileWriter:
+    """Тело запроса целиком - файл на диске (интерфейс как у _MultipartFileWriter)"""
+
+    def __init__(self, path, max_bytes, filename=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.filename = filename
+        self._file = open(path, 'wb')
+
+    def write(self, chunk):
+        self.written += len(chunk)
+        if self.written > self.max_bytes:
+            raise UploadTooLarge(f"Файл больше {self.max_bytes // 2**20} МБ")
+        self._file.write(chunk)
+
+    def close(self):
+        self._file.close()
+        return True
+
+    def abort(self):
+        self._file.close()
+
+
+class JobManager:
+    """Задания анализа: папки на диске, ограниченный пул процессов"""
+
+    def __init__(self, folder=JOBS_FOLDER, max_workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT):
+        self.folder = folder
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def job_dir(self, job_id):
+        # ID задания - hex из uuid4; другое значение не должно выйти за пределы папки
+        if not job_id or not all(ch in '0123456789abcdef' for ch in job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.folder, job_id)
+
+    def create(self):
+        """Новое задание: ID и папка для входного файла"""
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir)
+        write_status(job_dir, job_id=job_id, status='uploading', stage='uploading', progress=0.0, created_at=_now())
+        return job_id, job_dir
+
+    def input_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), INPUT_FILE)
+
+    def active_count(self):
+        return sum(not future.done() for future in self.futures.values())
+
+    def submit(self, job_id):
+        """Постановка анализа в очередь; JobQueueFull, если мест нет"""
+        with self._lock:
+            if self.active_count() >= self.max_workers + self.queue_limit:
+                raise JobQueueFull("Очередь заданий заполнена, повторите позже")
+            job_dir = self.job_dir(job_id)
+            write_status(job_dir, status='queued', stage='queued')
+            self.futures[job_id] = self.executor.submit(run_job, job_dir)
+
+    def status(self, job_id):
+        job_dir = self.job_dir(job_id)
+        status = read_status(job_dir)
+        if status is None:
+            raise KeyError(job_id)
+        future = self.futures.get(job_id)
+        # Процесс мог упасть, не успев записать статус
+        if future is not None and future.done() and future.exception() is not None \
+                and status.get('status') not in ('failed', 'done'):
+            status = write_status(job_dir, status='failed', error=str(future.exception()))
+        return status
+
+    def result_path(self, job_id):
+        """Путь к готовому отчету или None"""
+        if self.status(job_id).get('status') != 'done':
+            return None
+        return os.path.join(self.job_dir(job_id), RESULT_FILE)
+
+    def jobs(self):
+        """Статусы всех заданий, от новых к старым"""
+        statuses = [read_status(os.path.join(self.folder, name)) for name in os.listdir(self.folder)]
+        statuses = [status for status in statuses if status]
+        return sorted(statuses, key=lambda status: status.get('created_at', ''), reverse=True)
+
+    def discard(self, job_id):
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def add_job_routes(app, manager):
+    """Маршруты /jobs: загрузка, статус, список и скачивание результата"""
+    from fastapi import HTTPException, Request
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import FileResponse
+    from python_multipart.multipart import parse_options_header
+
+    def existing_status(job_id):
+        try:
+            return manager.status(job_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Задание {job_id} не найдено")
+
+    @app.post("/jobs", status_code=202)
+    async def upload(request: Request):
+        """CSV как multipart/form-data (поле file) или как тело запроса
+
+        Тело читается в цикле событий, а разбор multipart и запись на диск
+        идут в пуле потоков и не задерживают другие запросы.
+        """
+        job_id, job_dir = await run_in_threadpool(manager.create)
+        path = manager.input_path(job_id)
+        max_bytes = UPLOAD_MAX_MB * 2**20
+        content_type, options = parse_options_header(request.headers.get('content-type', ''))
+        writer = None
+
+        def discard():
+            if writer is not None:
+                writer.abort()
+            manager.discard(job_id)
+
+        try:
+            if content_type == b'multipart/form-data':
+                writer = _MultipartFileWriter(path, options.get(b'boundary', b''), max_bytes)
+            else:
+                writer = await run_in_threadpool(_BodyFileWriter, path, max_bytes, request.query_params.get('filename'))
+            async for chunk in request.stream():
+                await run_in_threadpool(writer.write, chunk)
+            if not await run_in_threadpool(writer.close):
+                raise HTTPException(status_code=422, detail="В запросе нет файла")
+            await run_in_threadpool(write_status, job_dir, filename=writer.filename, size=writer.written)
+            await run_in_threadpool(manager.submit, job_id)
+        except UploadTooLarge as e:
+            await run_in_threadpool(discard)
+            raise HTTPException(status_code=413, detail=str(e))
+        except JobQueueFull as e:
+            await run_in_threadpool(discard)
+            raise HTTPException(status_code=429, detail=str(e))
+        except BaseException:
+            # При обрыве соединения задача отменена, и await уже не дождаться
+            discard()
+            raise
+        return await run_in_threadpool(manager.status, job_id)
+
+    @app.get("/jobs")
+    def list_jobs():
+        return {'active': manager.active_count(), 'jobs': manager.jobs()}
+
+    @app.get("/jobs/{job_id}")
+    def job_status(job_id: str):
+        return existing_status(job_id)
+
+    @app.get("/jobs/{job_id}/result")
+    def job_result(job_id: str):
+        status = existing_status(job_id)
+        path = manager.result_path(job_id)
+        if path is None:
+            raise HTTPException(status_code=409, detail=f"Задание в статусе {status.get('status')}")
+        # FileResponse отдает файл частями, не читая его в память целиком
+        return FileResponse(path, media_type='text/csv', filename=f"recommendations_{job_id}.csv")
@@ -0,0 +1,217 @@
+"""
+Бэктест правил ценообразования на истории
+
+Проходит историю неделя за неделей: для каждой недели рекомендации
+строятся по предыдущим LOOKBACK_WEEKS неделям (как в еженедельном запуске),
+а затем сравниваются с тем, что произошло на следующей неделе:
+
+- включенный товар "угадан", если на следующей неделе были продажи,
+  отключенный - если продаж не было; отключенные товары с продажами дают
+  упущенную прибыль;
+- контрфактическая прибыль: (рекомендованная цена - закупочная цена
+  следующей недели) x фактические продажи. Объем продаж считается
+  неизменным, эластичность спроса не моделируется.
+
+Каждая неделя группируется один раз: точные метрики недели и объединяемые
+агрегаты со скетчами (aggregate_store.aggregate_frame). Окно истории
+сворачивается из недельных агрегатов, поэтому шаг не пересчитывает весь
+DataFrame; медиана и перцентили истории считаются по скетчам, как в
+режиме INCREMENTAL_AGGREGATES.
+
+    python backtest.py
+    python backtest.py --weeks 52
+"""
+
+import argparse
+import os
+import sys
+from collections import deque
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from data_loader import DataLoader
+from pricing_algorithm import PricingAlgorithm, HIST_METRIC_COLUMNS
+from aggregate_store import aggregate_frame, rollup_aggregates
+from structured_logging import get_logger, setup_logging
+from config import DATA_FOLDER, PARQUET_FOLDER, OUTPUT_FOLDER, LOOKBACK_WEEKS, DATE_FORMAT
+
+KEYS = ['consumer_id', 'item_id']
+
+log = get_logger('backtest')
+
+
+class WeekCache:
+    """Метрики и агрегаты недель, каждая неделя считается один раз"""
+
+    def __init__(self, loader, algorithm):
+        self.loader = loader
+        self.algorithm = algorithm
+        self.consumer_ids = None
+        self._weeks = {}
+
+    def get(self, offset):
+        """(начало недели, точные метрики клиентов, агрегаты со скетчами)"""
+        if offset not in self._weeks:
+            rows, start_date, _ = self.loader.get_window(1, offset_weeks=offset)
+            metrics = self.algorithm.calculate_consumer_metrics(rows, pd.DataFrame())
+            if not metrics.empty:
+                metrics = metrics.drop(columns=HIST_METRIC_COLUMNS)
+            self._weeks[offset] = (start_date, metrics, aggregate_frame(rows))
+        return self._weeks[offset]
+
+    def release(self, offset):
+        self._weeks.pop(offset, None)
+
+
+def evaluate_week(recommendations, actual, next_costs):
+    """Сравнение рекомендаций недели с фактом следующей недели"""
+    outcome = recommendations[KEYS + ['enabled', 'price_rec', 'target_margin']].merge(
+        actual[KEYS + ['sales', 'profit', 'sell_p50']].rename(columns={
+            'sales': 'next_sales', 'profit': 'next_profit', 'sell_p50': 'next_sell_p50'
+        }),
+        on=KEYS, how='left'
+    ).merge(
+        next_costs[['item_id', 'cost_p50']].rename(columns={'cost_p50': 'next_cost'}),
+        on='item_id', how='left'
+    )
+
+    enabled = outcome['enabled'].to_numpy(dtype=bool)
+    next_sales = outcome['next_sales'].fillna(0).to_numpy(dtype=float)
+    next_profit = outcome['next_profit'].fillna(0).to_numpy(dtype=float)
+    price = outcome['price_rec'].to_numpy(dtype=float, na_value=np.nan)
+    next_cost = outcome['next_cost'].to_numpy(dtype=float, na_value=np.nan)
+    next_sell = outcome['next_sell_p50'].to_numpy(dtype=float, na_value=np.nan)
+    sold = next_sales > 0
+
+    # Прибыль и маржа по включенным товарам с продажами и известной закупкой
+    priced = enabled & sold & (next_cost > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        counterfactual_margin = (price - next_cost) / next_cost
+        actual_margin = (next_sell - next_cost) / next_cost
+
+    return {
+        'items': len(outcome),
+        'enabled': int(enabled.sum()),
+        'disabled': int((~enabled).sum()),
+        'enabled_sold': int((enabled & sold).sum()),
+        'enabled_unsold': int((enabled & ~sold).sum()),
+        'disabled_sold': int((~enabled & sold).sum()),
+        'disabled_unsold': int((~enabled & ~sold).sum()),
+        'accuracy': float(((enabled & sold) | (~enabled & ~sold)).mean()) if len(outcome) else np.nan,
+        'actual_profit': float(next_profit[priced].sum()),
+        'counterfactual_profit': float(((price - next_cost) * next_sales)[priced].sum()),
+        'lost_profit_disabled': float(next_profit[~enabled & sold].sum()),
+        'actual_margin': float(np.nanmean(actual_margin[priced])) if priced.any() else np.nan,
+        'counterfactual_margin': float(np.nanmean(counterfactual_margin[priced])) if priced.any() else np.nan
+    }
+
+
+def run_backtest(loader, algorithm=None, lookback_weeks=LOOKBACK_WEEKS, max_weeks=None):
+    """Результаты по неделям: рекомендации недели t против факта недели t+1
+
+    Недели считаются от последней даты в данных (как в get_window). Для
+    недели нужна полная история из lookback_weeks недель и следующая
+    неделя; max_weeks ограничивает бэктест последними неделями.
+    """
+    algorithm = PricingAlgorithm(workers=1) if algorithm is None else algorithm
+    dates, end_date = loader._date_index()
+    if end_date is None:
+        return pd.DataFrame()
+    total_weeks = int(np.ceil((end_date - pd.Timestamp(dates[0])) / pd.Timedelta(weeks=1)))
+
+    # offset - сколько недель от конца данных; оцениваются недели 1..oldest
+    oldest = total_weeks - lookback_weeks
+    if max_weeks is not None:
+        oldest = min(oldest, max_weeks)
+    if oldest < 1:
+        raise ValueError(f"Недостаточно истории: нужно больше {lookback_weeks} недель данных")
+
+    weeks = WeekCache(loader, algorithm)
+    window = deque(weeks.get(offset)[2] for offset in range(oldest + lookback_weeks - 1, oldest, -1))
+    results = []
+    for offset in range(oldest, 0, -1):
+        week_start, week_metrics, week_aggregates = weeks.get(offset)
+        window.append(week_aggregates)
+        weeks.release(offset + lookback_weeks)
+        if len(window) > lookback_weeks:
+            window.popleft()
+        if week_metrics.empty:
+            continue
+
+        supplier_costs, hist_agg = rollup_aggregates(list(window))
+        # consumerName агрегатов -> consumer_id по постоянному словарю (без имени - -1, как в prepare_data)
+        hist_agg['consumer_id'] = loader.dictionary.encode('consumer', hist_agg['consumerName'])
+        consumer_metrics = week_metrics.merge(hist_agg.drop(columns='consumerName'), on=KEYS, how='left')
+        consumer_metrics = algorithm.calculate_conversion_rates(consumer_metrics)
+        recommendations = algorithm.recommend_prices(consumer_metrics, supplier_costs)
+
+        _, actual, next_aggregates = weeks.get(offset - 1)
+        next_costs, _ = rollup_aggregates([next_aggregates])
+        if actual.empty:
+            actual = pd.DataFrame(columns=KEYS + ['sales', 'profit', 'sell_p50'])
+        results.append({'week_start': week_start.strftime(DATE_FORMAT), **evaluate_week(recommendations, actual, next_costs)})
+        log.info("   {week_start}: {items} пар, точность {accuracy:.1%}", **results[-1])
+
+    return pd.DataFrame(results)
+
+
+def summarize(results):
+    """Итог бэктеста по всем неделям"""
+    if results.empty:
+        return {}
+    counts = results[['items', 'enabled_sold', 'enabled_unsold', 'disabled_sold', 'disabled_unsold']].sum()
+    return {
+        'weeks': len(results),
+        'items': int(counts['items']),
+        'accuracy': float((counts['enabled_sold'] + counts['disabled_unsold']) / counts['items']),
+        'precision': float(counts['enabled_sold'] / max(counts['enabled_sold'] + counts['enabled_unsold'], 1)),
+        'recall': float(counts['enabled_sold'] / max(counts['enabled_sold'] + counts['disabled_sold'], 1)),
+        'actual_profit': float(results['actual_profit'].sum()),
+        'counterfactual_profit': float(results['counterfactual_profit'].sum()),
+        'lost_profit_disabled': float(results['lost_profit_disabled'].sum()),
+        'actual_margin': float(results['actual_margin'].mean()),
+        'counterfactual_margin': float(results['counterfactual_margin'].mean())
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бэктест правил ценообразования на истории")
+    parser.add_argument('--weeks', type=int, help="сколько последних недель проверить (по умолчанию все)")
+    parser.add_argument('--lookback', type=int, default=LOOKBACK_WEEKS, help="недель истории для рекомендаций")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    loader = DataLoader()
+    if os.path.isdir(PARQUET_FOLDER) and os.listdir(PARQUET_FOLDER):
+        loader.load_parquet()
+    else:
+        loader.load_files(DATA_FOLDER)
+    loader.prepare_data()
+
+    started = datetime.now()
+    print(f"\n⏪ Бэктест: история {args.lookback} недель, проверка на следующей неделе")
+    results = run_backtest(loader, lookback_weeks=args.lookback, max_weeks=args.weeks)
+    seconds = (datetime.now() - started).total_seconds()
+    summary = summarize(results)
+    if not summary:
+        print("❌ Нет недель для проверки")
+        return 1
+
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    output_file = os.path.join(OUTPUT_FOLDER, f"backtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    results.to_csv(output_file, index=False)
+
+    print(f"\n📊 ИТОГ БЭКТЕСТА ({summary['weeks']} недель за {seconds:.1f} c):")
+    print(f"   Точность включения/отключения: {summary['accuracy']:.1%}")
+    print(f"   Включенные товары с продажами: {summary['precision']:.1%}")
+    print(f"   Продававшиеся товары, оставленные включенными: {summary['recall']:.1%}")
+    print(f"   Фактическая прибыль: ${summary['actual_profit']:,.2f} (маржа {summary['actual_margin']:.1%})")
+    print(f"   По рекомендованным ценам: ${summary['counterfactual_profit']:,.2f} (маржа {summary['counterfactual_margin']:.1%})")
+    print(f"   Упущено на отключенных товарах: ${summary['lost_profit_disabled']:,.2f}")
+    print(f"💾 Результаты по неделям: {output_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
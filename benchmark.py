@@ -0,0 +1,257 @@
+"""
+Бенчмарк конвейера ценообразования на синтетических данных
+
+Генерирует наборы на 1M/10M/100M строк с реалистичной асимметрией
+(клиенты и товары по закону Ципфа, много котировок на популярные товары),
+замеряет каждый этап конвейера (время, CPU, пик памяти) и сохраняет
+результаты в JSON для сравнения ревизий:
+
+    python benchmark.py --rows 1M,10M
+    python benchmark.py --rows 1M --compare benchmarks/results/benchmark_20240101_120000.json
+
+Сгенерированные файлы кешируются в benchmarks/data и переиспользуются
+при повторных запусках с тем же размером, seed и параметрами генерации
+(их хеш - в имени файла и в settings результатов).
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from create_sample_data import parse_rows, write_sample_data
+from data_loader import DataLoader
+from id_dictionary import IdDictionary
+from instrumentation import rss_bytes
+from pricing_algorithm import PricingAlgorithm
+from config import (
+    BENCHMARK_FOLDER, LOOKBACK_WEEKS, AGGREGATION_BACKEND, COST_PERCENTILE_MODE, CSV_ENGINE,
+    PRICING_WORKERS
+)
+
+# Синтетические данные: много клиентов и товаров, популярность по Ципфу
+SYNTHETIC_PARAMS = {
+    'days': 60,
+    'consumers': 1000,
+    'suppliers': 50,
+    'countries': 50,
+    'services': 40,
+    'skew': 1.1,
+    'zero_sale_rate': 0.3,
+    'price_drift': 0.001
+}
+
+# Во сколько раз этап может замедлиться, прежде чем считается регрессией
+REGRESSION_THRESHOLD = 1.25
+
+# Этапы быстрее этого порога не сравниваются (шум измерения)
+MIN_COMPARABLE_SECONDS = 0.05
+
+
+def synthetic_params_hash(params=SYNTHETIC_PARAMS):
+    """Короткий хеш параметров генерации: другие параметры - другой файл набора"""
+    encoded = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=4).hexdigest()
+
+
+def generate_dataset(path, n_rows, seed=42):
+    """Синтетический CSV на n_rows строк с асимметрией клиентов и товаров"""
+    return write_sample_data(
+        path, rows=n_rows, seed=seed, partitioned=False, start_date='2024-04-01', **SYNTHETIC_PARAMS
+    )
+
+
+class _PeakMemory:
+    """Пик RSS за время этапа (опрос в фоновом потоке)"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def measure(stage, func, rows_in, results):
+    """Выполнение этапа с замером времени, CPU и памяти"""
+    gc.collect()
+    rss_before = rss_bytes()
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    with _PeakMemory() as memory:
+        result = func()
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_start
+
+    frames = result if isinstance(result, tuple) else (result,)
+    rows_out = sum(len(frame) for frame in frames if isinstance(frame, pd.DataFrame))
+    results.append({
+        'stage': stage,
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4),
+        'rss_before_mb': round(rss_before / 2**20, 1),
+        'rss_after_mb': round(rss_bytes() / 2**20, 1),
+        'peak_rss_delta_mb': round((memory.peak - rss_before) / 2**20, 1),
+        'rows_in': int(rows_in),
+        'rows_out': int(rows_out),
+        'rows_per_second': round(rows_in / wall) if wall > 0 else None
+    })
+    print(f"   {stage:<28} {wall:8.2f} c  CPU {cpu:8.2f} c  пик +{results[-1]['peak_rss_delta_mb']:.0f} МБ")
+    return result
+
+
+def run_pipeline(csv_path, n_rows, backend=AGGREGATION_BACKEND, percentile_mode=COST_PERCENTILE_MODE,
+                 workers=PRICING_WORKERS):
+    """Замер этапов конвейера на одном файле"""
+    results = []
+    loader = DataLoader(data_folder=os.path.dirname(csv_path))
+    # Синтетические клиенты не должны попасть в рабочий словарь кодов
+    loader.dictionary = IdDictionary(path=None)
+    algorithm = PricingAlgorithm(backend=backend, percentile_mode=percentile_mode, workers=workers)
+
+    df = measure('load_csv', lambda: loader.load_csv(os.path.basename(csv_path)), n_rows, results)
+    df = measure('prepare_data', loader.prepare_data, len(df), results)
+    weekly, historical = measure(
+        'select_windows',
+        lambda: (loader.get_weekly_data(weeks_back=1), loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)),
+        len(df), results
+    )
+    supplier_costs = measure(
+        'calculate_supplier_costs', lambda: algorithm.calculate_supplier_costs(historical), len(historical), results
+    )
+    consumer_metrics = measure(
+        'calculate_consumer_metrics', lambda: algorithm.calculate_consumer_metrics(weekly, historical),
+        len(weekly) + len(historical), results
+    )
+    measure(
+        'recommend_from_aggregates', lambda: algorithm.recommend_from_aggregates(supplier_costs, consumer_metrics.copy()),
+        len(consumer_metrics), results
+    )
+    measure(
+        'generate_recommendations', lambda: algorithm.generate_recommendations(weekly, historical),
+        len(weekly) + len(historical), results
+    )
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(current, previous, threshold=REGRESSION_THRESHOLD):
+    """Сравнение с прошлым запуском: список этапов, замедлившихся больше threshold"""
+    baseline = {
+        (run['rows'], stage['stage']): stage['wall_seconds']
+        for run in previous['runs'] for stage in run['stages']
+    }
+    regressions = []
+    print(f"\nСравнение с ревизией {previous.get('revision')}:")
+    params = (current['settings'].get('synthetic_params'), previous.get('settings', {}).get('synthetic_params'))
+    if params[0] != params[1]:
+        print(f"   ⚠️ Наборы сгенерированы с разными параметрами: {params[1]} -> {params[0]}")
+    for run in current['runs']:
+        for stage in run['stages']:
+            before = baseline.get((run['rows'], stage['stage']))
+            if not before:
+                continue
+            ratio = stage['wall_seconds'] / before
+            slower = ratio > threshold and max(before, stage['wall_seconds']) >= MIN_COMPARABLE_SECONDS
+            mark = "  <- регрессия" if slower else ""
+            print(f"   {run['rows']:>12,} {stage['stage']:<28} {before:8.2f} -> {stage['wall_seconds']:8.2f} c (x{ratio:.2f}){mark}")
+            if slower:
+                regressions.append({'rows': run['rows'], 'stage': stage['stage'], 'ratio': round(ratio, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера ценообразования")
+    parser.add_argument('--rows', default='1M', help="размеры наборов через запятую: 1M,10M,100M")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backend', default=AGGREGATION_BACKEND, choices=['pandas', 'duckdb'])
+    parser.add_argument('--percentile-mode', default=COST_PERCENTILE_MODE, choices=['exact', 'sketch'])
+    parser.add_argument('--workers', type=int, default=PRICING_WORKERS, help="процессов для рекомендаций (0 - по числу ядер)")
+    parser.add_argument('--compare', help="JSON прошлого запуска для поиска регрессий")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    report = {
+        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'settings': {
+            'backend': args.backend,
+            'percentile_mode': args.percentile_mode,
+            'csv_engine': CSV_ENGINE,
+            'workers': args.workers,
+            'seed': args.seed,
+            'synthetic_params': synthetic_params_hash()
+        },
+        'runs': []
+    }
+
+    for rows in [parse_rows(value) for value in args.rows.split(',')]:
+        csv_path = os.path.join(BENCHMARK_FOLDER, 'data', f"synthetic_{rows}_{args.seed}_{report['settings']['synthetic_params']}.csv")
+        print(f"\n📊 Набор {rows:,} строк")
+        if not os.path.exists(csv_path):
+            started = time.perf_counter()
+            generate_dataset(csv_path, rows, args.seed)
+            print(f"   Сгенерирован {csv_path} за {time.perf_counter() - started:.1f} c")
+
+        stages = run_pipeline(csv_path, rows, args.backend, args.percentile_mode, args.workers)
+        report['runs'].append({'rows': rows, 'file_size_mb': round(os.path.getsize(csv_path) / 2**20, 1), 'stages': stages})
+        gc.collect()
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_results(report, json.load(f), args.threshold)
+        report['regressions'] = regressions
+
+    results_folder = os.path.join(BENCHMARK_FOLDER, 'results')
+    os.makedirs(results_folder, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results_file = os.path.join(results_folder, f"benchmark_{timestamp}.json")
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты сохранены: {results_file}")
+
+    if regressions:
+        print(f"❌ Регрессий: {len(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,9 +28,29 @@ LOW_DEMAND_THRESHOLD = 5          # Низкий спрос
 
 # Настройки файлов
 DATA_FOLDER = "data"
+PARQUET_FOLDER = "data_parquet"  # Parquet-данные, разбитые по неделям
 OUTPUT_FOLDER = "output"
 BACKUP_FOLDER = "backup"
 
+# Агрегация: "pandas" или "duckdb"
+AGGREGATION_BACKEND = "pandas"
+DUCKDB_MEMORY_LIMIT = "4GB"  # Сверх лимита DuckDB пишет во временную папку
+DUCKDB_TEMP_FOLDER = "duckdb_tmp"
+DUCKDB_THREADS = None  # None - по числу ядер
+
+# Инкрементальный расчет: прошлые недели окна берутся из хранилища агрегатов
+INCREMENTAL_AGGREGATES = False
+AGGREGATE_STORE_FOLDER = "aggregates"
+SKETCH_RELATIVE_ACCURACY = 0.001  # Относительная ошибка квантилей в скетчах (0.1%)
+SKETCH_MAX_BINS = 2048  # Максимум корзин в скетче товара (диапазону цен max/min нужно ~ln(max/min)/(2*alpha))
+
+# Перцентили закупочных цен: "exact" (точно) или "sketch" (по скетчам)
+COST_PERCENTILE_MODE = "exact"
+
+# Параллельный расчет рекомендаций по шардам клиентов (1 - в одном процессе, None - по числу ядер)
+PRICING_WORKERS = 1
+PRICING_SHARDS_PER_WORKER = 4  # Шардов на процесс: выравнивает нагрузку при крупных клиентах
+
 # Форматы дат
 DATE_FORMAT = "%Y-%m-%d"
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
@@ -45,6 +65,86 @@ COLUMN_MAPPING = {
     'sell_price': 'consumerAmount',
     'buy_price': 'producerAmount',
     'quantity': 'all_orders',
+    'profit': 'Profit'
+}
 
+# Типы колонок (ключи как в COLUMN_MAPPING)
+COLUMN_TYPES = {
+    'date': 'datetime64[ns]',
+    'consumer': 'category',
+    'supplier': 'category',
+    'country': 'category',
+    'service': 'category',
+    # float32 вдвое экономнее, но меняет округление медиан на границе 0.00005
+    'sell_price': 'float64',
+    'buy_price': 'float64',
+    'quantity': 'int32',
+    'profit': 'float64'
 }
 
+# Движок чтения CSV: pyarrow (многопоточный) или c
+CSV_ENGINE = "pyarrow"
+
+# Размер блока при чтении больших CSV (строк)
+CSV_CHUNK_SIZE = 500_000
+
+# Процессов для параллельной загрузки нескольких CSV (None - по числу ядер)
+LOAD_WORKERS = None
+
+# Потоковый режим: CSV читается блоками и сразу сворачивается в агрегаты
+STREAMING_MODE = False
+STREAM_MEMORY_LIMIT_MB = 2048  # Потолок памяти на блоки и частичные агрегаты
+
+# Перебор порогов (parameter_sweep.py)
+SWEEP_WORKERS = None          # Процессов (None - по числу ядер)
+SWEEP_CHUNK_CELLS = 5_000_000  # Комбинаций x пар клиент-товар в одном блоке расчета
+
+# Кеш результатов: повторный запуск на тех же файлах и настройках не пересчитывает рекомендации
+RESULT_CACHE = True
+RESULT_CACHE_FOLDER = "cache"
+RESULT_CACHE_MAX_MB = 1024      # Сверх лимита удаляются давно не читавшиеся записи
+RESULT_CACHE_CHECKSUM = False   # Сверять содержимое файлов, а не только размер и время изменения
+
+# Логи (structured_logging.py)
+LOG_LEVEL = "INFO"      # "WARNING" - тихий режим: info-сообщения не форматируются
+LOG_FORMAT = "console"  # "console" (текст) или "json" (строка JSON с полями на сообщение)
+
+# Замеры этапов (instrumentation.py)
+RUN_REPORT = True          # JSON-отчет по этапам каждого запуска в OUTPUT_FOLDER
+PROMETHEUS_TEXTFILE = None # Путь .prom для node_exporter textfile collector (None - не писать)
+PROFILE_STAGE = None       # Имя этапа для профилирования, например "calculate_consumer_metrics"
+PROFILER = "cprofile"      # "cprofile" или "pyinstrument" (если установлен)
+
+# Постоянный словарь кодов клиентов, поставщиков и товаров
+ID_DICTIONARY_FILE = "id_dictionary.json"
+
+# Папка бенчмарка: сгенерированные наборы и результаты замеров
+BENCHMARK_FOLDER = "benchmarks"
+
+# Файлы рекомендаций в OUTPUT_FOLDER (пишутся weekly_pricing.py)
+RECOMMENDATIONS_PATTERN = "weekly_pricing_recos_*.csv"
+
+# Графики (visualize_results.py): файл на график, рисуются без экрана в пуле процессов
+CHART_FORMATS = ["png"]         # "png" и/или "svg"
+CHART_DPI = 120
+CHART_WORKERS = None            # Процессов (None - по числу ядер, 1 - без пула)
+CHART_MAX_POINTS = 20_000       # Точек на облаке сверх этого - детерминированная выборка
+CHART_RASTERIZE_POINTS = 2_000  # Облака крупнее растрируются (и в SVG)
+
+# Отчеты по клиентам (consumer_reports.py): OUTPUT_FOLDER/consumer_reports/<дата>/
+CONSUMER_REPORTS = False                 # weekly_pricing.py пишет их после анализа
+CONSUMER_REPORT_FORMATS = ["csv", "html"]
+CONSUMER_REPORT_WORKERS = None           # Процессов (None - по числу ядер, 1 - без пула)
+PREVIOUS_WEEK_MIN_DAYS = 6               # Прошлая неделя - рекомендации не новее стольких дней
+
+# HTTP-сервис рекомендованных цен (pricing_service.py)
+SERVICE_HOST = "0.0.0.0"
+SERVICE_PORT = 8000
+SERVICE_RELOAD_INTERVAL = 30  # Секунд между проверками новых рекомендаций (0 - только POST /reload)
+
+# Фоновые задания анализа загруженных файлов
+JOBS_FOLDER = "jobs"
+JOB_WORKERS = 2        # Процессов для одновременных заданий
+JOB_QUEUE_LIMIT = 8    # Заданий в очереди сверх работающих
+UPLOAD_MAX_MB = 4096
+
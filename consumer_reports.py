@@ -0,0 +1,336 @@
+"""
+Отчеты по клиентам: файл рекомендаций -> CSV и HTML на каждого клиента
+
+Отчет клиента - его включенные и отключенные товары, цена и изменение
+против прошлой недели (рекомендации не новее PREVIOUS_WEEK_MIN_DAYS дней),
+маржа и прибыль. Рекомендации сортируются по клиенту один раз и режутся по
+границам групп, полная таблица для каждого клиента не фильтруется. Файлы
+пишут процессы пула (только csv и html из стандартной библиотеки) в
+OUTPUT_FOLDER/consumer_reports/<дата>/: дерево собирается во временной
+папке и подменяет прежнее целиком, читатели не увидят половину отчетов.
+
+    python consumer_reports.py
+    python consumer_reports.py --file output/weekly_pricing_recos_20240108_090000.csv --workers 8
+    python consumer_reports.py --previous output/weekly_pricing_recos_20240101_090000.csv
+"""
+
+import argparse
+import csv
+import glob
+import html
+import math
+import os
+import re
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from recommendation_files import file_timestamp, latest_recommendations
+from structured_logging import get_logger, setup_logging
+from config import (OUTPUT_FOLDER, RECOMMENDATIONS_PATTERN, CONSUMER_REPORT_FORMATS,
+                    CONSUMER_REPORT_WORKERS, PREVIOUS_WEEK_MIN_DAYS)
+
+# Ключ товара клиента при сравнении с прошлой неделей
+KEYS = ['consumer_name', 'item_id']
+
+# Колонки отчета клиента (те, что есть в файле рекомендаций, и сравнение с прошлой неделей)
+CONSUMER_REPORT_COLUMNS = [
+    'item_id', 'enabled', 'price_rec', 'price_prev', 'price_delta', 'price_delta_pct',
+    'baseline_cost', 'target_margin', 'reason', 'change', 'reqs', 'sales', 'conversion_rate', 'profit'
+]
+
+# Заголовки колонок в HTML
+COLUMN_TITLES = {
+    'item_id': 'Товар', 'enabled': 'Включен', 'price_rec': 'Цена', 'price_prev': 'Цена прошлой недели',
+    'price_delta': 'Изменение', 'price_delta_pct': 'Изменение, %', 'baseline_cost': 'Закупка',
+    'target_margin': 'Маржа', 'reason': 'Причина', 'change': 'Статус', 'reqs': 'Запросы', 'sales': 'Продажи',
+    'conversion_rate': 'Конверсия', 'profit': 'Прибыль', 'consumer_name': 'Клиент', 'items': 'Товаров',
+    'disabled': 'Отключено', 'price_changes': 'Изменений цены', 'avg_target_margin': 'Средняя маржа'
+}
+
+# Изменение статуса товара против прошлой недели
+CHANGE_NEW = 'новый'
+CHANGE_ENABLED = 'включен'
+CHANGE_DISABLED = 'отключен'
+
+# Символы имени клиента, которые заменяются в имени файла
+UNSAFE_NAME_CHARS = re.compile(r'[^\w.-]+')
+
+HTML_PAGE = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: right; }}
+th {{ background: #f0f0f0; }}
+td:first-child, th:first-child {{ text-align: left; }}
+.up {{ color: #1a7f37; }} .down {{ color: #cf222e; }}
+</style></head>
+<body>
+<h1>{title}</h1>
+<p>{subtitle}</p>
+{body}
+</body></html>
+"""
+
+log = get_logger('consumer_reports')
+
+
+def consumer_slug(consumer_id, consumer_name):
+    """Имя файла или папки клиента, безопасное для файловой системы"""
+    return f"{consumer_id}_{UNSAFE_NAME_CHARS.sub('_', str(consumer_name))}"
+
+
+def previous_recommendations(current_file, folder=OUTPUT_FOLDER, min_days=PREVIOUS_WEEK_MIN_DAYS):
+    """Рекомендации прошлой недели: последний файл не новее min_days дней до current_file
+
+    Повторные запуски в течение недели не считаются прошлой неделей.
+    """
+    current = file_timestamp(current_file)
+    if current is None:
+        return None
+    cutoff = current - timedelta(days=min_days)
+    candidates = [(stamp, path) for path in glob.glob(os.path.join(folder, RECOMMENDATIONS_PATTERN))
+                  if (stamp := file_timestamp(path)) is not None and stamp <= cutoff]
+    return max(candidates)[1] if candidates else None
+
+
+def read_previous(path):
+    """Цены и статусы из файла рекомендаций прошлой недели (None - файла нет)"""
+    return pd.read_csv(path, usecols=KEYS + ['price_rec', 'enabled']) if path else None
+
+
+def add_previous_week(report, previous=None):
+    """Цена и статус прошлой недели, изменение цены и статуса (один merge на всю таблицу)"""
+    if previous is None:
+        previous = pd.DataFrame(columns=KEYS + ['price_rec', 'enabled'])
+    previous = previous[KEYS + ['price_rec', 'enabled']].drop_duplicates(KEYS).rename(
+        columns={'price_rec': 'price_prev', 'enabled': 'enabled_prev'})
+    report = report.merge(previous, on=KEYS, how='left')
+
+    price = pd.to_numeric(report['price_rec'], errors='coerce').to_numpy(dtype=float)
+    price_prev = pd.to_numeric(report['price_prev'], errors='coerce').to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        report['price_delta'] = np.round(price - price_prev, 4)
+        report['price_delta_pct'] = np.round((price - price_prev) / price_prev, 4)
+
+    enabled = report['enabled'].astype(bool).to_numpy()
+    report['enabled'] = enabled
+    known = report['enabled_prev'].notna().to_numpy()
+    enabled_prev = report['enabled_prev'].fillna(False).astype(bool).to_numpy()
+    report['change'] = np.select(
+        [~known, enabled & ~enabled_prev, ~enabled & enabled_prev],
+        [CHANGE_NEW, CHANGE_ENABLED, CHANGE_DISABLED], default=''
+    )
+    return report.drop(columns='enabled_prev')
+
+
+def consumer_tasks(report, folder, formats=CONSUMER_REPORT_FORMATS):
+    """Задачи записи: одна сортировка, затем срезы строк по границам клиентов
+
+    Строки передаются в процессы кортежами Python, pandas там не нужен.
+    """
+    columns = [column for column in CONSUMER_REPORT_COLUMNS if column in report.columns]
+    order = ['consumer_name', 'enabled'] + (['profit'] if 'profit' in report.columns else [])
+    report = report.sort_values(order, ascending=[True] + [False] * (len(order) - 1),
+                                kind='stable', na_position='last').reset_index(drop=True)
+    names = report['consumer_name'].astype(str).to_numpy()
+    starts = np.concatenate([[0], np.flatnonzero(names[1:] != names[:-1]) + 1]) if len(names) else np.array([], dtype=int)
+    ends = np.append(starts[1:], len(names))
+
+    ids = report['consumer_id'].tolist() if 'consumer_id' in report.columns else list(range(len(names)))
+    rows = list(zip(*(report[column].tolist() for column in columns)))
+    return [
+        (ids[start], names[start], columns, rows[start:end], folder, formats)
+        for start, end in zip(starts, ends)
+    ]
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _cell(column, value):
+    """Значение для HTML: цены с 4 знаками, маржа и изменения в процентах"""
+    if _is_missing(value):
+        return ''
+    if column in ('target_margin', 'avg_target_margin', 'price_delta_pct'):
+        return f"{value:+.1%}" if column == 'price_delta_pct' else f"{value:.1%}"
+    if column == 'price_delta':
+        return f"{value:+.4f}"
+    if column in ('price_rec', 'price_prev', 'baseline_cost'):
+        return f"{value:.4f}"
+    if column == 'profit':
+        return f"{value:,.2f}"
+    if column == 'conversion_rate':
+        return f"{value:.2f}"
+    return html.escape(str(value))
+
+
+def _html_table(columns, rows):
+    header = ''.join(f"<th>{COLUMN_TITLES.get(column, column)}</th>" for column in columns)
+    delta = columns.index('price_delta') if 'price_delta' in columns else None
+    lines = []
+    for row in rows:
+        css = ''
+        if delta is not None and not _is_missing(row[delta]) and row[delta] != 0:
+            css = ' class="up"' if row[delta] > 0 else ' class="down"'
+        lines.append(f"<tr{css}>" + ''.join(f"<td>{_cell(column, value)}</td>" for column, value in zip(columns, row)) + "</tr>")
+    return f"<table><tr>{header}</tr>\n" + '\n'.join(lines) + "\n</table>"
+
+
+def _summary(consumer_id, consumer_name, columns, rows):
+    """Итог клиента для summary.csv и index.html"""
+    field = {column: i for i, column in enumerate(columns)}
+    enabled = [row for row in rows if row[field['enabled']]]
+    margins = [row[field['target_margin']] for row in enabled
+               if 'target_margin' in field and not _is_missing(row[field['target_margin']])]
+    profit = sum(row[field['profit']] for row in enabled if not _is_missing(row[field['profit']])) if 'profit' in field else 0.0
+    changed = sum(1 for row in rows if not _is_missing(row[field['price_delta']]) and row[field['price_delta']] != 0) \
+        if 'price_delta' in field else 0
+    return {
+        'consumer_id': consumer_id,
+        'consumer_name': consumer_name,
+        'items': len(rows),
+        'enabled': len(enabled),
+        'disabled': len(rows) - len(enabled),
+        'price_changes': changed,
+        'avg_target_margin': round(sum(margins) / len(margins), 4) if margins else None,
+        'profit': round(profit, 2)
+    }
+
+
+def write_consumer_report(task):
+    """CSV и/или HTML одного клиента; итог клиента"""
+    consumer_id, consumer_name, columns, rows, folder, formats = task
+    slug = consumer_slug(consumer_id, consumer_name)
+    summary = _summary(consumer_id, consumer_name, columns, rows)
+    summary['file'] = slug
+
+    if 'csv' in formats:
+        with open(os.path.join(folder, f"{slug}.csv"), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows([['' if _is_missing(value) else value for value in row] for row in rows])
+
+    if 'html' in formats:
+        enabled = columns.index('enabled')
+        sections = []
+        for title, part in [("Включенные товары", [row for row in rows if row[enabled]]),
+                            ("Отключенные товары", [row for row in rows if not row[enabled]])]:
+            if part:
+                sections.append(f"<h2>{title} ({len(part)})</h2>\n" + _html_table(columns, part))
+        margin = summary['avg_target_margin']
+        subtitle = (f"Товаров: {summary['items']}, включено {summary['enabled']}, отключено {summary['disabled']}, "
+                    f"цена изменилась у {summary['price_changes']}. "
+                    f"Средняя маржа: {'-' if margin is None else f'{margin:.1%}'}, прибыль: ${summary['profit']:,.2f}")
+        with open(os.path.join(folder, f"{slug}.html"), 'w', encoding='utf-8') as f:
+            f.write(HTML_PAGE.format(title=html.escape(f"Рекомендации: {consumer_name}"),
+                                     subtitle=html.escape(subtitle), body='\n'.join(sections)))
+    return summary
+
+
+def _write_index(folder, summaries, formats, source, previous):
+    """summary.csv и index.html со ссылками на отчеты клиентов"""
+    fields = ['consumer_id', 'consumer_name', 'items', 'enabled', 'disabled',
+              'price_changes', 'avg_target_margin', 'profit', 'file']
+    with open(os.path.join(folder, 'summary.csv'), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    if 'html' in formats:
+        columns = fields[1:-1]
+        lines = [
+            "<tr>" + f"<td><a href=\"{html.escape(summary['file'])}.html\">{html.escape(str(summary['consumer_name']))}</a></td>"
+            + ''.join(f"<td>{_cell(column, summary[column])}</td>" for column in columns[1:]) + "</tr>"
+            for summary in summaries
+        ]
+        titles = {**COLUMN_TITLES, 'enabled': 'Включено'}
+        table = "<table><tr>" + ''.join(f"<th>{titles.get(column, column)}</th>" for column in columns) + "</tr>\n" + '\n'.join(lines) + "\n</table>"
+        subtitle = f"Источник: {source}. Прошлая неделя: {previous or 'нет'}"
+        with open(os.path.join(folder, 'index.html'), 'w', encoding='utf-8') as f:
+            f.write(HTML_PAGE.format(title="Отчеты по клиентам", subtitle=html.escape(subtitle), body=table))
+
+
+def _replace_tree(staging, target):
+    """Подмена папки отчетов: прежняя удаляется только после переименования новой"""
+    old = None
+    if os.path.exists(target):
+        old = f"{target}.old-{os.getpid()}"
+        os.replace(target, old)
+    os.replace(staging, target)
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def write_consumer_reports(report, previous=None, folder=None, report_date=None,
+                           formats=CONSUMER_REPORT_FORMATS, workers=CONSUMER_REPORT_WORKERS,
+                           source=None, previous_source=None):
+    """Отчеты всех клиентов в folder/<дата>/; путь к папке
+
+    report - итоговый отчет weekly_pricing (колонки REPORT_COLUMNS),
+    previous - рекомендации прошлой недели (или None).
+    """
+    folder = folder or os.path.join(OUTPUT_FOLDER, 'consumer_reports')
+    target = os.path.join(folder, (report_date or datetime.now()).strftime("%Y-%m-%d"))
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    started = datetime.now()
+    tasks = consumer_tasks(add_previous_week(report, previous), staging, formats)
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    try:
+        if workers <= 1:
+            summaries = [write_consumer_report(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                summaries = list(executor.map(write_consumer_report, tasks,
+                                              chunksize=max(1, len(tasks) // (workers * 4))))
+        _write_index(staging, summaries, formats, source, previous_source)
+        _replace_tree(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    log.info("👥 Отчеты по клиентам: {consumers} клиентов за {seconds:.1f} c ({workers} процессов): {path}",
+             consumers=len(summaries), seconds=(datetime.now() - started).total_seconds(),
+             workers=workers, path=target)
+    return target
+
+
+def reports_for_file(csv_file, previous_file=None, **kwargs):
+    """Отчеты по файлу рекомендаций; прошлая неделя ищется рядом, если не задана"""
+    previous_file = previous_file or previous_recommendations(csv_file, os.path.dirname(csv_file) or '.')
+    report = pd.read_csv(csv_file)
+    if previous_file is None:
+        log.warning("⚠️ Нет рекомендаций прошлой недели (старше {days} дней): изменения цен не считаются",
+                 days=PREVIOUS_WEEK_MIN_DAYS)
+    return write_consumer_reports(report, read_previous(previous_file), report_date=file_timestamp(csv_file),
+                                  source=csv_file, previous_source=previous_file, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSV и HTML отчет рекомендаций на каждого клиента")
+    parser.add_argument('--file', help="файл рекомендаций (по умолчанию последний в output/)")
+    parser.add_argument('--previous', help="рекомендации прошлой недели (по умолчанию ищутся в той же папке)")
+    parser.add_argument('--format', default=','.join(CONSUMER_REPORT_FORMATS), help="форматы: csv,html")
+    parser.add_argument('--workers', type=int, default=CONSUMER_REPORT_WORKERS, help="процессов (по умолчанию по числу ядер)")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    csv_file = args.file or latest_recommendations()
+    if csv_file is None:
+        log.error("❌ Не найдено файлов рекомендаций в {folder}/", folder=OUTPUT_FOLDER)
+        return 1
+    reports_for_file(csv_file, args.previous, formats=args.format.split(','), workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
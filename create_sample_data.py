@@ -1,81 +1,210 @@
 """
 Скрипт для создания примерных данных для тестирования
+
+Транзакции генерируются целыми колонками (np.random.Generator с seed),
+поэтому большие наборы для нагрузочного тестирования строятся за минуты:
+
+    python create_sample_data.py
+    python create_sample_data.py --rows 100M --consumers 5000 --skew 1.1 --format parquet --output data_parquet
+
+Большие наборы пишутся блоками по дням: CSV - по файлу на неделю, Parquet -
+в разделы week=YYYY-MM-DD (тот же формат, что у data_loader.py).
 """
 
-import pandas as pd
+import argparse
 import numpy as np
+import pandas as pd
 from datetime import datetime, timedelta
 import os
 
-def create_sample_data():
+from data_loader import write_week_partitions, _week_start
+from config import DATE_FORMAT, PARQUET_FOLDER
+
+# Базовые справочники (при большем числе стран и сервисов имена генерируются)
+COUNTRIES = ['USA', 'UK', 'DE', 'FR', 'CA']
+SERVICES = ['SMS', 'EMAIL', 'WHATSAPP', 'TELEGRAM', 'VIBER', 'SIGNAL', 'DISCORD', 'SLACK']
+
+# Параметры генерации по умолчанию
+DEFAULT_PARAMS = {
+    'days': 60,               # Дней истории
+    'rows_per_day': 50,       # Среднее число транзакций в день (Пуассон)
+    'consumers': 20,
+    'suppliers': 10,
+    'countries': 5,
+    'services': 8,
+    'skew': 0.0,              # Показатель Ципфа для клиентов и товаров (0 - равномерно)
+    'zero_sale_rate': 0.0,    # Доля транзакций без продаж (all_orders = 0)
+    'price_drift': 0.0,       # Средний дневной дрейф закупочных цен (0.002 = +0.2% в день)
+    'price_noise': 0.10,      # Разброс котировок вокруг базовой цены товара
+    'cost_range': (0.01, 0.10),
+    'margin_range': (0.10, 0.40)
+}
+
+# Строк в одном блоке при потоковой записи
+WRITE_CHUNK_ROWS = 1_000_000
+
+
+def _names(prefix, base, count):
+    """Имена справочника: базовые, а при нехватке - сгенерированные"""
+    if count <= len(base):
+        return list(base[:count])
+    return [f'{prefix}{i:03d}' for i in range(count)]
+
+
+def _rank_probabilities(n, skew):
+    """Вероятности рангов 1..n по закону Ципфа (skew = 0 - равномерно)"""
+    weights = 1.0 / np.power(np.arange(1, n + 1), skew)
+    return weights / weights.sum()
+
+
+class TransactionGenerator:
+    """Генератор транзакций с фиксированными справочниками и ценами товаров"""
+
+    def __init__(self, seed=42, start_date=None, **params):
+        unknown = set(params) - set(DEFAULT_PARAMS)
+        if unknown:
+            raise ValueError(f"Неизвестные параметры генерации: {sorted(unknown)}")
+        self.params = {**DEFAULT_PARAMS, **params}
+        self.seed = seed
+        p = self.params
+
+        days = p['days']
+        self.start_date = pd.Timestamp(start_date) if start_date is not None else \
+            pd.Timestamp(datetime.now() - timedelta(days=days)).normalize()
+
+        self.consumers = [f'Consumer_{i:02d}' for i in range(1, p['consumers'] + 1)]
+        self.suppliers = [f'Supplier_{i:02d}' for i in range(1, p['suppliers'] + 1)]
+        self.countries = _names('C', COUNTRIES, p['countries'])
+        self.services = _names('SERVICE_', SERVICES, p['services'])
+        n_items = p['countries'] * p['services']
+
+        # Цены товаров и их дрейф не зависят от блока записи
+        rng = np.random.default_rng([seed, 0])
+        self.base_cost = rng.uniform(*p['cost_range'], n_items)
+        self.daily_drift = p['price_drift'] * rng.normal(1.0, 0.5, n_items)
+        self.consumer_p = _rank_probabilities(p['consumers'], p['skew'])
+        self.item_p = _rank_probabilities(n_items, p['skew'])
+        # Популярность не совпадает с порядком имен
+        self.consumer_order = rng.permutation(p['consumers'])
+        self.item_order = rng.permutation(n_items)
+
+    def generate(self, day_index, rng):
+        """Транзакции для массива номеров дней (по строке на элемент)"""
+        p = self.params
+        n_rows = len(day_index)
+
+        consumer = self.consumer_order[rng.choice(p['consumers'], size=n_rows, p=self.consumer_p)]
+        item = self.item_order[rng.choice(len(self.item_p), size=n_rows, p=self.item_p)]
+        supplier = rng.integers(0, p['suppliers'], n_rows)
+
+        seconds = rng.integers(0, 86400, n_rows)
+        dates = self.start_date + pd.to_timedelta(day_index, unit='D') + pd.to_timedelta(seconds, unit='s')
+
+        # Базовые цены (закупка и продажа)
+        cost = self.base_cost[item] * np.power(1 + self.daily_drift[item], day_index)
+        buy = np.maximum(cost * (1 + rng.uniform(-p['price_noise'], p['price_noise'], n_rows)), 0.0001)
+        sell = buy * (1 + rng.uniform(*p['margin_range'], n_rows))
+
+        # Количество (часть транзакций без продаж)
+        quantity = rng.poisson(5, n_rows) + 1
+        quantity = np.where(rng.random(n_rows) < p['zero_sale_rate'], 0, quantity)
+
+        df = pd.DataFrame({
+            'dates': dates,
+            'consumerName': pd.Categorical.from_codes(consumer, self.consumers),
+            'producerName': pd.Categorical.from_codes(supplier, self.suppliers),
+            'countryName': pd.Categorical.from_codes(item // p['services'], self.countries),
+            'webserviceName': pd.Categorical.from_codes(item % p['services'], self.services),
+            'consumerAmount': sell.round(4),
+            'producerAmount': buy.round(4),
+            'all_orders': quantity,
+            'Profit': ((sell - buy) * quantity).round(4)
+        })
+        return df.sort_values('dates', kind='stable').reset_index(drop=True)
+
+    def blocks(self, chunk_rows=WRITE_CHUNK_ROWS):
+        """Блоки транзакций подряд идущих дней (не больше ~chunk_rows строк)"""
+        days = self.params['days']
+        days_per_block = max(1, int(chunk_rows // max(self.params['rows_per_day'], 1)))
+
+        for block_idx, first_day in enumerate(range(0, days, days_per_block)):
+            rng = np.random.default_rng([self.seed, block_idx + 1])
+            n_days = min(days_per_block, days - first_day)
+            # Количество транзакций в день (случайное)
+            counts = rng.poisson(self.params['rows_per_day'], n_days)
+            day_index = np.repeat(np.arange(first_day, first_day + n_days), counts)
+            yield self.generate(day_index, rng)
+
+
+def _write_csv(chunk, path, append=False):
+    """Запись блока в CSV (pyarrow - в несколько раз быстрее to_csv)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        chunk.to_csv(path, mode='a' if append else 'w', header=not append, index=False)
+        return
+
+    with open(path, 'ab' if append else 'wb') as f:
+        pa_csv.write_csv(
+            pa.Table.from_pandas(chunk, preserve_index=False), f,
+            pa_csv.WriteOptions(include_header=not append)
+        )
+
+
+def write_sample_data(output, rows=None, seed=42, file_format='csv', partitioned=True,
+                      chunk_rows=WRITE_CHUNK_ROWS, start_date=None, **params):
+    """Потоковая запись синтетического набора
+
+    file_format='csv': при partitioned - файлы sample_YYYY-MM-DD.csv по
+    неделям в папке output, иначе один файл output. file_format='parquet':
+    разделы week=YYYY-MM-DD в папке output. Если задано rows, среднее
+    число транзакций в день подбирается так, чтобы всего вышло около rows
+    строк. Возвращает число строк.
+    """
+    if rows is not None:
+        params['rows_per_day'] = rows / params.get('days', DEFAULT_PARAMS['days'])
+    generator = TransactionGenerator(seed=seed, start_date=start_date, **params)
+    total_rows = 0
+    written_files = set()
+
+    if file_format == 'csv' and not partitioned:
+        folder = os.path.dirname(output)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = output + '.tmp'
+        for chunk in generator.blocks(chunk_rows):
+            _write_csv(chunk, tmp_path, append=bool(total_rows))
+            total_rows += len(chunk)
+        os.replace(tmp_path, output)
+        return total_rows
+
+    os.makedirs(output, exist_ok=True)
+    for block_idx, chunk in enumerate(generator.blocks(chunk_rows)):
+        if file_format == 'parquet':
+            write_week_partitions(chunk, output, f"sample-{seed}-{block_idx}")
+        elif file_format == 'csv':
+            weeks = _week_start(chunk['dates']).dt.strftime(DATE_FORMAT)
+            for week, week_chunk in chunk.groupby(weeks, sort=True):
+                path = os.path.join(output, f"sample_{week}.csv")
+                _write_csv(week_chunk, path, append=path in written_files)
+                written_files.add(path)
+        else:
+            raise ValueError(f"Неизвестный формат: {file_format}")
+        total_rows += len(chunk)
+    return total_rows
+
+
+def create_sample_data(seed=None, **params):
     """Создание примерных данных для тестирования"""
-    
-    # Параметры
-    num_days = 60  # 2 месяца данных
-    num_consumers = 20
-    num_suppliers = 10
-    num_countries = 5
-    num_services = 8
-    
-    # Генерация базовых данных
-    countries = ['USA', 'UK', 'DE', 'FR', 'CA']
-    services = ['SMS', 'EMAIL', 'WHATSAPP', 'TELEGRAM', 'VIBER', 'SIGNAL', 'DISCORD', 'SLACK']
-    consumers = [f'Consumer_{i:02d}' for i in range(1, num_consumers + 1)]
-    suppliers = [f'Supplier_{i:02d}' for i in range(1, num_suppliers + 1)]
-    
-    # Генерация дат
-    start_date = datetime.now() - timedelta(days=num_days)
-    dates = [start_date + timedelta(days=i) for i in range(num_days)]
-    
-    # Генерация транзакций
-    transactions = []
-    
-    for date in dates:
-        # Количество транзакций в день (случайное)
-        daily_transactions = np.random.poisson(50)
-        
-        for _ in range(daily_transactions):
-            # Случайные параметры
-            country = np.random.choice(countries)
-            service = np.random.choice(services)
-            consumer = np.random.choice(consumers)
-            supplier = np.random.choice(suppliers)
-            
-            # Базовые цены (закупка и продажа)
-            base_buy_price = np.random.uniform(0.01, 0.10)  # $0.01 - $0.10
-            margin = np.random.uniform(0.10, 0.40)  # 10% - 40% маржа
-            sell_price = base_buy_price * (1 + margin)
-            
-            # Количество
-            quantity = np.random.poisson(5) + 1  # 1-20 штук
-            
-            # Прибыль
-            profit = (sell_price - base_buy_price) * quantity
-            
-            transaction = {
-                'dates': date,
-                'consumerName': consumer,
-                'producerName': supplier,
-                'countryName': country,
-                'webserviceName': service,
-                'consumerAmount': round(sell_price, 4),
-                'producerAmount': round(base_buy_price, 4),
-                'all_orders': quantity,
-                'Profit': round(profit, 4)
-            }
-            
-            transactions.append(transaction)
-    
-    # Создание DataFrame
-    df = pd.DataFrame(transactions)
-    
-    # Сортировка по дате
-    df = df.sort_values('dates').reset_index(drop=True)
-    
+    seed = np.random.SeedSequence().entropy if seed is None else seed
+    generator = TransactionGenerator(seed=seed, **params)
+    df = pd.concat(list(generator.blocks()), ignore_index=True)
+
     # Сохранение
     output_file = os.path.join('data', 'sample_arbitration_data.csv')
     df.to_csv(output_file, index=False)
-    
+
     print(f"✅ Создан файл с примерными данными: {output_file}")
     print(f"📊 Статистика:")
     print(f"   Всего транзакций: {len(df):,}")
@@ -86,13 +215,48 @@ def create_sample_data():
     print(f"   Общая прибыль: ${df['Profit'].sum():,.2f}")
     print(f"   Средняя цена продажи: ${df['consumerAmount'].mean():.4f}")
     print(f"   Средняя цена закупки: ${df['producerAmount'].mean():.4f}")
-    
+
     return df
 
+
+def parse_rows(value):
+    """'1M' -> 1000000, '500k' -> 500000"""
+    value = value.strip().upper()
+    multiplier = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}.get(value[-1:], 1)
+    number = value[:-1] if value[-1:] in 'KMB' else value
+    return int(float(number) * multiplier)
+
+
 if __name__ == "__main__":
-    # Создаем папку data если её нет
-    if not os.path.exists('data'):
-        os.makedirs('data')
-    
-    create_sample_data()
+    parser = argparse.ArgumentParser(description="Создание тестовых данных")
+    parser.add_argument('--rows', type=parse_rows, help="всего строк (1M, 100M); по умолчанию ~rows_per_day в день")
+    parser.add_argument('--output', help="папка (или файл для --single-file); по умолчанию data/sample_arbitration_data.csv, "
+                                         f"для parquet - {PARQUET_FOLDER}")
+    parser.add_argument('--format', dest='file_format', default='csv', choices=['csv', 'parquet'])
+    parser.add_argument('--single-file', action='store_true', help="один CSV вместо файлов по неделям")
+    parser.add_argument('--seed', type=int)
+    for name, default in DEFAULT_PARAMS.items():
+        if not isinstance(default, tuple):
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=type(default), default=default)
+    args = parser.parse_args()
+    params = {name: getattr(args, name) for name in DEFAULT_PARAMS if hasattr(args, name)}
+    if args.single_file and args.file_format != 'csv':
+        parser.error("--single-file только для --format csv")
 
+    if args.output is None and args.rows is None and args.file_format == 'csv':
+        # Создаем папку data если её нет
+        if not os.path.exists('data'):
+            os.makedirs('data')
+        create_sample_data(seed=args.seed, **params)
+    else:
+        if args.output is not None:
+            output = args.output
+        elif args.file_format == 'parquet':
+            output = PARQUET_FOLDER
+        else:
+            output = 'data' if not args.single_file else os.path.join('data', 'sample_arbitration_data.csv')
+        seed = 42 if args.seed is None else args.seed
+        started = datetime.now()
+        total = write_sample_data(output, args.rows, seed, args.file_format, not args.single_file, **params)
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"✅ Записано {total:,} строк в {output} за {seconds:.1f} c")
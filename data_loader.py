@@ -4,26 +4,169 @@
 
 import pandas as pd
 import numpy as np
+from collections import Counter
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import json
 import os
-from config import COLUMN_MAPPING, DATA_FOLDER, DATE_FORMAT
+import time
+from id_dictionary import IdDictionary, encode_items
+from instrumentation import count_rows, instrumented
+from structured_logging import durations, get_logger, setup_logging
+from config import (
+    COLUMN_MAPPING, COLUMN_TYPES, CSV_ENGINE, DATA_FOLDER, PARQUET_FOLDER, DATE_FORMAT, CSV_CHUNK_SIZE, LOAD_WORKERS,
+    LOOKBACK_WEEKS, STREAM_MEMORY_LIMIT_MB
+)
+
+# Числовые колонки исходных данных
+NUMERIC_COLUMNS = ['consumerAmount', 'producerAmount', 'all_orders', 'Profit']
+
+# Колонка-ключ недельного разбиения Parquet (понедельник недели, YYYY-MM-DD)
+WEEK_PARTITION = 'week'
+
+# Текстовые колонки, которые хранятся как category
+CATEGORICAL_COLUMNS = ['consumerName', 'producerName', 'countryName', 'webserviceName']
+
+# Схема исходных данных: колонка CSV -> тип
+CSV_SCHEMA = {COLUMN_MAPPING[key]: dtype for key, dtype in COLUMN_TYPES.items() if key in COLUMN_MAPPING}
+
+log = get_logger('data_loader')
 
 class DataLoader:
     def __init__(self, data_folder=DATA_FOLDER):
         self.data_folder = data_folder
         self.df = None
+        self.manifest = None
+        self.stream_summary = None
+        self.dictionary = IdDictionary()
+        self.timings = {}
+        # Индекс дат для окон (см. _date_index)
+        self._indexed_df = None
+        self._dates = None
+        self._end_date = None
         
+    @instrumented('load_csv')
     def load_csv(self, filename):
         """Загрузка CSV файла"""
         filepath = os.path.join(self.data_folder, filename)
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"Файл {filepath} не найден")
             
-        print(f"Загружаем данные из {filepath}...")
-        self.df = pd.read_csv(filepath)
-        print(f"Загружено {len(self.df)} строк")
+        log.info("Загружаем данные из {path}...", path=filepath)
+        self.df, self.timings['read'] = read_csv_typed(filepath)
+        log.info("Загружено {rows} строк за {seconds:.2f} c", rows=len(self.df), seconds=self.timings['read'])
+        return self.df
+
+    @instrumented('load_files')
+    def load_files(self, source=None, workers=LOAD_WORKERS):
+        """Загрузка всех CSV из папки или по glob-шаблону
+
+        Файлы разбираются параллельно в пуле процессов и объединяются с
+        общим набором категорий для текстовых колонок. Строки, повторяющиеся
+        в пересекающихся выгрузках, берутся один раз (повторы внутри одного
+        файла сохраняются). Состав загрузки записывается в self.manifest.
+        """
+        source = self.data_folder if source is None else source
+        files = resolve_csv_files(source)
+        if not files:
+            raise FileNotFoundError(f"Не найдено CSV файлов: {source}")
+
+        log.info("Загружаем данные из {file_count} файлов...", file_count=len(files), input_files=files)
+        workers = min(workers or os.cpu_count() or 1, len(files))
+        started = time.perf_counter()
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(read_csv_typed, files))
+        else:
+            results = [read_csv_typed(path) for path in files]
+        frames = [frame for frame, _ in results]
+        self.timings['read'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        df = _concat_with_categories(frames)
+        self.timings['concat'] = time.perf_counter() - started
+        rows_read = len(df)
+        started = time.perf_counter()
+        df = _drop_cross_file_duplicates(df)
+        self.timings['dedup'] = time.perf_counter() - started
+
+        self.manifest = {
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'source': source,
+            'files': [
+                {
+                    'path': path,
+                    'size': os.path.getsize(path),
+                    'mtime': datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S"),
+                    'rows': len(frame),
+                    'read_seconds': round(seconds, 3)
+                }
+                for path, (frame, seconds) in zip(files, results)
+            ],
+            'rows_read': rows_read,
+            'duplicates_dropped': rows_read - len(df),
+            'rows_loaded': len(df)
+        }
+
+        self.df = df
+        log.info("Загружено {rows} строк (дубликатов между файлами: {duplicates})",
+                 rows=len(df), duplicates=rows_read - len(df), rows_read=rows_read)
+        return self.df
+
+    def save_manifest(self, filepath):
+        """Сохранение состава загрузки в JSON"""
+        if self.manifest is None:
+            raise ValueError("Сначала загрузите данные с помощью load_files()")
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        return filepath
+
+    def parquet_max_date(self, parquet_folder=PARQUET_FOLDER):
+        """Последняя дата в Parquet-наборе (читается только последняя неделя)"""
+        return _parquet_max_date(_open_week_dataset(parquet_folder))
+
+    @instrumented('load_parquet')
+    def load_parquet(self, weeks_back=None, start_date=None, end_date=None, parquet_folder=PARQUET_FOLDER):
+        """Загрузка данных из Parquet, разбитого по неделям
+
+        Читаются только колонки из COLUMN_MAPPING. Фильтр по дате отсекает
+        лишние недельные разделы и группы строк по статистике Parquet.
+        Если задан weeks_back, окно отсчитывается от последней даты в данных
+        (как в get_historical_data), а последний день тоже загружается.
+        """
+        import pyarrow.dataset as ds
+
+        if not os.path.isdir(parquet_folder):
+            raise FileNotFoundError(f"Папка {parquet_folder} не найдена")
+
+        dataset = _open_week_dataset(parquet_folder)
+        columns = [col for col in COLUMN_MAPPING.values() if col in dataset.schema.names]
+
+        if weeks_back is not None:
+            start_date = _parquet_max_date(dataset).normalize() - timedelta(weeks=weeks_back)
+            end_date = None
+
+        conditions = []
+        if start_date is not None:
+            start_date = pd.Timestamp(start_date)
+            conditions.append(ds.field(WEEK_PARTITION) >= _week_start(start_date).strftime(DATE_FORMAT))
+            conditions.append(ds.field('dates') >= start_date.to_pydatetime())
+        if end_date is not None:
+            end_date = pd.Timestamp(end_date)
+            conditions.append(ds.field(WEEK_PARTITION) <= _week_start(end_date).strftime(DATE_FORMAT))
+            conditions.append(ds.field('dates') < end_date.to_pydatetime())
+
+        row_filter = None
+        for condition in conditions:
+            row_filter = condition if row_filter is None else row_filter & condition
+
+        log.info("Загружаем данные из {path}...", path=parquet_folder)
+        self.df = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+        log.info("Загружено {rows} строк", rows=len(self.df))
         return self.df
     
+    @instrumented('prepare_data', rows_in=lambda self: count_rows(self.df))
     def prepare_data(self):
         """Подготовка данных для анализа"""
         if self.df is None:
@@ -36,79 +179,227 @@ class DataLoader:
         required_cols = list(COLUMN_MAPPING.values())
         missing_cols = [col for col in required_cols if col not in df.columns]
         if missing_cols:
-            print(f"Предупреждение: отсутствуют колонки {missing_cols}")
-            print(f"Доступные колонки: {list(df.columns)}")
-        
-        # Нормализация данных
-        if 'dates' in df.columns:
-            df['dates'] = pd.to_datetime(df['dates'], errors='coerce')
+            log.warning("Предупреждение: отсутствуют колонки {missing}\nДоступные колонки: {available}",
+                        missing=missing_cols, available=list(df.columns))
         
-        # Создание составных ключей
-        df['country'] = df.get('countryName', '').str.upper().str.strip()
-        df['service'] = df.get('webserviceName', '').str.upper().str.strip()
-        df['item_id'] = df['country'] + " | " + df['service']
-        
-        # Нормализация ID клиентов и поставщиков
-        if 'consumerName' in df.columns:
-            df['consumer_id'] = df['consumerName'].astype('category').cat.codes
-        if 'producerName' in df.columns:
-            df['supplier_id'] = df['producerName'].astype('category').cat.codes
-            
-        # Очистка числовых данных
-        numeric_cols = ['consumerAmount', 'producerAmount', 'all_orders', 'Profit']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Удаление строк с некорректными данными
+        # Нормализация данных и удаление строк с некорректными данными
         initial_count = len(df)
-        df = df.dropna(subset=['dates', 'item_id'])
+        started = time.perf_counter()
+        df = normalize_frame(df, self.dictionary)
+        self.dictionary.save()
+        # Сортировка по датам один раз: окна недель берутся срезами
+        self.df = df
+        self._date_index()
+        df = self.df
+        self.timings['prepare'] = time.perf_counter() - started
         final_count = len(df)
         
         if initial_count != final_count:
-            print(f"Удалено {initial_count - final_count} строк с некорректными данными")
+            log.info("Удалено {dropped} строк с некорректными данными", dropped=initial_count - final_count)
+        log.info("Время этапов: {timings}", timings=durations(self.timings), rows=final_count)
         
         self.df = df
         return df
     
-    def get_weekly_data(self, weeks_back=1):
-        """Получение данных за последние N недель"""
+    def _date_index(self):
+        """Отсортированные даты текущего df и конец окон (строится один раз на df)
+
+        Если df не упорядочен по датам, он один раз сортируется (устойчиво),
+        после чего любое окно - непрерывный диапазон строк.
+        """
         if self.df is None:
             raise ValueError("Сначала загрузите и подготовьте данные")
-            
-        end_date = self.df['dates'].max().normalize()
+        if self._indexed_df is not self.df:
+            if not self.df['dates'].is_monotonic_increasing:
+                self.df = self.df.sort_values('dates', kind='stable').reset_index(drop=True)
+            self._dates = self.df['dates'].to_numpy()
+            self._end_date = pd.Timestamp(self._dates[-1]).normalize() if len(self._dates) else None
+            self._indexed_df = self.df
+        return self._dates, self._end_date
+
+    def window_bounds(self, weeks_back, offset_weeks=0):
+        """Границы окна из weeks_back недель, закончившегося offset_weeks недель назад
+
+        Возвращает (start_date, end_date, первая строка, строка после последней).
+        Окна отсчитываются от полуночи последнего дня данных: [начало, конец).
+        """
+        dates, last_day = self._date_index()
+        if last_day is None:
+            return None, None, 0, 0
+        end_date = last_day - timedelta(weeks=offset_weeks)
         start_date = end_date - timedelta(weeks=weeks_back)
-        
-        weekly_data = self.df[
-            (self.df['dates'] >= start_date) & 
-            (self.df['dates'] < end_date)
-        ].copy()
-        
-        print(f"Данные за {weeks_back} недель: {len(weekly_data)} строк")
-        print(f"Период: {start_date.strftime(DATE_FORMAT)} - {end_date.strftime(DATE_FORMAT)}")
-        
+        start, stop = np.searchsorted(dates, np.array([start_date, end_date], dtype=dates.dtype), side='left')
+        return start_date, end_date, int(start), int(stop)
+
+    @instrumented('select_window')
+    def get_window(self, weeks_back, offset_weeks=0):
+        """Строки окна без сканирования и копирования df
+
+        Окно - срез отсортированного df (поиск границ двоичный), поэтому
+        данные не копируются. Не изменяйте срез на месте: нужна своя
+        таблица - вызовите .copy().
+        """
+        start_date, end_date, start, stop = self.window_bounds(weeks_back, offset_weeks)
+        return self.df.iloc[start:stop], start_date, end_date
+
+    def _print_window(self, title, rows, start_date, end_date):
+        if start_date is None:
+            log.info("{title}: {rows} строк", title=title, rows=rows)
+        else:
+            log.info("{title}: {rows} строк\nПериод: {start_date:" + DATE_FORMAT + "} - {end_date:" + DATE_FORMAT + "}",
+                     title=title, rows=rows, start_date=start_date, end_date=end_date)
+
+    def get_weekly_data(self, weeks_back=1):
+        """Получение данных за последние N недель"""
+        weekly_data, start_date, end_date = self.get_window(weeks_back)
+        self._print_window(f"Данные за {weeks_back} недель", len(weekly_data), start_date, end_date)
         return weekly_data
     
     def get_historical_data(self, weeks_back=8):
         """Получение исторических данных за N недель"""
-        if self.df is None:
-            raise ValueError("Сначала загрузите и подготовьте данные")
-            
-        end_date = self.df['dates'].max().normalize()
-        start_date = end_date - timedelta(weeks=weeks_back)
-        
-        historical_data = self.df[
-            (self.df['dates'] >= start_date) & 
-            (self.df['dates'] < end_date)
-        ].copy()
-        
-        print(f"Исторические данные за {weeks_back} недель: {len(historical_data)} строк")
-        print(f"Период: {start_date.strftime(DATE_FORMAT)} - {end_date.strftime(DATE_FORMAT)}")
-        
+        historical_data, start_date, end_date = self.get_window(weeks_back)
+        self._print_window(f"Исторические данные за {weeks_back} недель", len(historical_data), start_date, end_date)
         return historical_data
     
+    @instrumented('stream_aggregates')
+    def stream_aggregates(self, source=None, weeks_back=LOOKBACK_WEEKS, memory_limit_mb=STREAM_MEMORY_LIMIT_MB):
+        """Потоковый расчет агрегатов без построения полного DataFrame
+
+        Первый проход читает только даты и находит конец окна (как в
+        get_historical_data). Второй читает CSV блоками, нормализует каждый
+        блок и сразу сворачивает его в агрегаты текущей недели и истории.
+        Блок занимает не больше четверти memory_limit_mb, накопленные
+        частичные агрегаты сжимаются, когда превышают еще четверть.
+        Медианы и перцентили считаются по скетчам (SKETCH_RELATIVE_ACCURACY).
+        Повторы строк между файлами отбрасываются как в load_files; для этого
+        запоминаются только строки в перекрытии дат файлов (_OverlapDedup).
+
+        Возвращает (supplier_costs, consumer_metrics) для
+        PricingAlgorithm.recommend_from_aggregates.
+        """
+        from aggregate_store import CONSUMER_KEYS, aggregate_frame, merge_aggregates, rollup_aggregates
+
+        source = self.data_folder if source is None else source
+        files = resolve_csv_files(source)
+        if not files:
+            raise FileNotFoundError(f"Не найдено CSV файлов: {source}")
+
+        budget = memory_limit_mb * 1024 * 1024 // 4
+        chunksize = _chunk_rows(files[0], budget)
+        log.info("Потоковая обработка {file_count} файлов блоками по {chunksize:,} строк...",
+                 file_count=len(files), chunksize=chunksize, input_files=files)
+
+        # Проход 1: первая и последняя дата каждого файла
+        started = time.perf_counter()
+        date_ranges = []
+        for path in files:
+            first = last = None
+            for chunk in pd.read_csv(path, usecols=['dates'], chunksize=chunksize):
+                dates = pd.to_datetime(chunk['dates'], errors='coerce')
+                chunk_min, chunk_max = dates.min(), dates.max()
+                if pd.notna(chunk_min) and (first is None or chunk_min < first):
+                    first = chunk_min
+                if pd.notna(chunk_max) and (last is None or chunk_max > last):
+                    last = chunk_max
+            date_ranges.append((first, last))
+        max_date = max((last for _, last in date_ranges if last is not None), default=None)
+        if max_date is None:
+            raise ValueError("В данных нет корректных дат")
+
+        end_date = max_date.normalize()
+        week_start = end_date - timedelta(weeks=1)
+        hist_start = end_date - timedelta(weeks=weeks_back)
+
+        self.timings['scan_dates'] = time.perf_counter() - started
+
+        # Проход 2: свертка блоков в агрегаты
+        started = time.perf_counter()
+        weekly_parts, hist_parts = [], []
+        last_price = None
+        consumers, suppliers, items = set(), set(), set()
+        totals = {'rows': 0, 'profit': 0.0, 'sell_sum': 0.0, 'sell_count': 0, 'buy_sum': 0.0, 'buy_count': 0}
+        min_date = None
+
+        columns = list(COLUMN_MAPPING.values())
+        dedup = _OverlapDedup(date_ranges, columns)
+        for path in files:
+            dedup.next_file()
+            for chunk in pd.read_csv(path, usecols=lambda col: col in columns, chunksize=chunksize):
+                chunk = normalize_frame(dedup.filter(chunk), self.dictionary)
+
+                # Как в get_data_summary: коды строк, оставшихся после нормализации
+                consumers.update(chunk['consumer_id'].unique())
+                if 'supplier_id' in chunk.columns:
+                    suppliers.update(chunk['supplier_id'].unique())
+                items.update(chunk['item_id'].dropna().unique())
+                totals['rows'] += len(chunk)
+                totals['profit'] += chunk['Profit'].sum()
+                totals['sell_sum'] += chunk['consumerAmount'].sum()
+                totals['sell_count'] += chunk['consumerAmount'].count()
+                totals['buy_sum'] += chunk['producerAmount'].sum()
+                totals['buy_count'] += chunk['producerAmount'].count()
+                chunk_min = chunk['dates'].min()
+                if pd.notna(chunk_min) and (min_date is None or chunk_min < min_date):
+                    min_date = chunk_min
+
+                hist = chunk[(chunk['dates'] >= hist_start) & (chunk['dates'] < end_date)]
+                weekly = hist[hist['dates'] >= week_start]
+                hist_parts.append(aggregate_frame(hist))
+                weekly_parts.append(aggregate_frame(weekly))
+
+                # Последняя цена: значения из более поздних блоков важнее
+                chunk_last = weekly.groupby(CONSUMER_KEYS, dropna=False, observed=True)['consumerAmount'].last()
+                last_price = chunk_last if last_price is None else chunk_last.combine_first(last_price)
+
+                if _aggregates_memory(hist_parts + weekly_parts) > budget:
+                    hist_parts = [merge_aggregates(hist_parts)]
+                    weekly_parts = [merge_aggregates(weekly_parts)]
+
+        self.dictionary.save()
+        self.stream_summary = {
+            'total_rows': totals['rows'],
+            'date_range': (min_date, max_date),
+            'unique_consumers': len(consumers),
+            'unique_suppliers': len(suppliers),
+            'unique_items': len(items),
+            'total_profit': totals['profit'],
+            'avg_sell_price': totals['sell_sum'] / totals['sell_count'] if totals['sell_count'] else 0,
+            'avg_buy_price': totals['buy_sum'] / totals['buy_count'] if totals['buy_count'] else 0
+        }
+        self.timings['aggregate'] = time.perf_counter() - started
+        log.info("Обработано {rows} строк (дубликатов между файлами: {duplicates})\nВремя этапов: {timings}\nПериод: {start_date:" + DATE_FORMAT + "} - {end_date:" + DATE_FORMAT + "}",
+                 rows=totals['rows'], duplicates=dedup.dropped, timings=durations(self.timings),
+                 start_date=week_start, end_date=end_date)
+
+        supplier_costs, hist_agg = rollup_aggregates(hist_parts)
+        _, weekly_agg = rollup_aggregates(weekly_parts)
+        if weekly_agg.empty:
+            return supplier_costs, pd.DataFrame()
+
+        weekly_agg.columns = [col[:-len('_hist')] if col.endswith('_hist') else col for col in weekly_agg.columns]
+        weekly_agg = weekly_agg.merge(
+            last_price.rename('last_price').reset_index(), on=CONSUMER_KEYS, how='left'
+        )
+        for agg in (weekly_agg, hist_agg):
+            agg['consumer_id'] = self.dictionary.encode('consumer', agg['consumerName'])
+
+        weekly_agg = weekly_agg[[
+            'consumer_id', 'item_id', 'reqs', 'total_sell_value', 'sell_p50', 'sell_pavg', 'last_price', 'sales', 'profit'
+        ]].round(4)
+        hist_agg = hist_agg.drop(columns='consumerName')
+        consumer_metrics = weekly_agg.merge(hist_agg, on=['consumer_id', 'item_id'], how='left')
+        consumer_metrics = consumer_metrics.sort_values(['consumer_id', 'item_id']).reset_index(drop=True)
+
+        return supplier_costs, consumer_metrics
+
+    def consumer_mapping(self):
+        """Соответствие consumer_id -> имя клиента"""
+        return self.dictionary.mapping('consumer')
+    
     def get_data_summary(self):
         """Получение сводки по данным"""
+        if self.df is None and self.stream_summary is not None:
+            return self.stream_summary
         if self.df is None:
             raise ValueError("Сначала загрузите данные")
             
@@ -125,3 +416,329 @@ class DataLoader:
         
         return summary
 
+
+
+def normalize_frame(df, dictionary):
+    """Нормализация сырых строк (целого файла или блока CSV)
+
+    Даты и числа приводятся к типам. Клиенты и поставщики получают коды
+    из словаря (consumer_id, supplier_id), страна, сервис и item_id
+    становятся category с категориями словаря. Строки без даты или товара
+    отбрасываются.
+    """
+    if 'dates' in df.columns:
+        df['dates'] = pd.to_datetime(df['dates'], errors='coerce')
+    
+    # Постоянные коды клиентов и поставщиков
+    if 'consumerName' in df.columns:
+        df['consumer_id'] = dictionary.encode('consumer', df['consumerName'])
+    if 'producerName' in df.columns:
+        df['supplier_id'] = dictionary.encode('supplier', df['producerName'])
+    
+    # Создание составных ключей
+    df['country'], df['service'], df['item_id'] = encode_items(
+        dictionary, df['countryName'], df['webserviceName']
+    )
+    
+    # Очистка числовых данных (уже типизированные колонки не меняются)
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = _schema_numeric(pd.to_numeric(df[col], errors='coerce'), CSV_SCHEMA.get(col, 'float64'))
+    
+    return df.dropna(subset=['dates', 'item_id'])
+
+
+def _schema_numeric(values, dtype):
+    """Приведение числовой колонки к типу схемы; целые с пропусками остаются float"""
+    if values.dtype == dtype:
+        return values
+    if pd.api.types.is_integer_dtype(dtype):
+        if values.isna().any() or (values % 1 != 0).any():
+            return values.astype('float64')
+    return values.astype(dtype)
+
+
+def _chunk_rows(path, budget_bytes):
+    """Размер блока CSV (строк), чтобы блок после нормализации уложился в бюджет"""
+    sample = pd.read_csv(path, nrows=10_000, usecols=lambda col: col in COLUMN_MAPPING.values())
+    if sample.empty:
+        return 10_000
+    # Нормализация добавляет country/service/item_id - примерно втрое больше исходного
+    bytes_per_row = 3 * sample.memory_usage(deep=True).sum() / len(sample)
+    return max(10_000, int(budget_bytes / bytes_per_row))
+
+
+def _aggregates_memory(partials):
+    """Память, занятая частичными агрегатами (байт)"""
+    return sum(frame.memory_usage(deep=True).sum() for aggs in partials for frame in aggs.values())
+
+
+def resolve_csv_files(source):
+    """Список CSV по папке, glob-шаблону или пути к файлу (отсортирован)"""
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '*.csv')
+    else:
+        pattern = source
+    return sorted(path for path in glob.glob(pattern) if path.endswith('.csv'))
+
+
+def read_csv_typed(path, engine=CSV_ENGINE):
+    """Чтение CSV по схеме CSV_SCHEMA: (DataFrame, секунд на чтение)
+
+    Читаются только колонки из COLUMN_MAPPING, типы задаются сразу при
+    разборе (движок pyarrow разбирает файл в несколько потоков). Если
+    файл не укладывается в схему (текст в ценах, пропуски в all_orders,
+    некорректные даты), он читается без типов, а приведение выполняет
+    normalize_frame. Выполняется и в процессах пула load_files.
+    """
+    started = time.perf_counter()
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [col for col in header if col in CSV_SCHEMA]
+    dtypes = {col: CSV_SCHEMA[col] for col in columns if col != 'dates'}
+    if engine == 'pyarrow' and not _has_pyarrow():
+        engine = 'c'
+
+    # Целые с пропусками читаются как float, при других ошибках - без типов
+    relaxed = {col: ('float64' if pd.api.types.is_integer_dtype(dtype) else dtype) for col, dtype in dtypes.items()}
+    df = None
+    for attempt in (dtypes, relaxed):
+        try:
+            df = pd.read_csv(
+                path, engine=engine, usecols=columns, dtype=attempt,
+                parse_dates=['dates'] if 'dates' in columns else False
+            )
+        except (ValueError, TypeError) as e:
+            error = str(e).splitlines()[0]
+            continue
+        if 'dates' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['dates']):
+            error = "колонка dates не разобрана как дата"
+            df = None
+            continue
+        break
+    if df is None:
+        log.warning("Файл {path} не соответствует схеме ({error}), читаем без типов", path=path, error=error)
+        df = pd.read_csv(path, usecols=columns)
+
+    return df, time.perf_counter() - started
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _concat_with_categories(frames):
+    """Объединение файлов: текстовые колонки - category с общим набором значений"""
+    frames = [frame.assign(_file=idx) for idx, frame in enumerate(frames)]
+    for col in CATEGORICAL_COLUMNS:
+        if not any(col in frame.columns for frame in frames):
+            continue
+        categories = pd.Index(sorted(set().union(*(
+            frame[col].dropna().astype(str).unique() for frame in frames if col in frame.columns
+        ))))
+        for frame in frames:
+            if col in frame.columns:
+                frame[col] = pd.Categorical(frame[col], categories=categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _drop_cross_file_duplicates(df):
+    """Удаление строк, уже встречавшихся в предыдущих файлах
+
+    Одинаковые строки нумеруются внутри своего файла, и k-я копия остается
+    только из первого файла, где она встретилась.
+    """
+    columns = [col for col in df.columns if col != '_file']
+    if df['_file'].nunique() > 1:
+        occurrence = df.groupby(['_file'] + columns, dropna=False, observed=True).cumcount()
+        keep = ~df.assign(_occurrence=occurrence).duplicated(subset=columns + ['_occurrence'])
+        df = df[keep]
+    return df.drop(columns='_file').reset_index(drop=True)
+
+
+class _OverlapDedup:
+    """Повторы строк между файлами при потоковом чтении (как _drop_cross_file_duplicates)
+
+    Повтор строки имеет ту же дату. Поэтому строка файла может повторять
+    предыдущие файлы, только если она не позже их последней даты, и
+    повториться дальше, только если не раньше первой даты следующих.
+    Считаются только такие строки (и строки без даты), так что память
+    ограничена перекрытием выгрузок, а не размером файлов.
+    """
+
+    def __init__(self, date_ranges, columns):
+        self.date_ranges = date_ranges  # (первая, последняя дата) по файлам
+        self.columns = columns
+        self.seen = Counter()  # строка -> сколько копий было в предыдущих файлах
+        self.in_file = Counter()
+        self.index = -1
+        self.dropped = 0
+
+    def next_file(self):
+        """Переход к следующему файлу"""
+        if self.remember:
+            # Строки раньше первой даты следующих файлов больше не повторятся
+            self.seen = Counter({key: count for key, count in self.seen.items() if self._later(key)})
+            for key, count in self.in_file.items():
+                if count > self.seen[key] and self._later(key):
+                    self.seen[key] = count
+        self.index += 1
+        self.in_file = Counter()
+        earlier = [last for _, last in self.date_ranges[:self.index] if last is not None]
+        later = [first for first, _ in self.date_ranges[self.index + 1:] if first is not None]
+        self.until = max(earlier) if earlier else None
+        self.since = min(later) if later else None
+
+    @property
+    def check(self):
+        return self.index > 0
+
+    @property
+    def remember(self):
+        return 0 <= self.index < len(self.date_ranges) - 1
+
+    def _later(self, key):
+        return key[0] is None or (self.since is not None and key[0] >= self.since)
+
+    def filter(self, chunk):
+        """Блок текущего файла без строк, уже встречавшихся в предыдущих файлах"""
+        if not (self.check or self.remember):
+            return chunk
+        dates = pd.to_datetime(chunk['dates'], errors='coerce')
+        check = dates.isna() & self.check
+        store = dates.isna() & self.remember
+        if self.check and self.until is not None:
+            check |= dates <= self.until
+        if self.remember and self.since is not None:
+            store |= dates >= self.since
+        tracked = check | store
+        if not tracked.any():
+            return chunk
+
+        # Ключ - дата и значения колонок; пропуски как None (NaN != NaN)
+        rows = chunk.loc[tracked].reindex(columns=self.columns).assign(dates=dates[tracked])
+        rows = rows[['dates'] + [col for col in self.columns if col != 'dates']]
+        rows = rows.astype(object).where(rows.notna(), None)
+        drop = []
+        for label, key, checked in zip(rows.index, rows.itertuples(index=False, name=None), check[tracked]):
+            self.in_file[key] += 1
+            if checked and self.in_file[key] <= self.seen[key]:
+                drop.append(label)
+        self.dropped += len(drop)
+        return chunk.drop(index=drop) if drop else chunk
+
+
+def _week_start(dates):
+    """Понедельник недели для даты или колонки дат"""
+    if isinstance(dates, pd.Series):
+        return dates.dt.normalize() - pd.to_timedelta(dates.dt.weekday, unit='D')
+    return dates.normalize() - timedelta(days=dates.weekday())
+
+
+def _parquet_schema(columns):
+    """Схема Parquet для выбранных колонок исходных данных"""
+    import pyarrow as pa
+
+    fields = []
+    for col in columns:
+        if col == 'dates':
+            fields.append(pa.field(col, pa.timestamp('ns')))
+        elif col in NUMERIC_COLUMNS:
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def _open_week_dataset(parquet_folder):
+    """Открытие Parquet-набора с разделами week=YYYY-MM-DD"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([(WEEK_PARTITION, pa.string())]), flavor='hive')
+    return ds.dataset(parquet_folder, format='parquet', partitioning=partitioning)
+
+
+def _parquet_max_date(dataset):
+    """Последняя дата в наборе: читается только раздел последней недели"""
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    weeks = [
+        ds.get_partition_keys(fragment.partition_expression).get(WEEK_PARTITION)
+        for fragment in dataset.get_fragments()
+    ]
+    weeks = [week for week in weeks if week]
+    if not weeks:
+        raise ValueError("В Parquet-наборе нет недельных разделов")
+
+    last_week = dataset.to_table(columns=['dates'], filter=ds.field(WEEK_PARTITION) == max(weeks))
+    return pd.Timestamp(pc.max(last_week['dates']).as_py())
+
+
+def write_week_partitions(chunk, parquet_folder=PARQUET_FOLDER, basename='part', schema=None):
+    """Запись блока строк в Parquet с разделами week=YYYY-MM-DD
+
+    Файлы блока называются {basename}-{i}.parquet; повторная запись с тем
+    же basename перезаписывает их.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(list(chunk.columns)) if schema is None else schema
+    table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+    table = table.append_column(
+        WEEK_PARTITION, pa.array(_week_start(chunk['dates']).dt.strftime(DATE_FORMAT), pa.string())
+    )
+    pq.write_to_dataset(
+        table, parquet_folder,
+        partition_cols=[WEEK_PARTITION],
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+
+def convert_csv_to_parquet(csv_path, parquet_folder=PARQUET_FOLDER, chunksize=CSV_CHUNK_SIZE):
+    """Разовая конвертация CSV в Parquet, разбитый по неделям
+
+    CSV читается блоками, сохраняются только колонки из COLUMN_MAPPING.
+    Каждый блок сортируется по дате и пишется в разделы week=YYYY-MM-DD.
+    Повторная конвертация того же файла перезаписывает его части.
+    """
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Файл {csv_path} не найден")
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    columns = [col for col in COLUMN_MAPPING.values() if col in header]
+    if 'dates' not in columns:
+        raise ValueError(f"В файле {csv_path} нет колонки dates")
+    schema = _parquet_schema(columns)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+
+    log.info("Конвертируем {path} в {parquet_folder}...", path=csv_path, parquet_folder=parquet_folder)
+    total_rows = 0
+    for chunk_idx, chunk in enumerate(pd.read_csv(csv_path, usecols=columns, chunksize=chunksize)):
+        chunk['dates'] = pd.to_datetime(chunk['dates'], errors='coerce')
+        chunk = chunk.dropna(subset=['dates']).sort_values('dates')
+        for col in NUMERIC_COLUMNS:
+            if col in chunk.columns:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+
+        write_week_partitions(chunk[columns], parquet_folder, f"{stem}-{chunk_idx}", schema)
+        total_rows += len(chunk)
+
+    log.info("Записано {rows} строк", rows=total_rows)
+    return total_rows
+
+
+if __name__ == "__main__":
+    # Разовая конвертация всех CSV из папки data в недельный Parquet
+    setup_logging()
+    csv_files = sorted(f for f in os.listdir(DATA_FOLDER) if f.endswith('.csv'))
+    if not csv_files:
+        log.error("❌ В папке {folder} не найдено CSV файлов!", folder=DATA_FOLDER)
+    for csv_file in csv_files:
+        convert_csv_to_parquet(os.path.join(DATA_FOLDER, csv_file))
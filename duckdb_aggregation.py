@@ -0,0 +1,258 @@
+"""
+Агрегация закупочных цен и метрик клиентов средствами DuckDB
+
+Считает те же таблицы, что PricingAlgorithm.calculate_supplier_costs и
+calculate_consumer_metrics, но SQL-агрегатами (quantile_cont, median)
+вместо Python-лямбд. Работает как с подготовленными DataFrame, так и
+напрямую с CSV/Parquet файлами; при нехватке памяти DuckDB сбрасывает
+промежуточные данные во временную папку.
+"""
+
+import os
+import pandas as pd
+from pricing_algorithm import HIST_METRIC_COLUMNS
+from id_dictionary import IdDictionary
+from config import (
+    LOOKBACK_WEEKS, DUCKDB_MEMORY_LIMIT, DUCKDB_TEMP_FOLDER, DUCKDB_THREADS
+)
+
+SUPPLIER_COSTS_SQL = """
+    SELECT
+        item_id,
+        median(producerAmount) AS cost_p50,
+        quantile_cont(producerAmount, 0.1) AS cost_p10,
+        quantile_cont(producerAmount, 0.9) AS cost_p90,
+        count(producerAmount) AS quotes_count
+    FROM {source}
+    GROUP BY item_id
+    ORDER BY item_id
+"""
+
+WEEKLY_METRICS_SQL = """
+    SELECT
+        consumer_id,
+        item_id,
+        count(*) AS reqs,
+        coalesce(sum(consumerAmount), 0) AS total_sell_value,
+        median(consumerAmount) AS sell_p50,
+        avg(consumerAmount) AS sell_pavg,
+        arg_max(consumerAmount, {order_by}) FILTER (WHERE consumerAmount IS NOT NULL) AS last_price,
+        coalesce(sum(all_orders), 0) AS sales,
+        coalesce(sum(Profit), 0) AS profit
+    FROM {source}
+    GROUP BY consumer_id, item_id
+    ORDER BY consumer_id, item_id
+"""
+
+HIST_METRICS_SQL = """
+    SELECT
+        consumer_id,
+        item_id,
+        count(*) AS reqs_hist,
+        coalesce(sum(consumerAmount), 0) AS total_sell_value_hist,
+        median(consumerAmount) AS sell_p50_hist,
+        avg(consumerAmount) AS sell_pavg_hist,
+        coalesce(sum(all_orders), 0) AS sales_hist,
+        coalesce(sum(Profit), 0) AS profit_hist
+    FROM {source}
+    GROUP BY consumer_id, item_id
+    ORDER BY consumer_id, item_id
+"""
+
+
+def _number(column):
+    """SQL-выражение: число из колонки, нечисловые значения и NaN -> NULL"""
+    value = f'TRY_CAST("{column}" AS DOUBLE)'
+    return f"CASE WHEN isnan({value}) THEN NULL ELSE {value} END"
+
+
+def _quoted_list(paths):
+    """SQL-список путей в одинарных кавычках"""
+    return "[" + ", ".join("'" + path.replace("'", "''") + "'" for path in paths) + "]"
+
+
+def _file_scan(paths, filename=False):
+    """SQL-выражение чтения списка CSV или Parquet файлов (filename - с колонкой пути файла)"""
+    if all(path.endswith('.parquet') for path in paths):
+        return f"read_parquet({_quoted_list(paths)}, union_by_name = true, hive_partitioning = true)"
+    return f"read_csv({_quoted_list(paths)}, union_by_name = true, all_varchar = true{', filename = true' if filename else ''})"
+
+
+class DuckDBAggregator:
+    def __init__(self, memory_limit=DUCKDB_MEMORY_LIMIT, temp_directory=DUCKDB_TEMP_FOLDER, threads=DUCKDB_THREADS):
+        import duckdb
+
+        if not os.path.exists(temp_directory):
+            os.makedirs(temp_directory)
+
+        self.con = duckdb.connect()
+        self.con.execute(f"SET memory_limit = '{memory_limit}'")
+        self.con.execute(f"SET temp_directory = '{temp_directory}'")
+        if threads:
+            self.con.execute(f"SET threads = {int(threads)}")
+
+    def _query(self, sql, **frames):
+        """Выполнение запроса; DataFrame передаются как именованные таблицы"""
+        for name, frame in frames.items():
+            self.con.register(name, frame)
+        try:
+            return self.con.execute(sql).df()
+        finally:
+            for name in frames:
+                self.con.unregister(name)
+
+    @staticmethod
+    def _with_row_order(data):
+        """Только нужные колонки и порядковый номер строки для last_price"""
+        columns = [col for col in ['consumer_id', 'item_id', 'consumerAmount', 'producerAmount', 'all_orders', 'Profit']
+                   if col in data.columns]
+        return data[columns].assign(_row=range(len(data)))
+
+    def calculate_supplier_costs(self, historical_data):
+        """Закупочные цены по товарам из DataFrame"""
+        if historical_data.empty:
+            return pd.DataFrame()
+
+        supplier_costs = self._query(
+            SUPPLIER_COSTS_SQL.format(source='historical_data'),
+            historical_data=self._with_row_order(historical_data)
+        )
+        return supplier_costs.round(4)
+
+    def calculate_consumer_metrics(self, weekly_data, historical_data):
+        """Метрики клиентов из DataFrame (та же структура, что у pandas-версии)"""
+        if weekly_data.empty:
+            return pd.DataFrame()
+
+        weekly_agg = self._query(
+            WEEKLY_METRICS_SQL.format(source='weekly_data', order_by='_row'),
+            weekly_data=self._with_row_order(weekly_data)
+        ).round(4)
+
+        hist_agg = None
+        if not historical_data.empty:
+            hist_agg = self._query(
+                HIST_METRICS_SQL.format(source='historical_data'),
+                historical_data=self._with_row_order(historical_data)
+            ).round(4)
+
+        return self._merge_metrics(weekly_agg, hist_agg)
+
+    @staticmethod
+    def _merge_metrics(weekly_agg, hist_agg):
+        """Объединение недельных и исторических метрик"""
+        if hist_agg is None or hist_agg.empty:
+            consumer_metrics = weekly_agg
+            for col in HIST_METRIC_COLUMNS:
+                consumer_metrics[col] = 0
+            return consumer_metrics
+        return weekly_agg.merge(hist_agg, on=['consumer_id', 'item_id'], how='left')
+
+    def register_files(self, paths, dictionary=None):
+        """Представление transactions над CSV/Parquet файлами
+
+        Нормализация повторяет DataLoader.prepare_data: страна и сервис в
+        верхнем регистре, item_id = "СТРАНА | СЕРВИС", consumer_id - код
+        клиента из постоянного словаря, строки без даты отбрасываются.
+        Повторы строк между CSV удаляются как в DataLoader.load_files: k-я
+        копия строки остается только из первого файла, где она встретилась
+        (строки сравниваются как текст файла).
+        """
+        dictionary = IdDictionary() if dictionary is None else dictionary
+        paths = [paths] if isinstance(paths, str) else list(paths)
+        columns = [row[0] for row in self.con.execute(f"DESCRIBE SELECT * FROM {_file_scan(paths)}").fetchall()]
+        # _row - номер строки в порядке файлов и строк (как после concat в load_files):
+        # row_number() OVER () потоковый и сохраняет порядок чтения
+        source = f"(SELECT *, row_number() OVER () AS _row FROM {_file_scan(paths)})"
+        if len(paths) > 1 and not all(path.endswith('.parquet') for path in paths):
+            keys = ", ".join('"' + column.replace('"', '""') + '"' for column in columns)
+            source = f"""(
+                SELECT * EXCLUDE (filename, _file, _occurrence) FROM (
+                    SELECT *,
+                        list_position({_quoted_list(paths)}, filename) AS _file,
+                        row_number() OVER (PARTITION BY filename, {keys}) AS _occurrence
+                    FROM (SELECT *, row_number() OVER () AS _row FROM {_file_scan(paths, filename=True)})
+                )
+                QUALIFY _file = min(_file) OVER (PARTITION BY {keys}, _occurrence)
+            )"""
+        self.con.execute(f"""
+            CREATE OR REPLACE VIEW raw_transactions AS
+            SELECT
+                TRY_CAST(dates AS TIMESTAMP) AS dates,
+                consumerName,
+                {'producerName' if 'producerName' in columns else 'NULL'} AS producerName,
+                upper(trim(countryName)) || ' | ' || upper(trim(webserviceName)) AS item_id,
+                {_number('consumerAmount')} AS consumerAmount,
+                {_number('producerAmount')} AS producerAmount,
+                {_number('all_orders')} AS all_orders,
+                {_number('Profit')} AS Profit,
+                _row
+            FROM {source}
+        """)
+        names = self.con.execute("SELECT DISTINCT consumerName FROM raw_transactions").df()['consumerName']
+        consumer_codes = pd.DataFrame({'consumerName': names, 'code': dictionary.encode('consumer', names)})
+        dictionary.save()
+        self.con.register('consumer_codes', consumer_codes)
+        self.con.execute("""
+            CREATE OR REPLACE VIEW transactions AS
+            SELECT
+                coalesce(c.code, -1) AS consumer_id,
+                t.*
+            FROM raw_transactions t
+            LEFT JOIN consumer_codes c ON t.consumerName = c.consumerName
+            WHERE t.dates IS NOT NULL AND t.item_id IS NOT NULL
+        """)
+
+    def _register_window(self, name, weeks_back):
+        """Представление за последние N недель до последней даты (без нее)"""
+        self.con.execute(f"""
+            CREATE OR REPLACE VIEW {name} AS
+            WITH bounds AS (SELECT date_trunc('day', max(dates)) AS end_date FROM transactions)
+            SELECT t.*
+            FROM transactions t, bounds b
+            WHERE t.dates >= b.end_date - INTERVAL {int(weeks_back)} WEEK
+              AND t.dates < b.end_date
+        """)
+
+    def aggregate_files(self, paths, weeks_back=LOOKBACK_WEEKS, dictionary=None):
+        """Закупочные цены и метрики клиентов напрямую из файлов
+
+        Возвращает (supplier_costs, consumer_metrics) той же структуры, что
+        и pandas-версия. last_price берется по самой поздней дате, при равных
+        датах - по порядку файлов и строк, как .last() после устойчивой
+        сортировки в DataLoader.
+        """
+        self.register_files(paths, dictionary)
+        self._register_window('weekly_window', 1)
+        self._register_window('historical_window', weeks_back)
+
+        supplier_costs = self._query(SUPPLIER_COSTS_SQL.format(source='historical_window')).round(4)
+        weekly_agg = self._query(WEEKLY_METRICS_SQL.format(source='weekly_window', order_by='(dates, _row)')).round(4)
+        if weekly_agg.empty:
+            return supplier_costs, pd.DataFrame()
+        hist_agg = self._query(HIST_METRICS_SQL.format(source='historical_window')).round(4)
+
+        return supplier_costs, self._merge_metrics(weekly_agg, hist_agg)
+
+    def data_summary(self):
+        """Сводка по представлению transactions (ключи как у DataLoader.get_data_summary)"""
+        row = self.con.execute("""
+            SELECT count(*), min(dates), max(dates), count(DISTINCT consumer_id),
+                   count(DISTINCT producerName), count(DISTINCT item_id),
+                   coalesce(sum(Profit), 0), avg(consumerAmount), avg(producerAmount)
+            FROM transactions
+        """).fetchone()
+        return {
+            'total_rows': row[0],
+            'date_range': (pd.Timestamp(row[1]), pd.Timestamp(row[2])),
+            'unique_consumers': row[3],
+            'unique_suppliers': row[4],
+            'unique_items': row[5],
+            'total_profit': row[6],
+            'avg_sell_price': row[7] or 0,
+            'avg_buy_price': row[8] or 0
+        }
+
+    def close(self):
+        """Закрытие соединения с DuckDB"""
+        self.con.close()
@@ -0,0 +1,129 @@
+"""
+Постоянный словарь кодов для клиентов, поставщиков, стран, сервисов и товаров
+
+Код значения - его номер в списке словаря. Новые значения только
+дописываются в конец, поэтому один и тот же клиент или товар получает
+одинаковый код во всех файлах и запусках. Словарь хранится в JSON и
+записывается атомарно.
+
+Строки в таблице транзакций хранятся как category с категориями из
+словаря: группировки и объединения работают по целочисленным кодам, а
+текст появляется только при выводе отчетов.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from config import ID_DICTIONARY_FILE
+
+DICTIONARY_KINDS = ['consumer', 'supplier', 'country', 'service', 'item']
+
+# Разделитель страны и сервиса в item_id
+ITEM_SEPARATOR = " | "
+
+
+class IdDictionary:
+    def __init__(self, path=ID_DICTIONARY_FILE, read_only=False):
+        self.path = path
+        # Только чтение: новые значения получают коды лишь в памяти
+        self.read_only = read_only
+        self.values = {kind: [] for kind in DICTIONARY_KINDS}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            for kind in DICTIONARY_KINDS:
+                self.values[kind] = list(stored.get(kind, []))
+        self._codes = {kind: {value: code for code, value in enumerate(values)}
+                       for kind, values in self.values.items()}
+        self.changed = False
+
+    def __len__(self):
+        return sum(len(values) for values in self.values.values())
+
+    def add(self, kind, values):
+        """Добавление новых значений в конец словаря"""
+        codes = self._codes[kind]
+        for value in values:
+            if value not in codes:
+                codes[value] = len(self.values[kind])
+                self.values[kind].append(value)
+                self.changed = True
+
+    def categories(self, kind):
+        """Все значения словаря в порядке кодов"""
+        return pd.Index(self.values[kind], dtype=object)
+
+    def encode(self, kind, values, normalize=False):
+        """Коды значений (int32, -1 для пропусков); новые значения добавляются
+
+        Значения переводятся в коды через category: словарь и нормализация
+        (normalize - верхний регистр без пробелов по краям) работают по
+        уникальным значениям, а не по строкам.
+        """
+        values = pd.Series(values, copy=False)
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+        categories = values.cat.categories.astype(str)
+        if normalize:
+            categories = categories.str.upper().str.strip()
+        self.add(kind, categories.unique())
+        lookup = np.array([self._codes[kind][value] for value in categories], dtype=np.int32)
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, lookup[np.maximum(codes, 0)], -1).astype(np.int32)
+
+    def categorical(self, kind, values, normalize=False):
+        """Значения как category с категориями словаря"""
+        return pd.Categorical.from_codes(
+            self.encode(kind, values, normalize), categories=self.categories(kind)
+        )
+
+    def decode(self, kind, codes):
+        """Значения по кодам (None для -1)"""
+        values = np.array(self.values[kind] + [None], dtype=object)
+        return values[np.asarray(codes, dtype=np.int64)]
+
+    def mapping(self, kind):
+        """Соответствие код -> значение"""
+        return dict(enumerate(self.values[kind]))
+
+    def save(self):
+        """Атомарная запись словаря, если в нем появились новые значения"""
+        if not self.changed or not self.path or self.read_only:
+            return
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.values, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def encode_items(dictionary, country_name, service_name):
+    """Страна, сервис и item_id как category из словаря
+
+    Нормализация (верхний регистр, без пробелов по краям) выполняется по
+    уникальным значениям, а item_id собирается из уникальных пар кодов
+    страна-сервис, а не построчно.
+    """
+    country = dictionary.categorical('country', country_name, normalize=True)
+    service = dictionary.categorical('service', service_name, normalize=True)
+
+    width = len(service.categories) + 1
+    country_codes = np.asarray(country.codes, dtype=np.int64)
+    service_codes = np.asarray(service.codes, dtype=np.int64)
+    pairs = np.where((country_codes >= 0) & (service_codes >= 0), country_codes * width + service_codes, -1)
+
+    unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+    pair_names = pd.Series([
+        None if pair < 0 else
+        country.categories[pair // width] + ITEM_SEPARATOR + service.categories[pair % width]
+        for pair in unique_pairs.tolist()
+    ], dtype=object)
+    item_codes = dictionary.encode('item', pair_names)[inverse.reshape(-1)]
+    item = pd.Categorical.from_codes(item_codes, categories=dictionary.categories('item'))
+
+    return country, service, item
+
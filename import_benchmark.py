@@ -0,0 +1,166 @@
+"""
+Бенчмарк времени запуска подкоманд pricing_cli.py
+
+Для каждой подкоманды модули из COMMAND_MODULES импортируются в новом
+процессе Python (несколько раз, берется лучшее время), а импорт
+`python -X importtime` показывает самые тяжелые модули. Легкие подкоманды
+(LIGHT_COMMANDS) не должны загружать pandas, numpy, matplotlib и другие
+тяжелые библиотеки и укладываться в свой бюджет:
+
+    python import_benchmark.py
+    python import_benchmark.py --compare benchmarks/results/startup_20240101_120000.json
+
+Код завершения 1 - бюджет превышен, тяжелый модуль загружен легкой
+подкомандой или время выросло больше REGRESSION_THRESHOLD раз.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+from config import BENCHMARK_FOLDER
+from pricing_cli import COMMAND_MODULES
+
+# Легкие подкоманды: бюджет импорта, секунд
+LIGHT_COMMANDS = {'lookup': 0.15}
+
+# Библиотеки, которые легкие подкоманды не должны импортировать
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'matplotlib', 'seaborn', 'duckdb', 'fastapi']
+
+# Во сколько раз запуск может замедлиться, прежде чем считается регрессией
+REGRESSION_THRESHOLD = 1.5
+
+# Разница меньше этой не считается регрессией (шум запуска процесса)
+MIN_COMPARABLE_SECONDS = 0.05
+
+_MEASURE = """
+import importlib, json, sys, time
+started = time.perf_counter()
+import pricing_cli
+for name in {modules!r}:
+    importlib.import_module(name)
+seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_command(command, repeat=5):
+    """Лучшее время импорта подкоманды и загруженные тяжелые модули"""
+    code = _MEASURE.format(modules=COMMAND_MODULES[command], heavy=HEAVY_MODULES)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {
+        'command': command,
+        'seconds': round(min(run['seconds'] for run in runs), 4),
+        'heavy_modules': runs[0]['heavy']
+    }
+
+
+def slowest_imports(command, top=5):
+    """Модули верхнего уровня с наибольшим накопленным временем импорта (секунд)"""
+    modules = ['pricing_cli'] + COMMAND_MODULES[command]
+    code = '; '.join(f"import {name}" for name in modules)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # вложенные импорты уже учтены в cumulative
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return [{'module': name, 'seconds': round(seconds, 4)} for seconds, name in sorted(imports, reverse=True)[:top]]
+
+
+def check_command(result):
+    """Нарушения бюджета легкой подкоманды"""
+    problems = []
+    budget = LIGHT_COMMANDS.get(result['command'])
+    if budget is None:
+        return problems
+    if result['heavy_modules']:
+        problems.append(f"{result['command']}: загружены {', '.join(result['heavy_modules'])}")
+    if result['seconds'] > budget:
+        problems.append(f"{result['command']}: {result['seconds']:.3f} c при бюджете {budget:.3f} c")
+    return problems
+
+
+def compare_results(current, previous, threshold=REGRESSION_THRESHOLD):
+    """Подкоманды, запуск которых замедлился больше threshold"""
+    baseline = {result['command']: result['seconds'] for result in previous['commands']}
+    regressions = []
+    print(f"\nСравнение с ревизией {previous.get('revision')}:")
+    for result in current['commands']:
+        before = baseline.get(result['command'])
+        if not before:
+            continue
+        ratio = result['seconds'] / before
+        slower = ratio > threshold and result['seconds'] - before >= MIN_COMPARABLE_SECONDS
+        mark = "  <- регрессия" if slower else ""
+        print(f"   {result['command']:<10} {before:6.3f} -> {result['seconds']:6.3f} c (x{ratio:.2f}){mark}")
+        if slower:
+            regressions.append(f"{result['command']}: медленнее в {ratio:.2f} раза")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Время запуска подкоманд pricing_cli.py")
+    parser.add_argument('--repeat', type=int, default=5, help="запусков на подкоманду (берется лучший)")
+    parser.add_argument('--compare', help="JSON прошлого запуска для поиска регрессий")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    report = {
+        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'commands': []
+    }
+    problems = []
+    print("⏱️ Время импорта подкоманд:")
+    for command in COMMAND_MODULES:
+        result = measure_command(command, args.repeat)
+        result['slowest_imports'] = slowest_imports(command)
+        report['commands'].append(result)
+        problems += check_command(result)
+        heaviest = ', '.join(f"{entry['module']} {entry['seconds']:.2f} c" for entry in result['slowest_imports'][:3])
+        print(f"   {command:<10} {result['seconds']:6.3f} c   ({heaviest})")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            problems += compare_results(report, json.load(f), args.threshold)
+    report['problems'] = problems
+
+    results_folder = os.path.join(BENCHMARK_FOLDER, 'results')
+    os.makedirs(results_folder, exist_ok=True)
+    results_file = os.path.join(results_folder, f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(results_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты сохранены: {results_file}")
+
+    if problems:
+        print("❌ Проблемы запуска:")
+        for problem in problems:
+            print(f"   {problem}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
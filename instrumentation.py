@@ -0,0 +1,253 @@
+"""
+Замеры этапов конвейера
+
+Каждый этап (загрузка, подготовка, агрегаты, рекомендации, запись отчета)
+записывает время, процессорное время, изменение RSS и число строк на
+входе и выходе. Этапы могут быть вложенными: у записи есть родитель.
+Итог сохраняется в JSON-отчет запуска и по желанию - в текстовый формат
+Prometheus (для node_exporter textfile collector).
+
+Один этап можно запустить под профилировщиком: PROFILE_STAGE в config.py
+(cProfile или pyinstrument, если установлен).
+
+    @instrumented('prepare_data')
+    def prepare_data(self): ...
+
+    with stage('write_report', rows_in=len(report)):
+        ...
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from structured_logging import get_logger
+from config import OUTPUT_FOLDER, PROFILE_STAGE, PROFILER
+
+# Записей в памяти не больше (долгоживущие процессы вызывают этапы много раз)
+MAX_RECORDS = 10_000
+
+# Метрики Prometheus: поле записи -> (имя, описание)
+PROMETHEUS_METRICS = {
+    'calls': ('pricing_stage_calls', 'Число вызовов этапа'),
+    'wall_seconds': ('pricing_stage_wall_seconds', 'Время этапа, секунд'),
+    'cpu_seconds': ('pricing_stage_cpu_seconds', 'Процессорное время этапа, секунд'),
+    'rss_delta_bytes': ('pricing_stage_rss_delta_bytes', 'Изменение резидентной памяти за этап, байт'),
+    'rows_in': ('pricing_stage_rows_in', 'Строк на входе этапа'),
+    'rows_out': ('pricing_stage_rows_out', 'Строк на выходе этапа')
+}
+
+
+log = get_logger('instrumentation')
+
+
+def rss_bytes():
+    """Текущая резидентная память процесса"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss - пиковое значение (КБ в Linux, байты в macOS)
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def count_rows(value):
+    """Строк в таблице или сумма по кортежу таблиц (None, если это не таблицы)"""
+    frames = value if isinstance(value, tuple) else (value,)
+    lengths = [len(frame) for frame in frames if hasattr(frame, 'columns') and hasattr(frame, '__len__')]
+    return sum(lengths) if lengths else None
+
+
+class _Profile:
+    """Профилирование одного вызова этапа с записью результата в OUTPUT_FOLDER"""
+
+    def __init__(self, name, profiler, folder):
+        self.name = name
+        self.folder = folder
+        self.profiler = profiler
+        self._profile = None
+
+    def __enter__(self):
+        if self.profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+                self._profile = Profiler()
+            except ImportError:
+                log.warning("⚠️ pyinstrument не установлен, профилируем через cProfile")
+                self.profiler = 'cprofile'
+        if self._profile is None:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._profile.start()
+        return self
+
+    def __exit__(self, *exc):
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"profile_{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+        if self.profiler == 'pyinstrument':
+            self._profile.stop()
+            path += '.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profile.output_html())
+        else:
+            import pstats
+            self._profile.disable()
+            path += '.prof'
+            self._profile.dump_stats(path)
+            pstats.Stats(self._profile).sort_stats('cumulative').print_stats(15)
+        log.info("🔍 Профиль этапа {stage}: {path}", stage=self.name, path=path)
+
+
+class StageRecorder:
+    """Записи этапов текущего процесса"""
+
+    def __init__(self, profile_stage=PROFILE_STAGE, profiler=PROFILER, folder=OUTPUT_FOLDER):
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.folder = folder
+        self.reset()
+
+    def reset(self):
+        """Новый запуск: прошлые записи удаляются"""
+        self.started_at = datetime.now()
+        self.records = deque(maxlen=MAX_RECORDS)
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def stage(self, name, rows_in=None):
+        return _Stage(self, name, rows_in)
+
+    def totals(self):
+        """Сумма по этапам с одинаковым именем (вложенные этапы завершаются раньше внешних)"""
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0})
+            total['calls'] += 1
+            for field in ('wall_seconds', 'cpu_seconds', 'rss_delta_bytes', 'rows_in', 'rows_out'):
+                if record.get(field) is not None:
+                    total[field] = total.get(field, 0) + record[field]
+        return list(totals.values())
+
+    def report(self):
+        return {
+            'started_at': self.started_at.strftime("%Y-%m-%d %H:%M:%S"),
+            'pid': os.getpid(),
+            'python': sys.version.split()[0],
+            'stages': list(self.records),
+            'totals': self.totals()
+        }
+
+    def save_json(self, path):
+        """JSON-отчет запуска (атомарная запись)"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def prometheus_text(self, labels=None):
+        """Итоги этапов в текстовом формате Prometheus"""
+        extra = ''.join(f',{key}="{value}"' for key, value in (labels or {}).items())
+        totals = self.totals()
+        lines = []
+        for field, (metric, description) in PROMETHEUS_METRICS.items():
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            for total in totals:
+                if total.get(field) is not None:
+                    lines.append(f'{metric}{{stage="{total["stage"]}"{extra}}} {total[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def save_prometheus(self, path, labels=None):
+        """Файл для textfile collector (атомарная запись, чтобы не прочитали половину)"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text(labels))
+        os.replace(tmp_path, path)
+        return path
+
+
+class _Stage:
+    """Замер одного вызова этапа; rows_out можно задать внутри блока with"""
+
+    def __init__(self, recorder, name, rows_in=None):
+        self.recorder = recorder
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self._profile = None
+
+    def __enter__(self):
+        stack = self.recorder._stack()
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self.name)
+        if self.recorder.profile_stage == self.name:
+            self._profile = _Profile(self.name, self.recorder.profiler, self.recorder.folder).__enter__()
+        self._rss = rss_bytes()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        rss = rss_bytes()
+        if self._profile is not None:
+            self._profile.__exit__(exc_type, exc, tb)
+        self.recorder._stack().pop()
+        self.recorder.records.append({
+            'stage': self.name,
+            'parent': self.parent,
+            'depth': self.depth,
+            'wall_seconds': round(wall, 6),
+            'cpu_seconds': round(cpu, 6),
+            'rss_delta_bytes': rss - self._rss,
+            'rss_after_bytes': rss,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_second': round(self.rows_in / wall) if self.rows_in and wall > 0 else None,
+            'failed': exc_type is not None
+        })
+        return False
+
+
+# Записи текущего процесса
+RECORDER = StageRecorder()
+
+
+def stage(name, rows_in=None):
+    """Замер блока кода: with stage('name', rows_in=n) as s: ... s.rows_out = m"""
+    return RECORDER.stage(name, rows_in)
+
+
+def instrumented(name, rows_in=None):
+    """Декоратор замера функции или метода
+
+    Строки на входе - сумма длин аргументов-таблиц или rows_in(*args),
+    на выходе - длина возвращенной таблицы (или кортежа таблиц).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            n_in = rows_in(*args, **kwargs) if rows_in is not None else \
+                count_rows(tuple(arg for arg in args if hasattr(arg, 'columns')))
+            with RECORDER.stage(name, n_in) as record:
+                result = func(*args, **kwargs)
+                record.rows_out = count_rows(result)
+            return result
+        return wrapper
+    return decorator
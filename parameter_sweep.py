@@ -0,0 +1,197 @@
+"""
+Перебор порогов ценообразования ("что если")
+
+Агрегаты (закупочные цены и метрики клиентов) считаются один раз или
+берутся из кеша результатов, после чего логика рекомендаций оценивается
+сразу для сетки комбинаций порогов: пороги - столбцы формы (k, 1), метрики -
+строка формы (1, n), и price_decisions считает матрицу решений (k, n)
+одним проходом numpy. Блоки комбинаций распределяются по процессам.
+
+    python parameter_sweep.py
+    python parameter_sweep.py --grid MIN_MARGIN=0.05:0.25:0.01 --grid STEP_DOWN_PCT=0.02,0.05,0.1
+
+Для каждой комбинации выводится число включенных товаров, средняя целевая
+маржа, средняя цена и прогноз прибыли: (цена - закупочная цена) x продажи
+текущей недели по включенным товарам. Эластичность спроса не учитывается,
+поэтому прогноз сравнивает комбинации между собой, а не предсказывает выручку.
+"""
+
+import argparse
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from pricing_algorithm import PRICING_PARAMS, PricingAlgorithm, item_costs, metric_arrays, price_decisions
+from structured_logging import setup_logging
+from config import OUTPUT_FOLDER, RESULT_CACHE, SWEEP_WORKERS, SWEEP_CHUNK_CELLS
+
+# Сетка по умолчанию: 7 x 4 x 4 x 3 = 336 комбинаций
+DEFAULT_GRID = {
+    'MIN_MARGIN': [0.05, 0.075, 0.10, 0.125, 0.15, 0.175, 0.20],
+    'STEP_DOWN_PCT': [0.02, 0.05, 0.08, 0.10],
+    'HIGH_CONVERSION_THRESHOLD': [0.10, 0.15, 0.20, 0.30],
+    'MIN_REQS_TO_KEEP': [5, 10, 20]
+}
+
+SUMMARY_COLUMNS = ['enabled_items', 'disabled_items', 'avg_target_margin', 'avg_recommended_price', 'projected_profit']
+
+# Данные процесса пула (заполняются в _init_worker)
+_worker = {}
+
+
+def parse_values(spec):
+    """'0.05:0.2:0.05' -> [0.05, 0.1, 0.15, 0.2]; '5,10,20' -> [5, 10, 20]"""
+    def number(text):
+        value = float(text)
+        return int(value) if value.is_integer() and '.' not in text else value
+
+    if ':' in spec:
+        start, stop, step = (float(part) for part in spec.split(':'))
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(count)]
+    return [number(part) for part in spec.split(',') if part.strip()]
+
+
+def parameter_grid(grid):
+    """Все комбинации сетки {порог: значения} как таблица"""
+    unknown = set(grid) - set(PRICING_PARAMS)
+    if unknown:
+        raise ValueError(f"Неизвестные пороги: {sorted(unknown)}. Доступны: {list(PRICING_PARAMS)}")
+    names = list(grid)
+    return pd.DataFrame(list(itertools.product(*(grid[name] for name in names))), columns=names)
+
+
+def evaluate(metrics, cost_p50, has_cost, combinations):
+    """Сводка по каждой комбинации порогов (строки combinations)"""
+    k, n = len(combinations), len(cost_p50)
+    params = {name: combinations[name].to_numpy(dtype=float)[:, None] for name in combinations.columns}
+    decisions = price_decisions(metrics, cost_p50, has_cost, params)
+
+    enabled = np.broadcast_to(decisions['enabled'], (k, n))
+    price = np.broadcast_to(decisions['price'], (k, n))
+    target_margin = np.broadcast_to(decisions['target_margin'], (k, n))
+    enabled_items = enabled.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary = pd.DataFrame({
+            'enabled_items': enabled_items,
+            'disabled_items': np.broadcast_to(decisions['disabled'], (k, n)).sum(axis=1),
+            'avg_target_margin': np.where(enabled, target_margin, 0.0).sum(axis=1) / enabled_items,
+            'avg_recommended_price': np.where(enabled, price, 0.0).sum(axis=1) / enabled_items,
+            'projected_profit': np.where(enabled, (price - cost_p50) * metrics['sales'], 0.0).sum(axis=1)
+        })
+    return pd.concat([combinations.reset_index(drop=True), summary], axis=1)
+
+
+def _init_worker(metrics, cost_p50, has_cost):
+    _worker.update(metrics=metrics, cost_p50=cost_p50, has_cost=has_cost)
+
+
+def _evaluate_chunk(combinations):
+    return evaluate(_worker['metrics'], _worker['cost_p50'], _worker['has_cost'], combinations)
+
+
+def run_sweep(consumer_metrics, supplier_costs, grid=DEFAULT_GRID, workers=SWEEP_WORKERS,
+              chunk_cells=SWEEP_CHUNK_CELLS):
+    """Сводка по всем комбинациям сетки, от большей прогнозной прибыли к меньшей
+
+    Матрица решений одного блока не больше chunk_cells ячеек. Метрики
+    передаются каждому процессу один раз (при инициализации пула).
+    """
+    combinations = parameter_grid(grid)
+    metrics = metric_arrays(consumer_metrics)
+    cost_p50, has_cost = item_costs(consumer_metrics, supplier_costs)
+
+    chunk_size = max(1, chunk_cells // max(len(cost_p50), 1))
+    chunks = [combinations.iloc[i:i + chunk_size] for i in range(0, len(combinations), chunk_size)]
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+
+    if workers <= 1:
+        parts = [evaluate(metrics, cost_p50, has_cost, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(metrics, cost_p50, has_cost)) as executor:
+            parts = list(executor.map(_evaluate_chunk, chunks))
+
+    results = pd.concat(parts, ignore_index=True)
+    current = np.ones(len(results), dtype=bool)
+    for name in combinations.columns:
+        current &= np.isclose(results[name].to_numpy(dtype=float), PRICING_PARAMS[name])
+    results['is_current'] = current
+    return results.sort_values('projected_profit', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def load_aggregates():
+    """Закупочные цены и метрики клиентов: из кеша результатов или расчетом"""
+    from data_loader import DataLoader
+    from result_cache import ResultCache
+    from weekly_pricing import compute_recommendations, input_files
+
+    files = input_files()
+    if not files:
+        raise FileNotFoundError("Не найдено входных файлов")
+    cache = ResultCache() if RESULT_CACHE else None
+    key = cache.key(files) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None and 'consumer_metrics' in cached:
+        print(f"♻️ Агрегаты из кеша результатов ({key[:12]})")
+        return cached['supplier_costs'], cached['consumer_metrics']
+
+    # Метрики нужны целиком, поэтому расчет в одном процессе
+    algorithm = PricingAlgorithm(workers=1)
+    recommendations = compute_recommendations(DataLoader(), algorithm)
+    if recommendations is None:
+        raise ValueError("Нет данных за последнюю неделю")
+    if cache is not None:
+        cache.put(key, {
+            'supplier_costs': algorithm.supplier_costs,
+            'consumer_metrics': algorithm.consumer_metrics,
+            'recommendations': recommendations
+        }, input_files=len(files))
+    return algorithm.supplier_costs, algorithm.consumer_metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перебор порогов ценообразования")
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=VALUES',
+                        help="порог и значения: MIN_MARGIN=0.05:0.2:0.01 или STEP_DOWN_PCT=0.02,0.05 (можно несколько)")
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS, help="процессов (по умолчанию по числу ядер)")
+    parser.add_argument('--top', type=int, default=10, help="сколько лучших комбинаций вывести")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    grid = dict(DEFAULT_GRID)
+    if args.grid:
+        grid = {}
+        for item in args.grid:
+            name, _, spec = item.partition('=')
+            grid[name.strip().upper()] = parse_values(spec)
+
+    supplier_costs, consumer_metrics = load_aggregates()
+    started = datetime.now()
+    results = run_sweep(consumer_metrics, supplier_costs, grid, args.workers)
+    seconds = (datetime.now() - started).total_seconds()
+    print(f"\n🔬 Оценено {len(results)} комбинаций x {len(consumer_metrics)} пар клиент-товар за {seconds:.2f} c")
+
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    output_file = os.path.join(OUTPUT_FOLDER, f"parameter_sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    results.to_csv(output_file, index=False)
+    print(f"💾 Результаты сохранены в: {output_file}")
+
+    columns = list(grid) + SUMMARY_COLUMNS
+    print(f"\n🏆 ТОП-{args.top} ПО ПРОГНОЗУ ПРИБЫЛИ:")
+    print(results.head(args.top)[columns].round(4).to_string(index=False))
+    current = results[results['is_current']]
+    if not current.empty:
+        rank = current.index[0] + 1
+        print(f"\n📌 Текущие настройки config.py - место {rank} из {len(results)}:")
+        print(current[columns].round(4).to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
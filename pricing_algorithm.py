@@ -4,26 +4,184 @@
 
 import pandas as pd
 import numpy as np
+from instrumentation import instrumented
+from structured_logging import get_logger
 from config import (
     MIN_MARGIN, MAX_MARGIN, DEFAULT_MARGIN,
     STEP_DOWN_PCT, STEP_UP_PCT,
     MIN_REQS_TO_KEEP, NO_SALE_WEEKS_TO_DISABLE,
     HIGH_CONVERSION_THRESHOLD, LOW_CONVERSION_THRESHOLD,
-    HIGH_DEMAND_THRESHOLD, LOW_DEMAND_THRESHOLD
+    HIGH_DEMAND_THRESHOLD, LOW_DEMAND_THRESHOLD,
+    AGGREGATION_BACKEND, COST_PERCENTILE_MODE, LOOKBACK_WEEKS, PRICING_WORKERS
 )
 
+# Колонки исторических метрик клиентов
+HIST_METRIC_COLUMNS = ['reqs_hist', 'total_sell_value_hist', 'sell_p50_hist', 'sell_pavg_hist', 'sales_hist', 'profit_hist']
+
+# Пороги логики рекомендаций (можно перебирать в parameter_sweep.py)
+PRICING_PARAMS = {
+    'MIN_MARGIN': MIN_MARGIN,
+    'MAX_MARGIN': MAX_MARGIN,
+    'DEFAULT_MARGIN': DEFAULT_MARGIN,
+    'STEP_DOWN_PCT': STEP_DOWN_PCT,
+    'STEP_UP_PCT': STEP_UP_PCT,
+    'MIN_REQS_TO_KEEP': MIN_REQS_TO_KEEP,
+    'HIGH_CONVERSION_THRESHOLD': HIGH_CONVERSION_THRESHOLD,
+    'LOW_CONVERSION_THRESHOLD': LOW_CONVERSION_THRESHOLD
+}
+
+# Колонки итоговой таблицы рекомендаций
+RECOMMENDATION_COLUMNS = [
+    'consumer_id', 'item_id', 'enabled', 'price_rec', 'baseline_cost',
+    'target_margin', 'reason', 'reqs', 'sales', 'reqs_hist', 'sales_hist',
+    'conversion_rate', 'conversion_rate_hist', 'profit'
+]
+
+
+log = get_logger('pricing_algorithm')
+
+
+def _as_float(series):
+    """Колонка как float-массив (пропуски -> NaN)"""
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+
+def _round(values, ndigits=4):
+    """np.round с тем же результатом, что и встроенный round()
+
+    np.round масштабирует значение и может разойтись с round() на границе .5,
+    поэтому такие редкие значения досчитываются через round().
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    with np.errstate(invalid='ignore'):
+        near_half = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    rounded[near_half] = [round(float(v), ndigits) for v in values[near_half]]
+    return rounded
+
+
+def price_decisions(metrics, cost_p50, has_cost, params=None):
+    """Логика recommend_price_for_item по колонкам
+
+    metrics - массивы reqs, sales, sell_p50, last_price, reqs_hist,
+    sales_hist, conversion_rate; params - пороги из PRICING_PARAMS (по
+    умолчанию значения config.py). Порог может быть массивом формы (k, 1):
+    тогда результаты имеют форму (k, n), по строке на комбинацию порогов.
+    """
+    p = PRICING_PARAMS if params is None else {**PRICING_PARAMS, **params}
+    reqs, sales = metrics['reqs'], metrics['sales']
+    sell_p50, last_price = metrics['sell_p50'], metrics['last_price']
+    conversion_rate = metrics['conversion_rate']
+
+    valid_cost = has_cost & (cost_p50 > 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cost_denom = np.maximum(cost_p50, 1e-6)
+
+        # Определяем базовую маржу
+        use_hist = (sales > 0) & ~np.isnan(sell_p50)
+        use_step_down = (reqs > 0) & (sales == 0) & ~np.isnan(last_price)
+
+        hist_margin = np.clip((sell_p50 - cost_p50) / cost_denom, p['MIN_MARGIN'], p['MAX_MARGIN'])
+        step_down_price = last_price * (1 - p['STEP_DOWN_PCT'])
+        target_margin = np.select(
+            [use_hist, use_step_down],
+            [hist_margin, (step_down_price - cost_p50) / cost_denom],
+            p['DEFAULT_MARGIN']
+        )
+        baseline = np.select(
+            [use_hist, use_step_down],
+            [cost_p50 * (1 + hist_margin), step_down_price],
+            cost_p50 * (1 + p['DEFAULT_MARGIN'])
+        )
+
+        # Условия для отключения товара (NaN в истории не считается нулем)
+        no_sale_2w = (sales == 0) & (metrics['sales_hist'] == 0)
+        low_demand = (reqs + metrics['reqs_hist']) < p['MIN_REQS_TO_KEEP']
+        disabled = valid_cost & no_sale_2w & low_demand
+        enabled = valid_cost & ~disabled
+
+        # Корректировка цены на основе конверсии
+        price = baseline * np.select(
+            [conversion_rate > p['HIGH_CONVERSION_THRESHOLD'],
+             (conversion_rate < p['LOW_CONVERSION_THRESHOLD']) & (reqs > 20)],
+            [1 + p['STEP_UP_PCT'], 1 - p['STEP_DOWN_PCT']],
+            1.0
+        )
+
+    return {
+        'valid_cost': valid_cost,
+        'disabled': disabled,
+        'enabled': enabled,
+        'target_margin': target_margin,
+        'price': price
+    }
+
+
+def item_costs(consumer_metrics, supplier_costs):
+    """cost_p50 товара для каждой строки метрик и маска наличия закупочной цены"""
+    # Одно объединение закупочных цен с метриками клиентов
+    if supplier_costs.empty:
+        costs = pd.DataFrame({'item_id': pd.Series(dtype=object), 'cost_p50': pd.Series(dtype=float)})
+    else:
+        costs = supplier_costs[['item_id', 'cost_p50']].drop_duplicates('item_id')
+    merged = consumer_metrics[['item_id']].merge(
+        costs, on='item_id', how='left', validate='many_to_one', indicator=True
+    )
+    return merged['cost_p50'].to_numpy(dtype=float, na_value=np.nan), (merged['_merge'] == 'both').to_numpy()
+
+
+def metric_arrays(consumer_metrics):
+    """Колонки метрик клиентов, нужные price_decisions, как float-массивы"""
+    return {
+        col: _as_float(consumer_metrics[col])
+        for col in ['reqs', 'sales', 'sell_p50', 'last_price', 'reqs_hist', 'sales_hist', 'conversion_rate']
+    }
+
+
+def _column_or_zero(df, column):
+    """Колонка как массив или нули, если ее нет"""
+    if column in df.columns:
+        return df[column].to_numpy()
+    return np.zeros(len(df))
+
+
 class PricingAlgorithm:
-    def __init__(self):
+    def __init__(self, backend=AGGREGATION_BACKEND, percentile_mode=COST_PERCENTILE_MODE, workers=PRICING_WORKERS):
+        if backend not in ('pandas', 'duckdb'):
+            raise ValueError(f"Неизвестный backend агрегации: {backend}")
+        if percentile_mode not in ('exact', 'sketch'):
+            raise ValueError(f"Неизвестный режим перцентилей: {percentile_mode}")
+        self.backend = backend
+        self.percentile_mode = percentile_mode
+        self.workers = workers
         self.recommendations = []
+        # Промежуточные таблицы последнего расчета (метрик нет при расчете по шардам)
+        self.supplier_costs = None
+        self.consumer_metrics = None
+        self._aggregator = None
+    
+    def _duckdb(self):
+        """Агрегатор DuckDB (создается при первом обращении)"""
+        if self._aggregator is None:
+            from duckdb_aggregation import DuckDBAggregator
+            self._aggregator = DuckDBAggregator()
+        return self._aggregator
     
+    @instrumented('calculate_supplier_costs')
     def calculate_supplier_costs(self, historical_data):
         """Расчет закупочных цен поставщиков"""
+        if self.percentile_mode == 'sketch':
+            from quantile_sketch import sketch_supplier_costs
+            return sketch_supplier_costs(historical_data)
+        if self.backend == 'duckdb':
+            return self._duckdb().calculate_supplier_costs(historical_data)
         if historical_data.empty:
             return pd.DataFrame()
             
-        supplier_costs = historical_data.groupby('item_id').agg({
+        supplier_costs = historical_data.groupby('item_id', observed=True).agg({
             'producerAmount': [
-                lambda x: np.nanmedian(x),  # медиана
+                'median',  # медиана (пропуски не учитываются, как в np.nanmedian)
                 lambda x: np.nanpercentile(x, 10),  # 10-й перцентиль
                 lambda x: np.nanpercentile(x, 90),  # 90-й перцентиль
                 'count'  # количество котировок
@@ -35,14 +193,18 @@ class PricingAlgorithm:
         
         return supplier_costs
     
+    @instrumented('calculate_consumer_metrics')
     def calculate_consumer_metrics(self, weekly_data, historical_data):
         """Расчет метрик по клиентам"""
+        if self.backend == 'duckdb':
+            return self._duckdb().calculate_consumer_metrics(weekly_data, historical_data)
         if weekly_data.empty:
             return pd.DataFrame()
             
         # Агрегация за текущую неделю
-        weekly_agg = weekly_data.groupby(['consumer_id', 'item_id']).agg({
-            'consumerAmount': ['size', 'sum', lambda x: np.nanmedian(x), 'mean', 'last'],
+        weekly_agg = weekly_data.groupby(['consumer_id', 'item_id'], observed=True).agg({
+            # 'median' пропускает NaN так же, как np.nanmedian, но без вызова Python на группу
+            'consumerAmount': ['size', 'sum', 'median', 'mean', 'last'],
             'all_orders': 'sum',
             'Profit': 'sum'
         }).round(4)
@@ -52,8 +214,8 @@ class PricingAlgorithm:
         
         # Агрегация за исторический период
         if not historical_data.empty:
-            hist_agg = historical_data.groupby(['consumer_id', 'item_id']).agg({
-                'consumerAmount': ['size', 'sum', lambda x: np.nanmedian(x), 'mean'],
+            hist_agg = historical_data.groupby(['consumer_id', 'item_id'], observed=True).agg({
+                'consumerAmount': ['size', 'sum', 'median', 'mean'],
                 'all_orders': 'sum',
                 'Profit': 'sum'
             }).round(4)
@@ -66,7 +228,7 @@ class PricingAlgorithm:
         else:
             consumer_metrics = weekly_agg
             # Добавляем пустые колонки для исторических данных
-            for col in ['reqs_hist', 'total_sell_value_hist', 'sell_p50_hist', 'sell_pavg_hist', 'sales_hist', 'profit_hist']:
+            for col in HIST_METRIC_COLUMNS:
                 consumer_metrics[col] = 0
         
         return consumer_metrics
@@ -157,20 +319,54 @@ class PricingAlgorithm:
             'target_margin': round(float(target_margin), 4)
         }
     
-    def generate_recommendations(self, weekly_data, historical_data):
-        """Генерация рекомендаций по ценообразованию"""
-        print("Генерируем рекомендации...")
-        
-        # Расчет закупочных цен
-        supplier_costs = self.calculate_supplier_costs(historical_data)
-        print(f"Обработано {len(supplier_costs)} товаров с данными поставщиков")
-        
-        # Расчет метрик клиентов
-        consumer_metrics = self.calculate_consumer_metrics(weekly_data, historical_data)
-        consumer_metrics = self.calculate_conversion_rates(consumer_metrics)
-        print(f"Обработано {len(consumer_metrics)} комбинаций клиент-товар")
-        
-        # Генерация рекомендаций
+    @instrumented('recommend_prices')
+    def recommend_prices(self, consumer_metrics, supplier_costs):
+        """Векторизованный расчет рекомендаций для всех комбинаций клиент-товар
+
+        Повторяет логику recommend_price_for_item, но вместо обхода строк
+        делает одно объединение с закупочными ценами и считает все ветки
+        масками np.select/np.where по колонкам.
+        """
+        if consumer_metrics.empty:
+            return pd.DataFrame(columns=RECOMMENDATION_COLUMNS)
+
+        cost_p50, has_cost = item_costs(consumer_metrics, supplier_costs)
+        decisions = price_decisions(metric_arrays(consumer_metrics), cost_p50, has_cost)
+        valid_cost, disabled, enabled = decisions['valid_cost'], decisions['disabled'], decisions['enabled']
+        target_margin, price = decisions['target_margin'], decisions['price']
+
+        reason = np.select(
+            [~has_cost, ~valid_cost, disabled],
+            ['no_supplier_cost', 'invalid_cost', 'no_sales_two_weeks'],
+            'ok'
+        )
+
+        return pd.DataFrame({
+            'consumer_id': consumer_metrics['consumer_id'].to_numpy(),
+            'item_id': consumer_metrics['item_id'].to_numpy(),
+            'enabled': enabled,
+            'price_rec': np.where(enabled, _round(price), np.nan),
+            'baseline_cost': np.where(enabled, _round(cost_p50), cost_p50),
+            'target_margin': np.where(
+                enabled, _round(target_margin),
+                np.where(disabled, target_margin, np.nan)
+            ),
+            'reason': reason,
+            'reqs': consumer_metrics['reqs'].to_numpy(),
+            'sales': consumer_metrics['sales'].to_numpy(),
+            'reqs_hist': _column_or_zero(consumer_metrics, 'reqs_hist'),
+            'sales_hist': _column_or_zero(consumer_metrics, 'sales_hist'),
+            'conversion_rate': consumer_metrics['conversion_rate'].to_numpy(),
+            'conversion_rate_hist': _column_or_zero(consumer_metrics, 'conversion_rate_hist'),
+            'profit': consumer_metrics['profit'].to_numpy()
+        })
+
+    @instrumented('recommend_prices_rowwise')
+    def recommend_prices_rowwise(self, consumer_metrics, supplier_costs):
+        """Построчный расчет рекомендаций через recommend_price_for_item
+
+        Эталонная реализация для сверки с recommend_prices.
+        """
         recommendations = []
         for _, row in consumer_metrics.iterrows():
             rec = self.recommend_price_for_item(row, supplier_costs)
@@ -193,7 +389,70 @@ class PricingAlgorithm:
             }
             recommendations.append(recommendation)
         
-        self.recommendations = pd.DataFrame(recommendations)
+        return pd.DataFrame(recommendations, columns=RECOMMENDATION_COLUMNS)
+    
+    @instrumented('generate_recommendations')
+    def generate_recommendations(self, weekly_data, historical_data, vectorized=True):
+        """Генерация рекомендаций по ценообразованию
+
+        vectorized=False включает построчный эталонный расчет. При workers > 1
+        метрики и рекомендации считаются по шардам клиентов в пуле процессов
+        (sharded_pricing.py); DuckDB и так использует все ядра, поэтому с ним
+        расчет остается последовательным.
+        """
+        log.info("Генерируем рекомендации...", weekly_rows=len(weekly_data), historical_rows=len(historical_data))
+        
+        # Расчет закупочных цен
+        supplier_costs = self.calculate_supplier_costs(historical_data)
+        log.info("Обработано {items} товаров с данными поставщиков", items=len(supplier_costs))
+        
+        # Без закупочных цен все строки - no_supplier_cost, шардировать нечего
+        if vectorized and self.backend == 'pandas' and self.workers != 1 and not weekly_data.empty \
+                and not supplier_costs.empty:
+            from sharded_pricing import recommend_sharded
+            self.supplier_costs, self.consumer_metrics = supplier_costs, None
+            self.recommendations = recommend_sharded(self, weekly_data, historical_data, supplier_costs, self.workers)
+            return self.recommendations
+        
+        # Расчет метрик клиентов
+        consumer_metrics = self.calculate_consumer_metrics(weekly_data, historical_data)
+        
+        return self.recommend_from_aggregates(supplier_costs, consumer_metrics, vectorized=vectorized)
+    
+    @instrumented('generate_recommendations_incremental')
+    def generate_recommendations_incremental(self, weekly_data, data, store, weeks_back=LOOKBACK_WEEKS, covered_from=None):
+        """Генерация рекомендаций с историей из хранилища недельных агрегатов
+
+        Метрики текущей недели считаются точно по weekly_data, история и
+        закупочные цены - сверткой недель из WeeklyAggregateStore (медиана и
+        перцентили по скетчам). Недостающие недели досчитываются по data.
+        """
+        log.info("Генерируем рекомендации (инкрементально)...", weekly_rows=len(weekly_data), weeks_back=weeks_back)
+        
+        supplier_costs, hist_agg = store.build_aggregates(data, weeks_back, covered_from=covered_from)
+        log.info("Обработано {items} товаров с данными поставщиков", items=len(supplier_costs))
+        
+        # Метрики текущей недели без истории, затем история из хранилища
+        consumer_metrics = self.calculate_consumer_metrics(weekly_data, pd.DataFrame())
+        if not consumer_metrics.empty:
+            consumer_metrics = consumer_metrics.drop(columns=HIST_METRIC_COLUMNS).merge(
+                hist_agg, on=['consumer_id', 'item_id'], how='left'
+            )
+        
+        return self.recommend_from_aggregates(supplier_costs, consumer_metrics)
+    
+    @instrumented('recommend_from_aggregates')
+    def recommend_from_aggregates(self, supplier_costs, consumer_metrics, vectorized=True):
+        """Рекомендации по уже посчитанным закупочным ценам и метрикам клиентов"""
+        consumer_metrics = self.calculate_conversion_rates(consumer_metrics)
+        self.supplier_costs, self.consumer_metrics = supplier_costs, consumer_metrics
+        log.info("Обработано {pairs} комбинаций клиент-товар", pairs=len(consumer_metrics))
+        
+        # Генерация рекомендаций
+        if vectorized:
+            self.recommendations = self.recommend_prices(consumer_metrics, supplier_costs)
+        else:
+            self.recommendations = self.recommend_prices_rowwise(consumer_metrics, supplier_costs)
         return self.recommendations
     
     def get_summary_stats(self):
@@ -0,0 +1,157 @@
+"""
+Единая точка входа: анализ, отчет, графики и поиск цены
+
+    python pricing_cli.py analyze
+    python pricing_cli.py report [--file output/weekly_pricing_recos_20240101_120000.csv]
+    python pricing_cli.py plot [--file ...] [--per-consumer] [--format png,svg]
+    python pricing_cli.py reports [--file ...] [--workers 8]
+    python pricing_cli.py lookup --consumer 17 --item "US | WHATSAPP"
+    python pricing_cli.py lookup --consumer "Client A" --country us --service whatsapp --json
+
+Тяжелые библиотеки импортируются только в подкомандах, которым они нужны
+(pandas - analyze, report и reports, matplotlib - plot). lookup читает
+последний файл рекомендаций модулем csv и не загружает pandas, поэтому
+подходит для частых вызовов из cron и скриптов. Время запуска подкоманд
+проверяет import_benchmark.py.
+"""
+
+import argparse
+import csv
+import json
+import sys
+
+from recommendation_files import latest_recommendations
+from config import (OUTPUT_FOLDER, CHART_FORMATS, CHART_WORKERS,
+                    CONSUMER_REPORT_FORMATS, CONSUMER_REPORT_WORKERS)
+
+# Модули, которые импортирует подкоманда (замеряются в import_benchmark.py)
+COMMAND_MODULES = {
+    'analyze': ['weekly_pricing'],
+    'report': ['visualize_results'],
+    'plot': ['visualize_results', 'matplotlib.pyplot'],
+    'reports': ['consumer_reports'],
+    'lookup': []
+}
+
+# Разделитель страны и сервиса в item_id (как id_dictionary.ITEM_SEPARATOR)
+ITEM_SEPARATOR = " | "
+
+# Поля рекомендации в ответе lookup
+LOOKUP_FIELDS = ['consumer_id', 'consumer_name', 'item_id', 'enabled', 'price_rec', 'baseline_cost', 'target_margin', 'reason']
+
+
+def item_key(item=None, country=None, service=None):
+    """item_id из готового ключа или пары страна/сервис (как в pricing_service)"""
+    if item is None:
+        if country is None or service is None:
+            return None
+        item = f"{country.upper().strip()}{ITEM_SEPARATOR}{service.upper().strip()}"
+    return item.strip()
+
+
+def lookup(path, consumer, item=None):
+    """Рекомендации клиента (consumer_id или имя) из CSV, по одному товару или все"""
+    found = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            if consumer not in (row.get('consumer_id'), row.get('consumer_name')):
+                continue
+            if item is not None and row.get('item_id') != item:
+                continue
+            found.append({field: row.get(field) for field in LOOKUP_FIELDS})
+    return found
+
+
+def run_analyze(args):
+    from weekly_pricing import main as analyze
+    return analyze()
+
+
+def run_report(args):
+    from visualize_results import create_summary_report
+    create_summary_report(args.file)
+    return 0
+
+
+def run_plot(args):
+    from visualize_results import render_charts, visualize_pricing_results
+    render_charts(args.file, formats=args.format.split(','), per_consumer=args.per_consumer, workers=args.workers)
+    if args.combined or args.show:
+        visualize_pricing_results(args.file, show=args.show)
+    return 0
+
+
+def run_reports(args):
+    from consumer_reports import main as reports
+    argv = ['--format', args.format] + (['--file', args.file] if args.file else []) + \
+        (['--previous', args.previous] if args.previous else []) + \
+        (['--workers', str(args.workers)] if args.workers else [])
+    return reports(argv)
+
+
+def run_lookup(args):
+    path = args.file or latest_recommendations()
+    if path is None:
+        print(f"❌ Не найдено файлов рекомендаций в {OUTPUT_FOLDER}/", file=sys.stderr)
+        return 1
+    item = item_key(args.item, args.country, args.service)
+    found = lookup(path, args.consumer, item)
+    if not found:
+        print(f"❌ Нет рекомендаций для клиента {args.consumer}" + (f" и товара {item}" if item else ""), file=sys.stderr)
+        return 1
+
+    if args.json:
+        for record in found:
+            print(json.dumps(record, ensure_ascii=False))
+    else:
+        for record in found:
+            price = f"${record['price_rec']}" if record['price_rec'] else "-"
+            print(f"{record['consumer_name']} | {record['item_id']} | {price} | {record['reason']}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Анализ цен арбитража: анализ, отчет, графики, поиск цены")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    analyze = commands.add_parser('analyze', help="еженедельный анализ (как weekly_pricing.py)")
+    analyze.set_defaults(func=run_analyze)
+
+    report = commands.add_parser('report', help="текстовый отчет по файлу рекомендаций")
+    report.add_argument('--file', help="файл рекомендаций (по умолчанию последний в output/)")
+    report.set_defaults(func=run_report)
+
+    plot = commands.add_parser('plot', help="графики по файлу рекомендаций (без экрана, файл на график)")
+    plot.add_argument('--file', help="файл рекомендаций (по умолчанию последний в output/)")
+    plot.add_argument('--format', default=','.join(CHART_FORMATS), help="форматы файлов графиков: png,svg")
+    plot.add_argument('--per-consumer', action='store_true', help="графики каждого клиента")
+    plot.add_argument('--workers', type=int, default=CHART_WORKERS, help="процессов (по умолчанию по числу ядер)")
+    plot.add_argument('--combined', action='store_true', help="еще и все графики на одной фигуре")
+    plot.add_argument('--show', action='store_true', help="показать общую фигуру в окне (включает --combined)")
+    plot.set_defaults(func=run_plot)
+
+    reports = commands.add_parser('reports', help="CSV и HTML отчет на каждого клиента")
+    reports.add_argument('--file', help="файл рекомендаций (по умолчанию последний в output/)")
+    reports.add_argument('--previous', help="рекомендации прошлой недели (по умолчанию ищутся в output/)")
+    reports.add_argument('--format', default=','.join(CONSUMER_REPORT_FORMATS), help="форматы: csv,html")
+    reports.add_argument('--workers', type=int, default=CONSUMER_REPORT_WORKERS, help="процессов (по умолчанию по числу ядер)")
+    reports.set_defaults(func=run_reports)
+
+    lookup_parser = commands.add_parser('lookup', help="рекомендованная цена клиента без загрузки pandas")
+    lookup_parser.add_argument('--consumer', required=True, help="consumer_id или имя клиента")
+    lookup_parser.add_argument('--item', help='товар: "СТРАНА | СЕРВИС"')
+    lookup_parser.add_argument('--country')
+    lookup_parser.add_argument('--service')
+    lookup_parser.add_argument('--file', help="файл рекомендаций (по умолчанию последний в output/)")
+    lookup_parser.add_argument('--json', action='store_true', help="JSON-строка на рекомендацию")
+    lookup_parser.set_defaults(func=run_lookup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
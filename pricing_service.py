@@ -0,0 +1,246 @@
+"""
+HTTP-сервис рекомендованных цен
+
+Держит последние рекомендации в памяти, проиндексированными по
+(клиент, товар), и отвечает на одиночные и пакетные запросы цены.
+Новый набор (файл weekly_pricing_recos_*.csv в OUTPUT_FOLDER) подхватывается
+фоновым опросом папки или запросом POST /reload: индекс строится в
+стороне и подменяется одной операцией присваивания, поэтому запросы в
+момент подмены видят либо старый, либо новый набор целиком.
+
+    python pricing_service.py
+    curl "http://localhost:8000/price?consumer=Consumer_01&item=USA%20|%20SMS"
+
+Там же работают задания анализа загруженных файлов (см. analysis_jobs.py).
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional
+import pandas as pd
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from analysis_jobs import JobManager, add_job_routes
+from id_dictionary import ITEM_SEPARATOR
+from recommendation_files import latest_recommendations
+from structured_logging import get_logger, setup_logging
+from config import OUTPUT_FOLDER, SERVICE_HOST, SERVICE_PORT, SERVICE_RELOAD_INTERVAL
+
+# Поля рекомендации, которые отдает сервис
+RECORD_FIELDS = ['consumer_id', 'enabled', 'price_rec', 'baseline_cost', 'target_margin', 'reason']
+
+log = get_logger('pricing_service')
+
+
+def item_key(item=None, country=None, service=None):
+    """item_id из готового ключа или пары страна/сервис (как в DataLoader)"""
+    if item is None:
+        if country is None or service is None:
+            return None
+        item = f"{country.upper().strip()}{ITEM_SEPARATOR}{service.upper().strip()}"
+    return item.strip()
+
+
+def _native(value):
+    """Значение для JSON: numpy-типы в Python, NaN в None"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class RecommendationIndex:
+    """Неизменяемый набор рекомендаций с индексом по (клиент, товар)"""
+
+    def __init__(self, recommendations, source=None):
+        self.source = source
+        self.source_mtime = os.path.getmtime(source) if source else None
+        self.loaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.version = os.path.basename(source) if source else self.loaded_at
+
+        consumers = recommendations['consumer_name'] if 'consumer_name' in recommendations.columns \
+            else recommendations['consumer_id']
+        fields = [col for col in RECORD_FIELDS if col in recommendations.columns]
+        columns = [recommendations[col].tolist() for col in fields]
+        self.records = {}
+        for consumer, item, *values in zip(consumers.astype(str).tolist(),
+                                           recommendations['item_id'].astype(str).tolist(), *columns):
+            record = {'consumer': consumer, 'item_id': item}
+            record.update((field, _native(value)) for field, value in zip(fields, values))
+            self.records[(consumer, item)] = record
+
+        # consumer_id -> имя, чтобы искать и по коду клиента
+        self.consumer_names = {}
+        if 'consumer_id' in recommendations.columns and 'consumer_name' in recommendations.columns:
+            self.consumer_names = dict(zip(
+                recommendations['consumer_id'].astype(str).tolist(),
+                recommendations['consumer_name'].astype(str).tolist()
+            ))
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def from_csv(cls, path):
+        return cls(pd.read_csv(path), source=path)
+
+    def lookup(self, consumer, item):
+        """Рекомендация для клиента (имя или consumer_id) и товара или None"""
+        record = self.records.get((consumer, item))
+        if record is None and consumer in self.consumer_names:
+            record = self.records.get((self.consumer_names[consumer], item))
+        return record
+
+    def info(self):
+        return {'version': self.version, 'source': self.source, 'loaded_at': self.loaded_at, 'items': len(self)}
+
+
+class RecommendationStore:
+    """Текущий набор рекомендаций с атомарной подменой
+
+    Читатели берут ссылку на текущий индекс без блокировок; загрузка нового
+    набора выполняется под блокировкой и заканчивается присваиванием ссылки.
+    """
+
+    def __init__(self, folder=OUTPUT_FOLDER):
+        self.folder = folder
+        self.index = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def latest_file(self):
+        """Последний по времени запуска файл рекомендаций или None"""
+        return latest_recommendations(self.folder)
+
+    def publish(self, index):
+        """Подмена текущего набора"""
+        self.index = index
+        log.info("🔄 Загружен набор рекомендаций {version}: {rows} записей", version=index.version, rows=len(index),
+                 path=index.source)
+        return index
+
+    def reload(self, path=None, force=False):
+        """Загрузка указанного или самого свежего файла, если он новее текущего"""
+        with self._lock:
+            path = path or self.latest_file()
+            if path is None:
+                return self.index
+            current = self.index
+            if not force and current is not None and current.source == path \
+                    and current.source_mtime == os.path.getmtime(path):
+                return current
+            return self.publish(RecommendationIndex.from_csv(path))
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                # Битый файл не должен останавливать сервис: остается прежний набор
+                log.error("❌ Не удалось загрузить рекомендации: {error}", error=str(e))
+
+    def start_watching(self, interval=SERVICE_RELOAD_INTERVAL):
+        """Фоновый опрос папки с рекомендациями"""
+        if interval and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+
+class PriceQuery(BaseModel):
+    consumer: str
+    item: Optional[str] = None
+    country: Optional[str] = None
+    service: Optional[str] = None
+
+
+class BatchQuery(BaseModel):
+    queries: List[PriceQuery]
+
+
+def create_app(store=None, reload_interval=SERVICE_RELOAD_INTERVAL, jobs=None):
+    """Приложение FastAPI поверх хранилища рекомендаций и заданий анализа"""
+    store = RecommendationStore() if store is None else store
+    jobs = JobManager() if jobs is None else jobs
+
+    @asynccontextmanager
+    async def lifespan(app):
+        if store.index is None:
+            try:
+                store.reload()
+            except Exception as e:
+                log.error("❌ Не удалось загрузить рекомендации: {error}", error=str(e))
+        store.start_watching(reload_interval)
+        yield
+        store.stop_watching()
+        jobs.shutdown()
+
+    app = FastAPI(title="Pricing recommendations", lifespan=lifespan)
+    app.state.store = store
+    app.state.jobs = jobs
+    add_job_routes(app, jobs)
+
+    def current_index():
+        index = store.index
+        if index is None:
+            raise HTTPException(status_code=503, detail="Рекомендации еще не загружены")
+        return index
+
+    # Поиск - операции со словарем, поэтому обработчики async: без перехода в пул потоков
+    @app.get("/health")
+    async def health():
+        index = store.index
+        return {'status': 'ok' if index is not None else 'empty', **(index.info() if index else {})}
+
+    @app.get("/price")
+    async def price(consumer: str, item: Optional[str] = None, country: Optional[str] = None,
+              service: Optional[str] = None):
+        index = current_index()
+        key = item_key(item, country, service)
+        if key is None:
+            raise HTTPException(status_code=422, detail="Укажите item или country и service")
+        record = index.lookup(consumer, key)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Нет рекомендации для {consumer} / {key}")
+        return {'version': index.version, **record}
+
+    @app.post("/prices")
+    async def prices(batch: BatchQuery):
+        # Весь пакет отвечается по одному набору, даже если в это время идет подмена
+        index = current_index()
+        results = []
+        for query in batch.queries:
+            key = item_key(query.item, query.country, query.service)
+            record = index.lookup(query.consumer, key) if key is not None else None
+            results.append({**record, 'found': True} if record is not None
+                           else {'consumer': query.consumer, 'item_id': key, 'found': False})
+        return {'version': index.version, 'results': results}
+
+    @app.post("/reload")
+    def reload():
+        started = time.perf_counter()
+        index = store.reload(force=True)
+        if index is None:
+            raise HTTPException(status_code=404, detail=f"В папке {store.folder} нет файлов рекомендаций")
+        return {**index.info(), 'seconds': round(time.perf_counter() - started, 3)}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    setup_logging()
+    uvicorn.run(create_app(), host=SERVICE_HOST, port=SERVICE_PORT)
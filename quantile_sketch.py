@@ -0,0 +1,280 @@
+"""
+Объединяемые скетчи квантилей на логарифмических корзинах
+
+Значение x > 0 попадает в корзину key = ceil(log(x) / log(gamma)),
+gamma = (1 + alpha) / (1 - alpha); представитель корзины отличается от
+любого ее значения не более чем на alpha (относительная ошибка).
+Отрицательные значения хранятся зеркально, ноль - отдельной корзиной.
+
+Скетч группы - это таблица счетчиков (sign, key, count), поэтому скетчи
+разных недель, файлов и процессов объединяются простым суммированием.
+"""
+
+import struct
+import numpy as np
+import pandas as pd
+from config import SKETCH_RELATIVE_ACCURACY, SKETCH_MAX_BINS
+
+BUCKET_COLUMNS = ['sign', 'key']
+
+
+def _gamma(alpha):
+    return (1 + alpha) / (1 - alpha)
+
+
+def bucket_keys(values, alpha=SKETCH_RELATIVE_ACCURACY):
+    """Корзины для массива значений: (sign, key); NaN получает sign = NaN"""
+    values = np.asarray(values, dtype=float)
+    sign = np.sign(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        key = np.ceil(np.log(np.abs(values)) / np.log(_gamma(alpha)))
+    key = np.where(sign == 0, 0, key)
+    return sign, key
+
+
+def bucket_values(sign, key, alpha=SKETCH_RELATIVE_ACCURACY):
+    """Представители корзин (обратное к bucket_keys с ошибкой не более alpha)"""
+    gamma = _gamma(alpha)
+    return np.asarray(sign, dtype=float) * 2 * np.power(gamma, np.asarray(key, dtype=float)) / (gamma + 1)
+
+
+def bucket_counts(data, group_cols, value_col, alpha=SKETCH_RELATIVE_ACCURACY):
+    """Скетчи value_col по группам: group_cols + sign, key, count (NaN пропускаются)"""
+    sign, key = bucket_keys(data[value_col].to_numpy(dtype=float, na_value=np.nan), alpha)
+    buckets = data[group_cols].assign(sign=sign, key=key)
+    buckets = buckets[~np.isnan(sign)]
+    counts = buckets.groupby(group_cols + BUCKET_COLUMNS, sort=False, observed=True).size().reset_index(name='count')
+    counts['sign'] = counts['sign'].astype('int8')
+    counts['key'] = counts['key'].astype('int32')
+    return counts
+
+
+def merge_bucket_counts(counts, group_cols):
+    """Объединение скетчей: суммирование счетчиков одинаковых корзин"""
+    return counts.groupby(group_cols + BUCKET_COLUMNS, sort=False, observed=True)['count'].sum().reset_index()
+
+
+def collapse_bucket_counts(counts, group_cols, max_bins=SKETCH_MAX_BINS):
+    """Слияние младших корзин групп сверх max_bins (как QuantileSketch._collapse)"""
+    sizes = counts.groupby(group_cols, sort=False, observed=True)['count'].transform('size')
+    if counts.empty or (sizes <= max_bins).all():
+        return counts
+
+    ordered = counts.assign(_order=counts['sign'] * counts['key'])
+    ordered = ordered.sort_values(group_cols + ['sign', '_order'], kind='stable').drop(columns='_order')
+    rank = ordered.groupby(group_cols, sort=False, observed=True).cumcount().to_numpy()
+    size = sizes.loc[ordered.index].to_numpy()
+
+    # Младшие корзины группы переносятся в первую оставшуюся
+    position = np.arange(len(ordered))
+    target_rank = size - max_bins + 1
+    target = np.where((size > max_bins) & (rank < target_rank), position - rank + target_rank, position)
+    ordered['sign'] = ordered['sign'].to_numpy()[target]
+    ordered['key'] = ordered['key'].to_numpy()[target]
+    return merge_bucket_counts(ordered, group_cols)
+
+
+def bucket_quantiles(counts, group_cols, quantiles, alpha=SKETCH_RELATIVE_ACCURACY):
+    """Квантили по скетчам групп
+
+    Ранг считается как в np.percentile с линейной интерполяцией:
+    r = q * (n - 1), значение интерполируется между корзинами
+    элементов floor(r) и ceil(r). Возвращает group_cols + по колонке на
+    квантиль (имена колонок - сами значения quantiles).
+    """
+    if counts.empty:
+        return pd.DataFrame(columns=group_cols + list(quantiles))
+
+    ordered = counts.assign(_order=counts['sign'] * counts['key'])
+    ordered = ordered.sort_values(group_cols + ['sign', '_order'], kind='stable')
+
+    cum = ordered['count'].to_numpy().cumsum()
+    values = bucket_values(ordered['sign'].to_numpy(), ordered['key'].to_numpy(), alpha)
+
+    totals = ordered.groupby(group_cols, sort=False, observed=True)['count'].sum()
+    start = np.concatenate([[0], totals.to_numpy().cumsum()[:-1]])
+    n = totals.to_numpy()
+
+    result = totals.index.to_frame(index=False)
+    for q in quantiles:
+        rank = q * (n - 1)
+        low, frac = np.floor(rank), rank - np.floor(rank)
+        low_value = values[np.searchsorted(cum, start + low, side='right')]
+        high_value = values[np.searchsorted(cum, start + np.ceil(rank), side='right')]
+        result[q] = low_value + (high_value - low_value) * frac
+    return result
+
+
+class QuantileSketch:
+    """Скетч квантилей одного ряда значений (например, закупочных цен товара)
+
+    Хранит не более max_bins корзин: при переполнении самые младшие корзины
+    сливаются, так что память на товар ограничена независимо от числа
+    котировок (точность теряется только в нижнем хвосте распределения).
+    """
+
+    _HEADER = struct.Struct('<dII')
+
+    def __init__(self, alpha=SKETCH_RELATIVE_ACCURACY, max_bins=SKETCH_MAX_BINS):
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.bins = {}
+
+    @property
+    def count(self):
+        return sum(self.bins.values())
+
+    def add(self, values):
+        """Добавление значений (NaN пропускаются)"""
+        sign, key = bucket_keys(values, self.alpha)
+        mask = ~np.isnan(sign)
+        if not mask.any():
+            return self
+        pairs, counts = np.unique(np.stack([sign[mask], key[mask]], axis=1), axis=0, return_counts=True)
+        for (s, k), c in zip(pairs.astype(int).tolist(), counts.tolist()):
+            self.bins[(s, k)] = self.bins.get((s, k), 0) + c
+        self._collapse()
+        return self
+
+    def merge(self, other):
+        """Объединение с другим скетчем той же точности"""
+        if other.alpha != self.alpha:
+            raise ValueError("Нельзя объединять скетчи с разной точностью")
+        for bucket, c in other.bins.items():
+            self.bins[bucket] = self.bins.get(bucket, 0) + c
+        self._collapse()
+        return self
+
+    def _collapse(self):
+        """Слияние младших корзин при превышении max_bins"""
+        if len(self.bins) <= self.max_bins:
+            return
+        ordered = sorted(self.bins, key=lambda b: (b[0], b[0] * b[1]))
+        excess = ordered[:len(ordered) - self.max_bins + 1]
+        target = ordered[len(excess)]
+        self.bins[target] += sum(self.bins.pop(bucket) for bucket in excess)
+
+    def quantiles(self, quantiles):
+        """Значения квантилей (NaN для пустого скетча)"""
+        if not self.bins:
+            return [np.nan] * len(quantiles)
+        counts = self.to_counts()
+        counts['group'] = 0
+        result = bucket_quantiles(counts, ['group'], quantiles, self.alpha)
+        return [float(result[q].iloc[0]) for q in quantiles]
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def to_counts(self):
+        """Скетч как таблица корзин sign, key, count"""
+        buckets = list(self.bins.items())
+        return pd.DataFrame({
+            'sign': np.array([b[0] for b, _ in buckets], dtype='int8'),
+            'key': np.array([b[1] for b, _ in buckets], dtype='int32'),
+            'count': np.array([c for _, c in buckets], dtype='int64')
+        })
+
+    @classmethod
+    def from_counts(cls, counts, alpha=SKETCH_RELATIVE_ACCURACY, max_bins=SKETCH_MAX_BINS):
+        """Скетч из таблицы корзин (например, строк одного товара из bucket_counts)"""
+        sketch = cls(alpha, max_bins)
+        for s, k, c in zip(counts['sign'].tolist(), counts['key'].tolist(), counts['count'].tolist()):
+            sketch.bins[(s, k)] = sketch.bins.get((s, k), 0) + c
+        sketch._collapse()
+        return sketch
+
+    def to_bytes(self):
+        """Компактная сериализация: заголовок + массивы sign/key/count"""
+        counts = self.to_counts()
+        return (self._HEADER.pack(self.alpha, self.max_bins, len(counts))
+                + counts['sign'].to_numpy().tobytes()
+                + counts['key'].to_numpy().tobytes()
+                + counts['count'].to_numpy().tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        alpha, max_bins, n = cls._HEADER.unpack_from(data)
+        offset = cls._HEADER.size
+        sign = np.frombuffer(data, dtype='int8', count=n, offset=offset)
+        key = np.frombuffer(data, dtype='int32', count=n, offset=offset + n)
+        count = np.frombuffer(data, dtype='int64', count=n, offset=offset + 5 * n)
+        return cls.from_counts(pd.DataFrame({'sign': sign, 'key': key, 'count': count}), alpha, max_bins)
+
+
+def item_cost_sketches(historical_data, alpha=SKETCH_RELATIVE_ACCURACY, max_bins=SKETCH_MAX_BINS):
+    """Скетчи закупочных цен по товарам: {item_id: QuantileSketch}"""
+    counts = bucket_counts(historical_data, ['item_id'], 'producerAmount', alpha)
+    return {
+        item_id: QuantileSketch.from_counts(item_counts, alpha, max_bins)
+        for item_id, item_counts in counts.groupby('item_id', sort=False, observed=True)
+    }
+
+
+def sketch_supplier_costs(historical_data, alpha=SKETCH_RELATIVE_ACCURACY, max_bins=SKETCH_MAX_BINS):
+    """Закупочные цены по скетчам в формате calculate_supplier_costs (те же корзины, что у item_cost_sketches)"""
+    if historical_data.empty:
+        return pd.DataFrame()
+
+    counts = bucket_counts(historical_data, ['item_id'], 'producerAmount', alpha)
+    costs = bucket_quantiles(collapse_bucket_counts(counts, ['item_id'], max_bins), ['item_id'], [0.5, 0.1, 0.9], alpha)
+    # Товары и тип item_id - как у groupby в calculate_supplier_costs
+    quotes = historical_data.groupby('item_id', observed=True)['producerAmount'].count().rename('quotes_count').reset_index()
+    supplier_costs = quotes.merge(costs, on='item_id', how='left')
+    supplier_costs = supplier_costs[['item_id', 0.5, 0.1, 0.9, 'quotes_count']]
+    supplier_costs.columns = ['item_id', 'cost_p50', 'cost_p10', 'cost_p90', 'quotes_count']
+    supplier_costs[['cost_p50', 'cost_p10', 'cost_p90']] = supplier_costs[['cost_p50', 'cost_p10', 'cost_p90']].astype(float)
+    return supplier_costs.round(4)
+
+
+def accuracy_report(historical_data, alphas=(0.01, 0.005, 0.001, 0.0005, 0.0001), max_bins=SKETCH_MAX_BINS):
+    """Сравнение скетчей с точным расчетом закупочных цен
+
+    Для каждой точности alpha: максимальная и средняя относительная ошибка
+    p10/p50/p90 против np.nanpercentile, число корзин и байт на товар.
+    """
+    exact = historical_data.groupby('item_id', observed=True)['producerAmount'].quantile([0.5, 0.1, 0.9]).unstack()
+
+    rows = []
+    for alpha in alphas:
+        sketches = item_cost_sketches(historical_data, alpha, max_bins)
+        approx = pd.DataFrame(
+            {item_id: sketch.quantiles([0.5, 0.1, 0.9]) for item_id, sketch in sketches.items()},
+            index=[0.5, 0.1, 0.9]
+        ).T.reindex(exact.index)
+
+        row = {'alpha': alpha, 'max_bins': max_bins}
+        for q, name in [(0.1, 'p10'), (0.5, 'p50'), (0.9, 'p90')]:
+            rel_error = ((approx[q] - exact[q]).abs() / exact[q].abs()).replace(np.inf, np.nan)
+            row[f'{name}_max_rel_error'] = rel_error.max()
+            row[f'{name}_mean_rel_error'] = rel_error.mean()
+        bins = [len(sketch.bins) for sketch in sketches.values()]
+        row['bins_per_item_avg'] = np.mean(bins) if bins else 0
+        row['bins_per_item_max'] = max(bins) if bins else 0
+        row['bytes_per_item_max'] = max((len(sketch.to_bytes()) for sketch in sketches.values()), default=0)
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # Отчет о точности скетчей на всех CSV из папки data
+    import os
+    from datetime import datetime
+    from data_loader import DataLoader, resolve_csv_files
+    from config import DATA_FOLDER, OUTPUT_FOLDER, LOOKBACK_WEEKS
+
+    if not resolve_csv_files(DATA_FOLDER):
+        print(f"❌ В папке {DATA_FOLDER} не найдено CSV файлов!")
+    else:
+        loader = DataLoader()
+        loader.load_files(DATA_FOLDER)
+        loader.prepare_data()
+        report = accuracy_report(loader.get_historical_data(weeks_back=LOOKBACK_WEEKS))
+
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        report_file = os.path.join(OUTPUT_FOLDER, f"sketch_accuracy_{timestamp}.csv")
+        report.to_csv(report_file, index=False)
+        print(report.to_string(index=False))
+        print(f"\n💾 Отчет сохранен: {report_file}")
@@ -0,0 +1,31 @@
+"""
+Файлы рекомендаций weekly_pricing.py в OUTPUT_FOLDER
+
+Порядок файлов - по времени запуска в имени (weekly_pricing_recos_<время>.csv),
+а не по времени изменения: после копирования или восстановления из
+резервной копии mtime не отражает порядок запусков. Модуль без тяжелых
+зависимостей, его импортирует и легкая подкоманда lookup.
+"""
+
+import glob
+import os
+import re
+from datetime import datetime
+
+from config import OUTPUT_FOLDER, RECOMMENDATIONS_PATTERN
+
+# Время запуска в имени файла рекомендаций
+TIMESTAMP_PATTERN = re.compile(r'(\d{8}_\d{6})')
+
+
+def file_timestamp(path):
+    """Время запуска из имени файла рекомендаций или None"""
+    match = TIMESTAMP_PATTERN.search(os.path.basename(path))
+    return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S") if match else None
+
+
+def latest_recommendations(folder=OUTPUT_FOLDER):
+    """Последний по времени запуска файл рекомендаций или None"""
+    stamped = [(stamp, path) for path in glob.glob(os.path.join(folder, RECOMMENDATIONS_PATTERN))
+               if (stamp := file_timestamp(path)) is not None]
+    return max(stamped)[1] if stamped else None
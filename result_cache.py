@@ -0,0 +1,193 @@
+"""
+Кеш результатов анализа по отпечатку входных данных
+
+Ключ - хеш от размера и времени изменения входных файлов (и по желанию их
+содержимого), от настроек config.py, влияющих на расчет, и от исходного
+кода расчета. Запись кеша - папка <ключ>/ с закупочными ценами, метриками
+клиентов и рекомендациями в Parquet. Повторный запуск на тех же данных
+берет рекомендации из кеша и сразу пишет отчет.
+
+Размер кеша ограничен RESULT_CACHE_MAX_MB: при превышении удаляются
+записи, которые дольше всего не читались.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import pandas as pd
+
+import config
+from structured_logging import get_logger
+from config import RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_MB, RESULT_CACHE_CHECKSUM
+
+# Версия формата записи: при изменении старые записи не используются
+CACHE_VERSION = 1
+
+# Настройки config.py, от которых зависит результат
+CACHE_KEY_SETTINGS = [
+    'MIN_MARGIN', 'MAX_MARGIN', 'DEFAULT_MARGIN', 'STEP_DOWN_PCT', 'STEP_UP_PCT',
+    'MIN_REQS_TO_KEEP', 'NO_SALE_WEEKS_TO_DISABLE', 'MIN_CONVERSION_RATE',
+    'LOOKBACK_WEEKS', 'CURRENT_WEEK_DAYS',
+    'HIGH_CONVERSION_THRESHOLD', 'LOW_CONVERSION_THRESHOLD', 'HIGH_DEMAND_THRESHOLD', 'LOW_DEMAND_THRESHOLD',
+    'AGGREGATION_BACKEND', 'COST_PERCENTILE_MODE', 'INCREMENTAL_AGGREGATES', 'STREAMING_MODE',
+    'SKETCH_RELATIVE_ACCURACY', 'SKETCH_MAX_BINS', 'COLUMN_MAPPING', 'COLUMN_TYPES'
+]
+
+# Модули расчета: правка кода тоже меняет ключ
+CACHE_KEY_SOURCES = [
+    'data_loader.py', 'pricing_algorithm.py', 'aggregate_store.py', 'quantile_sketch.py',
+    'duckdb_aggregation.py', 'sharded_pricing.py'
+]
+
+# Таблицы записи кеша
+CACHE_TABLES = ['supplier_costs', 'consumer_metrics', 'recommendations']
+
+META_FILE = 'meta.json'
+
+
+log = get_logger('result_cache')
+
+
+def file_checksum(path, block_size=2**20):
+    """BLAKE2b содержимого файла (читается блоками)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def input_fingerprint(paths, checksum=RESULT_CACHE_CHECKSUM):
+    """Описание входных файлов: путь, размер, mtime (и контрольная сумма)"""
+    files = []
+    for path in sorted(os.path.abspath(path) for path in paths):
+        stat = os.stat(path)
+        entry = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if checksum:
+            entry['checksum'] = file_checksum(path)
+        files.append(entry)
+    return files
+
+
+def settings_fingerprint():
+    """Настройки и код расчета, от которых зависит результат"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    sources = {}
+    for name in CACHE_KEY_SOURCES:
+        path = os.path.join(here, name)
+        if os.path.exists(path):
+            sources[name] = file_checksum(path)
+    return {
+        'version': CACHE_VERSION,
+        'settings': {name: getattr(config, name, None) for name in CACHE_KEY_SETTINGS},
+        'sources': sources
+    }
+
+
+class ResultCache:
+    """Записи кеша в папке folder с вытеснением давно не читавшихся"""
+
+    def __init__(self, folder=RESULT_CACHE_FOLDER, max_mb=RESULT_CACHE_MAX_MB, checksum=RESULT_CACHE_CHECKSUM):
+        self.folder = folder
+        self.max_bytes = max_mb * 2**20
+        self.checksum = checksum
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, paths):
+        """Ключ записи для входных файлов и текущих настроек"""
+        fingerprint = {'inputs': input_fingerprint(paths, self.checksum), **settings_fingerprint()}
+        payload = json.dumps(fingerprint, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key)
+
+    def get(self, key):
+        """Таблицы записи (dict) или None, если записи нет"""
+        path = self._path(key)
+        meta_file = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        tables = {name: pd.read_parquet(os.path.join(path, f"{name}.parquet")) for name in meta['tables']}
+        # Время последнего чтения - порядок вытеснения
+        os.utime(meta_file)
+        return tables
+
+    def _tables(self, path):
+        """Таблицы существующей записи (пустой список, если ее нет)"""
+        try:
+            with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)['tables']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def put(self, key, tables, **meta):
+        """Атомарная запись таблиц (None пропускаются) и вытеснение старых записей
+
+        Существующая запись с теми же таблицами не перезаписывается, а запись
+        без части таблиц (например, без метрик клиентов после расчета по
+        шардам) заменяется полной.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        names = []
+        for name, table in tables.items():
+            if table is None:
+                continue
+            table.to_parquet(os.path.join(tmp_path, f"{name}.parquet"), index=False)
+            names.append(name)
+        with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'tables': names, 'created_at': time.strftime("%Y-%m-%d %H:%M:%S"), **meta},
+                      f, ensure_ascii=False, default=str)
+
+        if set(names) <= set(self._tables(path)):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            if os.path.exists(path):
+                stale = f"{path}.tmp-stale-{os.getpid()}"
+                try:
+                    os.replace(path, stale)
+                except FileNotFoundError:
+                    pass
+                shutil.rmtree(stale, ignore_errors=True)
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                # Другой процесс успел записать ту же запись
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict(keep=key)
+        return path
+
+    def entries(self):
+        """Записи кеша: (время последнего чтения, размер в байтах, ключ)"""
+        entries = []
+        for key in os.listdir(self.folder):
+            meta_file = os.path.join(self._path(key), META_FILE)
+            if '.tmp-' in key or not os.path.exists(meta_file):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(self._path(key)) if entry.is_file())
+            entries.append((os.path.getmtime(meta_file), size, key))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Удаление давно не читавшихся записей, пока кеш больше max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            log.info("🧹 Из кеша результатов удалено записей: {removed}", removed=removed, cache_bytes=total)
+        return removed
@@ -0,0 +1,184 @@
+"""
+Параллельный расчет рекомендаций по шардам клиентов
+
+Закупочные цены считаются один раз, метрики и рекомендации каждого клиента
+зависят только от его строк. Поэтому строки недели и истории делятся по
+хешу consumer_id на шарды, шарды и закупочные цены пишутся во временную
+папку в формате Arrow IPC, а процессы пула читают их через memory map -
+без передачи больших таблиц через pickle. Результат совпадает с
+последовательным расчетом строка в строку.
+
+Включается параметром PRICING_WORKERS в config.py (1 - без пула).
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from structured_logging import get_logger
+from config import PRICING_WORKERS, PRICING_SHARDS_PER_WORKER
+
+# Колонки строк, нужные для метрик клиентов
+METRIC_INPUT_COLUMNS = ['consumer_id', 'item_id', 'consumerAmount', 'all_orders', 'Profit']
+
+SUPPLIER_COSTS_FILE = 'supplier_costs.arrow'
+
+# Состояние процесса пула (заполняется в _init_worker)
+_worker = {}
+
+
+log = get_logger('sharded_pricing')
+
+
+def shard_numbers(consumer_ids, n_shards):
+    """Номер шарда для каждого consumer_id"""
+    hashes = pd.util.hash_array(np.asarray(consumer_ids, dtype=np.int64))
+    return (hashes % np.uint64(n_shards)).astype(np.int32)
+
+
+def _encode_categories(df):
+    """Категориальные колонки -> коды (тип категорий pandas не переживает Arrow)"""
+    dtypes = {}
+    columns = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            dtypes[col] = df[col].dtype
+            columns[col] = df[col].cat.codes.to_numpy()
+        else:
+            columns[col] = df[col].to_numpy()
+    return pd.DataFrame(columns), dtypes
+
+
+def _decode_categories(df, dtypes):
+    for col, dtype in dtypes.items():
+        df[col] = pd.Categorical.from_codes(df[col].to_numpy(), dtype=dtype)
+    return df
+
+
+def write_arrow(df, path):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_arrow(path):
+    """Таблица из файла Arrow IPC через memory map (буферы не копируются)"""
+    import pyarrow as pa
+
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def write_shards(data, n_shards, folder, prefix):
+    """Строки data, разложенные по шардам клиентов: список путей (None - пустой шард)
+
+    Порядок строк внутри шарда сохраняется, поэтому 'last' и медианы по
+    группам совпадают с расчетом по всей таблице.
+    """
+    shards = shard_numbers(data['consumer_id'].to_numpy(), n_shards)
+    order = np.argsort(shards, kind='stable')
+    bounds = np.searchsorted(shards[order], np.arange(n_shards + 1))
+    frame = data[METRIC_INPUT_COLUMNS]
+
+    paths = []
+    for shard in range(n_shards):
+        rows = order[bounds[shard]:bounds[shard + 1]]
+        if len(rows) == 0:
+            paths.append(None)
+            continue
+        path = os.path.join(folder, f"{prefix}_{shard:04d}.arrow")
+        write_arrow(frame.take(rows), path)
+        paths.append(path)
+    return paths
+
+
+def _init_worker(folder, costs_dtypes, weekly_dtypes, historical_dtypes, backend, percentile_mode):
+    """Инициализация процесса пула: закупочные цены читаются один раз
+
+    У каждой таблицы свой набор категориальных колонок: закупочные цены в
+    режиме sketch, например, хранят item_id строками.
+    """
+    from pricing_algorithm import PricingAlgorithm
+
+    _worker['weekly_dtypes'] = weekly_dtypes
+    _worker['historical_dtypes'] = historical_dtypes
+    _worker['supplier_costs'] = _decode_categories(read_arrow(os.path.join(folder, SUPPLIER_COSTS_FILE)), costs_dtypes)
+    _worker['algorithm'] = PricingAlgorithm(backend=backend, percentile_mode=percentile_mode, workers=1)
+
+
+def _empty_rows(dtypes):
+    frame = pd.DataFrame({col: pd.Series(dtype=float) for col in METRIC_INPUT_COLUMNS})
+    frame['consumer_id'] = frame['consumer_id'].astype(np.int32)
+    for col, dtype in dtypes.items():
+        frame[col] = pd.Categorical([], dtype=dtype)
+    return frame
+
+
+def _recommend_shard(weekly_path, historical_path, has_history):
+    """Метрики и рекомендации клиентов одного шарда"""
+    algorithm = _worker['algorithm']
+    weekly = _decode_categories(read_arrow(weekly_path), _worker['weekly_dtypes'])
+    historical = _decode_categories(read_arrow(historical_path), _worker['historical_dtypes']) if historical_path \
+        else _empty_rows(_worker['weekly_dtypes'])
+
+    consumer_metrics = algorithm.calculate_consumer_metrics(weekly, historical)
+    if has_history and historical.empty:
+        # Во всей выборке история есть, просто не у клиентов этого шарда:
+        # последовательный расчет дал бы пропуски после объединения, а не нули
+        from pricing_algorithm import HIST_METRIC_COLUMNS
+        consumer_metrics[HIST_METRIC_COLUMNS] = np.nan
+    consumer_metrics = algorithm.calculate_conversion_rates(consumer_metrics)
+    return algorithm.recommend_prices(consumer_metrics, _worker['supplier_costs'])
+
+
+def recommend_sharded(algorithm, weekly_data, historical_data, supplier_costs,
+                      workers=PRICING_WORKERS, shards_per_worker=PRICING_SHARDS_PER_WORKER):
+    """Рекомендации по шардам клиентов в пуле процессов
+
+    Шардов больше, чем процессов, чтобы крупные клиенты не оставляли
+    остальные процессы без работы. Пустые supplier_costs сюда не передаются
+    (generate_recommendations считает их последовательно).
+    """
+    workers = workers or os.cpu_count() or 1
+    n_shards = max(1, workers * shards_per_worker)
+    folder = tempfile.mkdtemp(prefix='pricing_shards_')
+    try:
+        costs, costs_dtypes = _encode_categories(supplier_costs)
+        write_arrow(costs, os.path.join(folder, SUPPLIER_COSTS_FILE))
+        weekly, weekly_dtypes = _encode_categories(weekly_data[METRIC_INPUT_COLUMNS])
+        historical, historical_dtypes = _encode_categories(historical_data[METRIC_INPUT_COLUMNS]) \
+            if not historical_data.empty else (None, {})
+
+        weekly_paths = write_shards(weekly, n_shards, folder, 'weekly')
+        historical_paths = write_shards(historical, n_shards, folder, 'historical') \
+            if historical is not None else [None] * n_shards
+        tasks = [(w, h) for w, h in zip(weekly_paths, historical_paths) if w is not None]
+
+        with ProcessPoolExecutor(
+            max_workers=min(workers, max(len(tasks), 1)), initializer=_init_worker,
+            initargs=(folder, costs_dtypes, weekly_dtypes, historical_dtypes,
+                      algorithm.backend, algorithm.percentile_mode)
+        ) as executor:
+            parts = list(executor.map(
+                _recommend_shard, [w for w, _ in tasks], [h for _, h in tasks],
+                [historical is not None] * len(tasks)
+            ))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    log.info("Обработано {pairs} комбинаций клиент-товар ({shards} шардов, {workers} процессов)",
+             pairs=sum(len(part) for part in parts), shards=len(tasks), workers=workers)
+    if not parts:
+        return algorithm.recommend_prices(pd.DataFrame(), supplier_costs)
+
+    # Порядок последовательного расчета: группы отсортированы по клиенту и товару
+    recommendations = pd.concat(parts, ignore_index=True)
+    item_codes = pd.Categorical(recommendations['item_id'], dtype=weekly_dtypes.get('item_id')).codes
+    order = np.lexsort((item_codes, recommendations['consumer_id'].to_numpy()))
+    return recommendations.take(order).reset_index(drop=True)
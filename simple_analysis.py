@@ -3,102 +3,226 @@
 Работает только с встроенными библиотеками Python
 """
 
+import argparse
 import csv
 import os
+from array import array
 from datetime import datetime, timedelta
-from collections import defaultdict, Counter
+from collections import Counter
+from operator import itemgetter
 
-def load_data(filename):
-    """Загрузка данных из CSV файла"""
-    data = []
-    print(f"Загружаем данные из {filename}...")
-    
-    with open(filename, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
+from config import (
+    MIN_MARGIN, MAX_MARGIN, DEFAULT_MARGIN, STEP_DOWN_PCT, STEP_UP_PCT, MIN_REQS_TO_KEEP,
+    HIGH_CONVERSION_THRESHOLD, LOW_CONVERSION_THRESHOLD, LOOKBACK_WEEKS
+)
+
+# Колонки, которые нужны анализу: строки stream_rows - кортежи в этом порядке
+FIELDS = ['consumerName', 'producerName', 'countryName', 'webserviceName',
+          'consumerAmount', 'producerAmount', 'all_orders', 'Profit', 'dates']
+CONSUMER, SUPPLIER, COUNTRY, SERVICE, SELL, BUY, ORDERS, PROFIT, DATES = range(len(FIELDS))
+
+# Значения отсутствующих колонок (как row.get(колонка, 0) раньше)
+FIELD_DEFAULTS = {'consumerAmount': '0', 'producerAmount': '0', 'all_orders': '0', 'Profit': '0'}
+
+# Суммы по товару: ячейки array('d') в item_stats
+REQUESTS, SALES, ITEM_PROFIT, SELL_SUM, SELL_COUNT, BUY_SUM, BUY_COUNT = range(7)
+
+# Значения, которые pandas читает как пропуск (для совпадения с DataLoader)
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+])
+
+# Разделитель страны и сервиса в item_id (как id_dictionary.ITEM_SEPARATOR)
+ITEM_SEPARATOR = " | "
+
+# Колонки рекомендаций в режиме parity (как в отчете weekly_pricing.py)
+PARITY_COLUMNS = [
+    'consumer_name', 'item_id', 'enabled', 'price_rec', 'baseline_cost', 'target_margin', 'reason',
+    'reqs', 'sales', 'reqs_hist', 'sales_hist', 'conversion_rate', 'conversion_rate_hist', 'profit'
+]
+
+
+def _field_getter(header):
+    """Функция строка CSV -> кортеж значений FIELDS и значения отсутствующих колонок"""
+    missing = [name for name in FIELDS if name not in header]
+    width = len(header)
+    # Отсутствующие колонки берутся из хвоста, дописанного к строке
+    positions = [header.index(name) if name in header else width + missing.index(name) for name in FIELDS]
+    return itemgetter(*positions), [FIELD_DEFAULTS.get(name, '') for name in missing]
+
+
+def read_rows(filename):
+    """Строки одного CSV файла по одной (кортежи значений FIELDS)"""
+    with open(filename, 'r', encoding='utf-8', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        width = len(header)
+        pick, tail = _field_getter(header)
         for row in reader:
-            data.append(row)
+            if not row:
+                continue
+            if len(row) < width:
+                row += [''] * (width - len(row))
+            if tail:
+                row[width:] = tail
+            yield pick(row)
+
+
+def file_date_ranges(filenames):
+    """Первая и последняя дата строк каждого файла (проход без хранения строк)"""
+    ranges = []
+    for filename in filenames:
+        first = last = None
+        for row in read_rows(filename):
+            date = _date(row[DATES])
+            if date is None:
+                continue
+            if first is None or date < first:
+                first = date
+            if last is None or date > last:
+                last = date
+        ranges.append((first, last))
+    return ranges
+
+
+def _in_window(date, since=None, until=None):
+    """Дата в окне [since, until]; строки без даты сравниваются всегда"""
+    if date is None:
+        return True
+    return (since is not None and date >= since) or (until is not None and date <= until)
+
+
+def stream_rows(filenames, stats=None):
+    """Строки всех CSV файлов по одной, без загрузки в память
+
+    Строки, повторяющиеся в пересекающихся выгрузках, берутся один раз
+    (повторы внутри одного файла сохраняются), как в DataLoader.load_files:
+    строки сравниваются по колонкам FIELDS. Повтор строки имеет ту же дату,
+    поэтому строка может повторять предыдущие файлы, только если она не
+    позже их последней даты, и повториться дальше, только если не раньше
+    первой даты следующих файлов (даты файлов - предварительным проходом).
+    Запоминаются только такие строки и строки без даты: память ограничена
+    перекрытием выгрузок, а не размером файлов. В stats (если передан)
+    пишется remembered_peak - наибольшее число запомненных строк.
+    """
+    ranges = file_date_ranges(filenames) if len(filenames) > 1 else [(None, None)]
+    seen = Counter()  # строка -> сколько копий было в предыдущих файлах
+    total = 0
+    peak = 0
     
-    print(f"Загружено {len(data)} строк")
-    return data
+    for index, filename in enumerate(filenames):
+        print(f"Загружаем данные из {filename}...")
+        earlier = [last for _, last in ranges[:index] if last is not None]
+        later = [first for first, _ in ranges[index + 1:] if first is not None]
+        dedup, remember = index > 0, index < len(filenames) - 1
+        dedup_until = max(earlier) if earlier else None
+        remember_from = min(later) if later else None
+        in_file = Counter()
+        rows = 0
+        
+        for row in read_rows(filename):
+            if dedup or remember:
+                date = _date(row[DATES])
+                check = dedup and _in_window(date, until=dedup_until)
+                if check or (remember and _in_window(date, since=remember_from)):
+                    in_file[row] += 1
+                    if check and in_file[row] <= seen[row]:
+                        continue
+            rows += 1
+            yield row
+        
+        peak = max(peak, len(seen) + len(in_file))
+        if remember:
+            # Строки раньше первой даты следующих файлов больше не повторятся
+            seen = Counter({
+                row: count for row, count in seen.items()
+                if _in_window(_date(row[DATES]), since=remember_from)
+            })
+            for row, count in in_file.items():
+                if count > seen[row] and _in_window(_date(row[DATES]), since=remember_from):
+                    seen[row] = count
+        print(f"Загружено {rows} строк")
+        total += rows
+    
+    if stats is not None:
+        stats['remembered_peak'] = peak
+    print(f"Всего загружено {total} строк из {len(filenames)} файлов")
 
-def analyze_data(data):
-    """Анализ данных"""
+def analyze_data(rows):
+    """Анализ данных за один проход по строкам stream_rows
+
+    Хранятся только суммы и счетчики: общие, по товарам (ячейки
+    array('d'), см. REQUESTS...BUY_COUNT) и множества имен для подсчета
+    уникальных значений.
+    """
     print("\nАнализируем данные...")
     
-    # Статистика по данным
-    total_rows = len(data)
-    unique_consumers = len(set(row.get('consumerName', '') for row in data))
-    unique_suppliers = len(set(row.get('producerName', '') for row in data))
-    unique_countries = len(set(row.get('countryName', '') for row in data))
-    unique_services = len(set(row.get('webserviceName', '') for row in data))
+    total_rows = 0
+    consumers, suppliers, countries, services = set(), set(), set(), set()
+    sell_sum = buy_sum = 0.0
+    sell_count = buy_count = 0
+    total_profit = 0
     
-    # Анализ цен
-    sell_prices = []
-    buy_prices = []
-    profits = []
+    # Анализ по товарам (страна + сервис)
+    item_ids = {}
+    item_stats = {}
     
-    for row in data:
+    for row in rows:
+        total_rows += 1
+        consumers.add(row[CONSUMER])
+        suppliers.add(row[SUPPLIER])
+        countries.add(row[COUNTRY])
+        services.add(row[SERVICE])
+        
+        # Анализ цен
         try:
-            sell_price = float(row.get('consumerAmount', 0))
-            buy_price = float(row.get('producerAmount', 0))
-            profit = float(row.get('Profit', 0))
-            
-            if sell_price > 0:
-                sell_prices.append(sell_price)
-            if buy_price > 0:
-                buy_prices.append(buy_price)
-            if profit != 0:
-                profits.append(profit)
+            sell_price = float(row[SELL])
+            buy_price = float(row[BUY])
+            profit = float(row[PROFIT])
         except (ValueError, TypeError):
             continue
-    
-    # Расчет статистики
-    avg_sell_price = sum(sell_prices) / len(sell_prices) if sell_prices else 0
-    avg_buy_price = sum(buy_prices) / len(buy_prices) if buy_prices else 0
-    total_profit = sum(profits)
-    
-    # Анализ по товарам (страна + сервис)
-    item_stats = defaultdict(lambda: {
-        'requests': 0,
-        'sales': 0,
-        'total_profit': 0,
-        'sell_prices': [],
-        'buy_prices': []
-    })
-    
-    for row in data:
-        country = row.get('countryName', '').strip().upper()
-        service = row.get('webserviceName', '').strip().upper()
-        item_id = f"{country} | {service}"
+        if sell_price > 0:
+            sell_sum += sell_price
+            sell_count += 1
+        if buy_price > 0:
+            buy_sum += buy_price
+            buy_count += 1
+        total_profit += profit
         
         try:
-            sell_price = float(row.get('consumerAmount', 0))
-            buy_price = float(row.get('producerAmount', 0))
-            quantity = int(row.get('all_orders', 0))
-            profit = float(row.get('Profit', 0))
-            
-            item_stats[item_id]['requests'] += 1
-            item_stats[item_id]['sales'] += quantity
-            item_stats[item_id]['total_profit'] += profit
-            
-            if sell_price > 0:
-                item_stats[item_id]['sell_prices'].append(sell_price)
-            if buy_price > 0:
-                item_stats[item_id]['buy_prices'].append(buy_price)
-                
+            quantity = int(row[ORDERS])
         except (ValueError, TypeError):
             continue
+        
+        names = (row[COUNTRY], row[SERVICE])
+        item_id = item_ids.get(names)
+        if item_id is None:
+            item_id = item_ids[names] = f"{names[0].strip().upper()} | {names[1].strip().upper()}"
+        stats = item_stats.get(item_id)
+        if stats is None:
+            stats = item_stats[item_id] = array('d', bytes(8 * 7))
+        
+        stats[REQUESTS] += 1
+        stats[SALES] += quantity
+        stats[ITEM_PROFIT] += profit
+        if sell_price > 0:
+            stats[SELL_SUM] += sell_price
+            stats[SELL_COUNT] += 1
+        if buy_price > 0:
+            stats[BUY_SUM] += buy_price
+            stats[BUY_COUNT] += 1
     
     return {
         'total_rows': total_rows,
-        'unique_consumers': unique_consumers,
-        'unique_suppliers': unique_suppliers,
-        'unique_countries': unique_countries,
-        'unique_services': unique_services,
-        'avg_sell_price': avg_sell_price,
-        'avg_buy_price': avg_buy_price,
+        'unique_consumers': len(consumers),
+        'unique_suppliers': len(suppliers),
+        'unique_countries': len(countries),
+        'unique_services': len(services),
+        'avg_sell_price': sell_sum / sell_count if sell_count else 0,
+        'avg_buy_price': buy_sum / buy_count if buy_count else 0,
         'total_profit': total_profit,
-        'item_stats': dict(item_stats)
+        'item_stats': item_stats
     }
 
 def generate_recommendations(stats):
@@ -108,15 +232,17 @@ def generate_recommendations(stats):
     recommendations = []
     
     for item_id, item_data in stats['item_stats'].items():
-        if not item_data['sell_prices'] or not item_data['buy_prices']:
+        if not item_data[SELL_COUNT] or not item_data[BUY_COUNT]:
             continue
+        requests = int(item_data[REQUESTS])
+        sales = int(item_data[SALES])
             
         # Расчет средней цены продажи и закупки
-        avg_sell = sum(item_data['sell_prices']) / len(item_data['sell_prices'])
-        avg_buy = sum(item_data['buy_prices']) / len(item_data['buy_prices'])
+        avg_sell = item_data[SELL_SUM] / item_data[SELL_COUNT]
+        avg_buy = item_data[BUY_SUM] / item_data[BUY_COUNT]
         
         # Расчет конверсии
-        conversion_rate = item_data['sales'] / max(item_data['requests'], 1)
+        conversion_rate = sales / max(requests, 1)
         
         # Рекомендация цены (базовая логика)
         if conversion_rate > 0.1:  # Высокая конверсия
@@ -127,7 +253,7 @@ def generate_recommendations(stats):
             recommended_price = avg_buy * 1.15  # 15% маржа
             enabled = True
             reason = "medium_conversion"
-        elif item_data['requests'] > 10:  # Есть спрос, но низкая конверсия
+        elif requests > 10:  # Есть спрос, но низкая конверсия
             recommended_price = avg_buy * 1.05  # 5% маржа
             enabled = True
             reason = "low_conversion_high_demand"
@@ -143,16 +269,242 @@ def generate_recommendations(stats):
             'avg_buy_price': round(avg_buy, 4),
             'avg_sell_price': round(avg_sell, 4),
             'conversion_rate': round(conversion_rate, 4),
-            'requests': item_data['requests'],
-            'sales': item_data['sales'],
-            'total_profit': round(item_data['total_profit'], 2),
+            'requests': requests,
+            'sales': sales,
+            'total_profit': round(item_data[ITEM_PROFIT], 2),
             'reason': reason
         })
     
     return recommendations
 
-def save_results(stats, recommendations):
-    """Сохранение результатов"""
+def _number(value):
+    """Число из CSV как pd.to_numeric(errors='coerce'): пропуск и ошибка -> None"""
+    if value in NA_VALUES:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+    return None if number != number else number
+
+
+def _date(value):
+    """Дата из CSV (ISO 8601) или None"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _round4(value):
+    """Округление как DataFrame.round(4): умножение, rint, деление (целые не меняются)"""
+    if isinstance(value, float) and value == value:
+        return round(value * 10000.0) / 10000.0
+    return value
+
+
+def _median(values):
+    """Медиана как groupby median: середина или полусумма двух средних (NaN, если значений нет)"""
+    values = sorted(values)
+    n = len(values)
+    if not n:
+        return float('nan')
+    if n % 2:
+        return values[n // 2]
+    return (values[n // 2 - 1] + values[n // 2]) / 2
+
+
+def last_date(filenames):
+    """Последняя дата строк с товаром (первый проход, как DataLoader._date_index)"""
+    last = None
+    for filename in filenames:
+        for row in read_rows(filename):
+            if row[COUNTRY] in NA_VALUES or row[SERVICE] in NA_VALUES:
+                continue
+            date = _date(row[DATES])
+            if date is not None and (last is None or date > last):
+                last = date
+    return last
+
+
+class _WeekPair:
+    """Текущая неделя пары клиент-товар"""
+
+    __slots__ = ('reqs', 'sales', 'profit', 'profit_error', 'last_date', 'last_price', 'prices')
+
+    def __init__(self):
+        self.reqs = 0
+        self.sales = 0
+        # Сумма Кэхэна, как groupby sum в pandas
+        self.profit = 0.0
+        self.profit_error = 0.0
+        self.last_date = None
+        self.last_price = float('nan')
+        self.prices = array('d')
+
+
+class PricingAggregates:
+    """Агрегаты PricingAlgorithm (режим exact), собираемые по одной строке
+
+    Окна - как у DataLoader: от полуночи последнего дня данных end_date,
+    текущая неделя [end_date - 1 неделя, end_date), история
+    [end_date - lookback_weeks недель, end_date). В памяти только суммы по
+    парам клиент-товар и значения для медиан: закупочные цены истории по
+    товару и цены продажи текущей недели по паре (array('d'), 8 байт на
+    значение). Строки вне окна истории не хранятся.
+    """
+
+    def __init__(self, end_date, lookback_weeks=LOOKBACK_WEEKS):
+        self.end_date = end_date
+        self.week_start = end_date - timedelta(weeks=1)
+        self.history_start = end_date - timedelta(weeks=lookback_weeks)
+        self.item_ids = {}
+        self.costs = {}    # item_id -> закупочные цены истории
+        self.history = {}  # (клиент, item_id) -> [reqs_hist, sales_hist]
+        self.weekly = {}   # (клиент, item_id) -> _WeekPair
+
+    def item_id(self, country, service):
+        """item_id как в encode_items: верхний регистр, без пробелов по краям"""
+        names = (country, service)
+        item_id = self.item_ids.get(names)
+        if item_id is None:
+            if country in NA_VALUES or service in NA_VALUES:
+                return None
+            item_id = self.item_ids[names] = country.upper().strip() + ITEM_SEPARATOR + service.upper().strip()
+        return item_id
+
+    def add(self, row):
+        """Учет одной строки (кортеж значений FIELDS)"""
+        date = _date(row[DATES])
+        if date is None or date < self.history_start or date >= self.end_date:
+            return
+        item_id = self.item_id(row[COUNTRY], row[SERVICE])
+        if item_id is None:
+            return
+        key = (row[CONSUMER], item_id)
+        orders = _number(row[ORDERS])
+        
+        costs = self.costs.get(item_id)
+        if costs is None:
+            costs = self.costs[item_id] = array('d')
+        cost = _number(row[BUY])
+        if cost is not None:
+            costs.append(cost)
+        history = self.history.get(key)
+        if history is None:
+            history = self.history[key] = [0, 0]
+        history[0] += 1
+        if orders is not None:
+            history[1] += orders
+        
+        if date < self.week_start:
+            return
+        week = self.weekly.get(key)
+        if week is None:
+            week = self.weekly[key] = _WeekPair()
+        week.reqs += 1
+        if orders is not None:
+            week.sales += orders
+        profit = _number(row[PROFIT])
+        if profit is not None:
+            y = profit - week.profit_error
+            t = week.profit + y
+            week.profit_error = t - week.profit - y
+            if week.profit_error != week.profit_error:
+                week.profit_error = 0.0
+            week.profit = t
+        price = _number(row[SELL])
+        if price is not None:
+            week.prices.append(price)
+            # 'last' после устойчивой сортировки по дате: при равных датах - более поздняя строка
+            if week.last_date is None or date >= week.last_date:
+                week.last_date = date
+                week.last_price = price
+
+    def feed(self, rows):
+        """Строки rows без изменений, попутно учтенные в агрегатах"""
+        for row in rows:
+            self.add(row)
+            yield row
+
+    def recommendations(self):
+        """Рекомендации по парам клиент-товар текущей недели (колонки PARITY_COLUMNS)"""
+        costs = {item_id: _round4(_median(values)) for item_id, values in self.costs.items()}
+        recommendations = []
+        for (consumer, item_id), week in sorted(self.weekly.items()):
+            reqs_hist, sales_hist = self.history[(consumer, item_id)]
+            sales, sales_hist = _round4(week.sales), _round4(sales_hist)
+            conversion_rate = sales / week.reqs if week.reqs > 0 else 0.0
+            conversion_rate_hist = sales_hist / reqs_hist if reqs_hist > 0 else 0.0
+            
+            enabled, reason, price_rec, baseline_cost, target_margin = recommend_price(
+                costs.get(item_id), week.reqs, sales, _round4(_median(week.prices)), _round4(week.last_price),
+                reqs_hist, sales_hist, conversion_rate
+            )
+            recommendations.append({
+                'consumer_name': consumer,
+                'item_id': item_id,
+                'enabled': enabled,
+                'price_rec': price_rec,
+                'baseline_cost': baseline_cost,
+                'target_margin': target_margin,
+                'reason': reason,
+                'reqs': week.reqs,
+                'sales': sales,
+                'reqs_hist': reqs_hist,
+                'sales_hist': sales_hist,
+                'conversion_rate': conversion_rate,
+                'conversion_rate_hist': conversion_rate_hist,
+                'profit': _round4(week.profit)
+            })
+        return recommendations
+
+
+def recommend_price(cost_p50, reqs, sales, sell_p50, last_price, reqs_hist, sales_hist, conversion_rate):
+    """PricingAlgorithm.recommend_price_for_item без pandas
+
+    cost_p50 - None, если у товара нет закупочных цен в истории. Возвращает
+    (enabled, reason, price_rec, baseline_cost, target_margin).
+    """
+    if cost_p50 is None:
+        return False, 'no_supplier_cost', None, None, None
+    if cost_p50 != cost_p50 or cost_p50 <= 0:
+        return False, 'invalid_cost', None, cost_p50, None
+    
+    # Определяем базовую маржу
+    if sales > 0 and sell_p50 == sell_p50:
+        # Если были продажи - используем историческую маржу
+        hist_margin = (sell_p50 - cost_p50) / max(cost_p50, 1e-6)
+        target_margin = min(max(hist_margin, MIN_MARGIN), MAX_MARGIN)
+        baseline = cost_p50 * (1 + target_margin)
+    elif reqs > 0 and sales == 0 and last_price == last_price:
+        # Если были запросы, но нет продаж - снижаем цену
+        baseline = last_price * (1 - STEP_DOWN_PCT)
+        target_margin = (baseline - cost_p50) / max(cost_p50, 1e-6)
+    else:
+        # Используем маржу по умолчанию
+        target_margin = DEFAULT_MARGIN
+        baseline = cost_p50 * (1 + target_margin)
+    
+    # Проверяем условия для отключения товара
+    no_sale_2w = sales == 0 and (sales_hist or 0) == 0
+    low_demand = (reqs + (reqs_hist or 0)) < MIN_REQS_TO_KEEP
+    if no_sale_2w and low_demand:
+        return False, 'no_sales_two_weeks', None, cost_p50, target_margin
+    
+    # Корректировка цены на основе конверсии
+    if conversion_rate > HIGH_CONVERSION_THRESHOLD:
+        baseline *= (1 + STEP_UP_PCT)
+    elif conversion_rate < LOW_CONVERSION_THRESHOLD and reqs > 20:
+        baseline *= (1 - STEP_DOWN_PCT)
+    
+    return True, 'ok', round(float(baseline), 4), round(float(cost_p50), 4), round(float(target_margin), 4)
+
+def save_results(stats, recommendations, mode='simple'):
+    """Сохранение результатов (mode - как считались рекомендации)"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
     # Создаем папку output если её нет
@@ -163,7 +515,7 @@ def save_results(stats, recommendations):
     output_file = f'output/simple_recommendations_{timestamp}.csv'
     with open(output_file, 'w', newline='', encoding='utf-8') as file:
         if recommendations:
-            writer = csv.DictWriter(file, fieldnames=recommendations[0].keys())
+            writer = csv.DictWriter(file, fieldnames=PARITY_COLUMNS if mode == 'parity' else recommendations[0].keys())
             writer.writeheader()
             writer.writerows(recommendations)
     
@@ -194,10 +546,17 @@ def save_results(stats, recommendations):
         file.write(f"  Рекомендуется отключить: {disabled_count}\n\n")
         
         # Топ-10 товаров по прибыли
-        top_items = sorted(recommendations, key=lambda x: x['total_profit'], reverse=True)[:10]
-        file.write("ТОП-10 ТОВАРОВ ПО ПРИБЫЛИ:\n")
-        for i, item in enumerate(top_items, 1):
-            file.write(f"  {i:2d}. {item['item_id']} | ${item['recommended_price']:.4f} | ${item['total_profit']:.2f}\n")
+        if mode == 'parity':
+            top_items = sorted(recommendations, key=lambda x: x['profit'], reverse=True)[:10]
+            file.write("ТОП-10 ПАР КЛИЕНТ-ТОВАР ПО ПРИБЫЛИ:\n")
+            for i, item in enumerate(top_items, 1):
+                file.write(f"  {i:2d}. {item['consumer_name']} | {item['item_id']} | "
+                           f"${item['price_rec'] or 0:.4f} | ${item['profit']:.2f}\n")
+        else:
+            top_items = sorted(recommendations, key=lambda x: x['total_profit'], reverse=True)[:10]
+            file.write("ТОП-10 ТОВАРОВ ПО ПРИБЫЛИ:\n")
+            for i, item in enumerate(top_items, 1):
+                file.write(f"  {i:2d}. {item['item_id']} | ${item['recommended_price']:.4f} | ${item['total_profit']:.2f}\n")
     
     print(f"\nРезультаты сохранены:")
     print(f"  Рекомендации: {output_file}")
@@ -205,32 +564,53 @@ def save_results(stats, recommendations):
     
     return output_file, report_file
 
-def main():
-    """Основная функция"""
+def main(argv=None):
+    """Основная функция
+
+    Режим parity (по умолчанию) считает рекомендации по парам клиент-товар
+    той же логикой, что и weekly_pricing.py (пороги config.py, медианы,
+    окна недель); режим simple - прежние правила по товарам.
+    """
+    parser = argparse.ArgumentParser(description="Упрощенный анализ арбитража без внешних зависимостей")
+    parser.add_argument('--mode', choices=['parity', 'simple'], default='parity',
+                        help="parity - как weekly_pricing.py, simple - упрощенные правила по товарам")
+    args = parser.parse_args(argv)
+    
     print("=" * 60)
     print("УПРОЩЕННЫЙ АНАЛИЗ АРБИТРАЖА")
     print("=" * 60)
     
     # Поиск CSV файлов
-    csv_files = [f for f in os.listdir('data') if f.endswith('.csv')]
+    csv_files = sorted(f for f in os.listdir('data') if f.endswith('.csv'))
     if not csv_files:
         print("❌ В папке data/ не найдено CSV файлов!")
         return
     
-    print(f"📁 Найден файл: {csv_files[0]}")
+    print(f"📁 Найдено CSV файлов: {len(csv_files)}")
+    for file in csv_files:
+        print(f"   - {file}")
     
     try:
-        # Загрузка данных
-        data = load_data(os.path.join('data', csv_files[0]))
-        
-        # Анализ
-        stats = analyze_data(data)
+        # Строки читаются по одной и сразу учитываются в суммах
+        paths = [os.path.join('data', f) for f in csv_files]
+        rows = stream_rows(paths)
         
-        # Генерация рекомендаций
-        recommendations = generate_recommendations(stats)
+        if args.mode == 'parity':
+            # Первый проход - последняя дата (конец окон), второй - анализ и агрегаты окна
+            end_date = last_date(paths)
+            if end_date is None:
+                print("❌ Нет строк с датой и товаром!")
+                return
+            aggregates = PricingAggregates(end_date.replace(hour=0, minute=0, second=0, microsecond=0))
+            stats = analyze_data(aggregates.feed(rows))
+            print("\nГенерируем рекомендации...")
+            recommendations = aggregates.recommendations()
+        else:
+            stats = analyze_data(rows)
+            recommendations = generate_recommendations(stats)
         
         # Сохранение результатов
-        save_results(stats, recommendations)
+        save_results(stats, recommendations, args.mode)
         
         # Вывод сводки
         print(f"\n📊 СВОДКА:")
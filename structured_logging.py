@@ -0,0 +1,144 @@
+"""
+Структурированные логи конвейера
+
+Сообщения пишутся через стандартный logging с уровнями. Шаблон сообщения
+ссылается на поля по имени, а сами поля передаются отдельно:
+
+    log = get_logger('data_loader')
+    log.info("Загружено {rows} строк за {seconds:.2f} c", rows=len(df), seconds=elapsed)
+
+Шаблон форматируется только если сообщение действительно выводится,
+поэтому при LOG_LEVEL = "WARNING" (тихий режим) info-сообщения не стоят
+ничего, кроме проверки уровня. В формате "json" каждое сообщение - одна
+строка JSON с полями (файлы, строки, время этапов), в формате "console" -
+текст сообщения, как раньше выводил print().
+
+Уровень и формат задаются в config.py или переменными окружения
+PRICING_LOG_LEVEL / PRICING_LOG_FORMAT.
+"""
+
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from config import LOG_LEVEL, LOG_FORMAT
+
+# Корневой логгер конвейера: библиотечный код без setup_logging() молчит
+ROOT_LOGGER = 'pricing'
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+
+class _Message:
+    """Шаблон и поля; текст собирается при первом обращении"""
+
+    __slots__ = ('template', 'fields')
+
+    def __init__(self, template, fields):
+        self.template = template
+        self.fields = fields
+
+    def __str__(self):
+        return self.template.format(**self.fields) if self.fields else self.template
+
+
+class StructuredLogger:
+    """Логгер с полями: log.info(шаблон, поле=значение, ...)"""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, template, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, _Message(template, fields), exc_info=exc_info,
+                            extra={'fields': fields}, stacklevel=3)
+
+    def debug(self, template, **fields):
+        self.log(DEBUG, template, **fields)
+
+    def info(self, template, **fields):
+        self.log(INFO, template, **fields)
+
+    def warning(self, template, **fields):
+        self.log(WARNING, template, **fields)
+
+    def error(self, template, **fields):
+        self.log(ERROR, template, **fields)
+
+    def exception(self, template, **fields):
+        self.log(ERROR, template, exc_info=True, **fields)
+
+
+class durations(dict):
+    """Время этапов {этап: секунды}: в тексте "read 0.12 c, prepare 0.40 c", в JSON - объект"""
+
+    def __format__(self, spec):
+        return ", ".join(f"{stage} {seconds:.2f} c" for stage, seconds in self.items())
+
+
+def get_logger(name):
+    return StructuredLogger(name)
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна строка JSON на сообщение: время, уровень, логгер, текст и поля"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage().strip()
+        }
+        payload.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=_json_default)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Только текст сообщения, как при выводе через print()"""
+
+    def format(self, record):
+        message = record.getMessage()
+        if record.exc_info:
+            message += '\n' + self.formatException(record.exc_info)
+        return message
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Вывод логов конвейера в stream (по умолчанию stdout)
+
+    Повторный вызов заменяет настройки. Переменные окружения
+    PRICING_LOG_LEVEL и PRICING_LOG_FORMAT важнее аргументов.
+    """
+    level = os.environ.get('PRICING_LOG_LEVEL', level)
+    fmt = os.environ.get('PRICING_LOG_FORMAT', fmt)
+    if fmt not in ('console', 'json'):
+        raise ValueError(f"Неизвестный формат логов: {fmt}")
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else ConsoleFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,23 @@
+"""Бэктест на истории со строками без имени клиента"""
+
+import numpy as np
+
+from backtest import run_backtest
+from create_sample_data import write_sample_data
+from data_loader import DataLoader
+
+
+def test_backtest_with_nameless_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # словарь кодов пишется в текущую папку
+    write_sample_data(str(tmp_path / 'data'), seed=7, days=70, rows_per_day=60, consumers=30)
+    loader = DataLoader()
+    loader.load_files(str(tmp_path / 'data'), workers=1)
+    # Строки в середине истории попадают в окно оцениваемой недели
+    loader.df.loc[loader.df.index[2000:2010], 'consumerName'] = np.nan
+    loader.prepare_data()
+    assert (loader.df['consumer_id'] == -1).sum() == 10
+
+    results = run_backtest(loader, max_weeks=1)
+
+    assert len(results) == 1
+    assert results['items'].iloc[0] > 0
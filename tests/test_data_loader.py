@@ -0,0 +1,45 @@
+"""Потоковые агрегаты совпадают с загрузкой файлов целиком"""
+
+import pandas as pd
+
+from create_sample_data import write_sample_data
+from data_loader import DataLoader, resolve_csv_files
+from pricing_algorithm import PricingAlgorithm
+from config import LOOKBACK_WEEKS
+
+COUNT_COLUMNS = ['reqs', 'sales', 'reqs_hist', 'sales_hist']
+
+
+def test_stream_aggregates_drop_cross_file_duplicates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # словарь кодов пишется в текущую папку
+    folder = tmp_path / 'data'
+    write_sample_data(str(folder), seed=11, days=70, rows_per_day=60, consumers=30)
+    # Каждая выгрузка начинается с последних двух дней предыдущей
+    files = resolve_csv_files(str(folder))
+    tails = []
+    for path in files:
+        frame = pd.read_csv(path)
+        dates = pd.to_datetime(frame['dates'])
+        tails.append(frame[dates >= dates.max().normalize() - pd.Timedelta(days=1)])
+    for tail, path in zip(tails, files[1:]):
+        pd.concat([tail, pd.read_csv(path)]).to_csv(path, index=False)
+
+    loader = DataLoader()
+    loader.load_files(str(folder), workers=1)
+    loader.prepare_data()
+    expected = PricingAlgorithm(workers=1).calculate_consumer_metrics(
+        loader.get_weekly_data(weeks_back=1), loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)
+    )
+    assert loader.manifest['duplicates_dropped'] > 0
+
+    streaming = DataLoader()
+    _, actual = streaming.stream_aggregates(str(folder))
+
+    merged = expected.merge(actual, on=['consumer_id', 'item_id'], suffixes=('', '_stream'))
+    assert len(merged) == len(expected) == len(actual)
+    for col in COUNT_COLUMNS:
+        assert (merged[col] == merged[f'{col}_stream']).all(), col
+
+    summary, stream_summary = loader.get_data_summary(), streaming.stream_summary
+    for key in ['total_rows', 'unique_consumers', 'unique_suppliers', 'unique_items', 'date_range']:
+        assert summary[key] == stream_summary[key], key
@@ -0,0 +1,82 @@
+"""Агрегация DuckDB по файлам совпадает с расчетом по DataFrame"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from create_sample_data import write_sample_data
+from data_loader import DataLoader, resolve_csv_files
+from duckdb_aggregation import DuckDBAggregator
+from pricing_algorithm import PricingAlgorithm
+from config import LOOKBACK_WEEKS
+
+pytest.importorskip('duckdb')
+
+
+def _sorted(recommendations):
+    return recommendations.assign(item_id=recommendations['item_id'].astype(str)) \
+        .sort_values(['consumer_id', 'item_id']).reset_index(drop=True)
+
+
+def test_aggregate_files_matches_pandas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # словарь кодов пишется в текущую папку
+    folder = tmp_path / 'data'
+    write_sample_data(str(folder), seed=3, days=70, rows_per_day=60, consumers=30)
+    files = resolve_csv_files(str(folder))
+    # Файлы пересекаются: начало каждого повторяется в конце следующего
+    for previous, current in zip(files, files[1:]):
+        overlap = pd.read_csv(previous).head(30)
+        overlap.to_csv(current, mode='a', header=False, index=False)
+
+    loader = DataLoader()
+    loader.load_files(str(folder), workers=1)
+    loader.prepare_data()
+    expected = PricingAlgorithm('pandas', workers=1).generate_recommendations(
+        loader.get_weekly_data(weeks_back=1), loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)
+    )
+
+    algorithm = PricingAlgorithm('duckdb', workers=1)
+    supplier_costs, consumer_metrics = algorithm._duckdb().aggregate_files(files, LOOKBACK_WEEKS, loader.dictionary)
+    actual = algorithm.recommend_from_aggregates(supplier_costs, consumer_metrics)
+
+    assert not expected.empty
+    pd.testing.assert_frame_equal(_sorted(actual), _sorted(expected), check_dtype=False, atol=1e-4)
+
+
+def test_last_price_ties_follow_file_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / 'data'
+    folder.mkdir()
+    start = pd.Timestamp('2024-03-01')
+    base = {'producerName': 'supplier', 'countryName': 'us', 'webserviceName': 'email',
+            'producerAmount': 0.04, 'all_orders': 1, 'Profit': 0.01}
+    history = pd.DataFrame([
+        {**base, 'dates': start + pd.Timedelta(hours=6 * n), 'consumerName': f"client_{n % 3}", 'consumerAmount': 0.05}
+        for n in range(4 * 7 * 4)
+    ])
+    # Последние продажи недели с одинаковым временем: побеждает последняя по файлам и строкам
+    tie = start + pd.Timedelta(days=26, hours=23)  # окно недели заканчивается до последнего дня
+    ties = [pd.DataFrame([{**base, 'dates': tie, 'consumerName': name, 'consumerAmount': price}
+                          for name, price in rows])
+            for rows in ([('client_0', 0.061), ('client_0', 0.062), ('client_1', 0.071)],
+                         [('client_0', 0.063), ('client_1', 0.072), ('client_1', 0.073)])]
+    pd.concat([history, ties[0]]).to_csv(folder / 'export_1.csv', index=False)
+    ties[1].to_csv(folder / 'export_2.csv', index=False)
+
+    loader = DataLoader()
+    loader.load_files(str(folder), workers=1)
+    loader.prepare_data()
+    expected = PricingAlgorithm('pandas', workers=1).calculate_consumer_metrics(
+        loader.get_weekly_data(weeks_back=1), loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)
+    )
+
+    for threads in (1, 4):
+        _, actual = DuckDBAggregator(threads=threads).aggregate_files(
+            resolve_csv_files(str(folder)), LOOKBACK_WEEKS, loader.dictionary
+        )
+        merged = expected[['consumer_id', 'last_price']].merge(actual[['consumer_id', 'last_price']], on='consumer_id')
+        assert len(merged) == len(expected)
+        assert (merged['last_price_x'] == merged['last_price_y']).all()
+    names = loader.dictionary.decode('consumer', expected['consumer_id'])
+    assert dict(zip(names, expected['last_price'])) == {'client_0': 0.063, 'client_1': 0.073, 'client_2': 0.05}
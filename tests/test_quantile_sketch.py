@@ -0,0 +1,37 @@
+"""Закупочные цены по скетчам согласованы со скетчами товаров и точным расчетом"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pricing_algorithm import PricingAlgorithm
+from quantile_sketch import item_cost_sketches, sketch_supplier_costs
+
+
+@pytest.fixture(scope='module')
+def historical():
+    rng = np.random.default_rng(5)
+    items = ['US | EMAIL', 'DE | SIGNAL', 'FR | DISCORD']
+    item_id = rng.choice(items, 3000)
+    # Широкий диапазон цен - корзин больше, чем max_bins в тестах
+    prices = rng.lognormal(mean=-3, sigma=1.5, size=3000)
+    prices[::50] = np.nan
+    return pd.DataFrame({'item_id': pd.Categorical(item_id, categories=sorted(items)), 'producerAmount': prices})
+
+
+@pytest.mark.parametrize('max_bins', [2048, 50, 3])
+def test_sketch_costs_match_item_sketches(historical, max_bins):
+    costs = sketch_supplier_costs(historical, max_bins=max_bins).set_index('item_id')
+    for item_id, sketch in item_cost_sketches(historical, max_bins=max_bins).items():
+        expected = np.round(sketch.quantiles([0.5, 0.1, 0.9]), 4)
+        np.testing.assert_allclose(costs.loc[item_id, ['cost_p50', 'cost_p10', 'cost_p90']].to_numpy(dtype=float), expected)
+
+
+def test_sketch_costs_layout_matches_exact(historical):
+    exact = PricingAlgorithm(workers=1).calculate_supplier_costs(historical)
+    sketch = sketch_supplier_costs(historical)
+
+    assert list(sketch.columns) == list(exact.columns)
+    assert sketch['item_id'].dtype == exact['item_id'].dtype
+    pd.testing.assert_series_equal(sketch['item_id'], exact['item_id'])
+    pd.testing.assert_series_equal(sketch['quotes_count'], exact['quotes_count'], check_dtype=False)
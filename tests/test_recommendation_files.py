@@ -0,0 +1,18 @@
+"""Последний файл рекомендаций выбирается по времени запуска в имени"""
+
+import os
+
+from recommendation_files import latest_recommendations
+
+
+def test_latest_by_filename_timestamp_not_mtime(tmp_path):
+    assert latest_recommendations(str(tmp_path)) is None
+    older = tmp_path / 'weekly_pricing_recos_20240301_120000.csv'
+    newer = tmp_path / 'weekly_pricing_recos_20240308_090000.csv'
+    for path in (older, newer):
+        path.write_text('consumer_id\n', encoding='utf-8')
+    (tmp_path / 'weekly_pricing_recos_copy.csv').write_text('consumer_id\n', encoding='utf-8')
+    # Старый файл скопирован позже: mtime новее, но запуск раньше
+    os.utime(newer, (1_000_000_000, 1_000_000_000))
+
+    assert latest_recommendations(str(tmp_path)) == str(newer)
@@ -0,0 +1,23 @@
+"""Запись кеша результатов дополняется недостающими таблицами"""
+
+import pandas as pd
+
+from result_cache import ResultCache
+
+
+def test_put_replaces_entry_missing_tables(tmp_path):
+    cache = ResultCache(folder=str(tmp_path / 'cache'))
+    costs = pd.DataFrame({'item_id': ['US | EMAIL'], 'cost_p50': [0.04]})
+    metrics = pd.DataFrame({'consumer_id': [1], 'item_id': ['US | EMAIL'], 'reqs': [3]})
+    recommendations = pd.DataFrame({'consumer_id': [1], 'price_rec': [0.05]})
+
+    # Расчет по шардам: метрик клиентов нет
+    cache.put('key', {'supplier_costs': costs, 'consumer_metrics': None, 'recommendations': recommendations})
+    assert 'consumer_metrics' not in cache.get('key')
+
+    # Перебор порогов дописывает метрики, повторная неполная запись их не теряет
+    cache.put('key', {'supplier_costs': costs, 'consumer_metrics': metrics, 'recommendations': recommendations})
+    cache.put('key', {'supplier_costs': costs, 'consumer_metrics': None, 'recommendations': recommendations})
+    cached = cache.get('key')
+    pd.testing.assert_frame_equal(cached['consumer_metrics'], metrics)
+    assert [entry[2] for entry in cache.entries()] == ['key']
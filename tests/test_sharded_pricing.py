@@ -0,0 +1,42 @@
+"""Расчет по шардам клиентов совпадает с последовательным"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from create_sample_data import write_sample_data
+from data_loader import DataLoader
+from pricing_algorithm import PricingAlgorithm
+from config import LOOKBACK_WEEKS
+
+
+@pytest.fixture(scope='module')
+def windows(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('sharded')
+    cwd = os.getcwd()
+    os.chdir(folder)  # словарь кодов пишется в текущую папку
+    try:
+        write_sample_data(str(folder / 'data'), seed=7, days=70, rows_per_day=60, consumers=30)
+        loader = DataLoader()
+        loader.load_files(str(folder / 'data'), workers=1)
+        loader.prepare_data()
+        yield loader.get_weekly_data(weeks_back=1), loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('percentile_mode', ['exact', 'sketch'])
+@pytest.mark.parametrize('with_history', [True, False])
+def test_sharded_matches_serial(windows, percentile_mode, with_history):
+    weekly, historical = windows
+    if not with_history:
+        historical = historical.iloc[:0]
+
+    serial = PricingAlgorithm(percentile_mode=percentile_mode, workers=1).generate_recommendations(weekly, historical)
+    sharded = PricingAlgorithm(percentile_mode=percentile_mode, workers=2).generate_recommendations(weekly, historical)
+
+    assert not serial.empty
+    if not with_history:
+        assert (serial['reason'] == 'no_supplier_cost').all()
+    pd.testing.assert_frame_equal(sharded, serial, check_categorical=False)
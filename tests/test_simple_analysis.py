@@ -0,0 +1,54 @@
+"""Потоковое чтение simple_analysis: повторы между файлами и память на них"""
+
+import csv
+import io
+import contextlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+from simple_analysis import FIELDS, stream_rows
+
+DAYS_PER_FILE = 30
+OVERLAP_DAYS = 2
+ROWS_PER_DAY = 50
+
+
+def _rows(start_day, days):
+    start = datetime(2024, 1, 1)
+    for day in range(start_day, start_day + days):
+        for n in range(ROWS_PER_DAY):
+            date = start + timedelta(days=day, minutes=n)
+            yield [f"client_{n % 7}", f"supplier_{n % 3}", "US", "EMAIL",
+                   f"{0.05 + n / 1000:.4f}", "0.04", str(n % 2), "0.01", date.strftime("%Y-%m-%d %H:%M:%S")]
+
+
+def _write_exports(folder, files=4):
+    """Выгрузки по 30 дней, каждая повторяет последние 2 дня предыдущей"""
+    paths = []
+    for index in range(files):
+        path = folder / f"export_{index}.csv"
+        rows = list(_rows(index * (DAYS_PER_FILE - OVERLAP_DAYS), DAYS_PER_FILE))
+        if index == files - 1:
+            rows.append(rows[0])  # повтор внутри файла сохраняется
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(rows)
+        paths.append(str(path))
+    return paths
+
+
+def test_stream_rows_drops_overlap_with_bounded_memory(tmp_path):
+    paths = _write_exports(tmp_path)
+    stats = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows = Counter(stream_rows(paths, stats))
+
+    expected_days = 4 * DAYS_PER_FILE - 3 * OVERLAP_DAYS
+    assert sum(rows.values()) == expected_days * ROWS_PER_DAY + 1
+    assert max(rows.values()) == 2  # только повтор внутри последнего файла
+
+    # Запоминаются строки перекрытий (до и после файла), а не весь файл
+    overlap_rows = OVERLAP_DAYS * ROWS_PER_DAY
+    assert stats['remembered_peak'] <= 3 * overlap_rows + 1
+    assert stats['remembered_peak'] <= DAYS_PER_FILE * ROWS_PER_DAY / 5
@@ -1,114 +1,228 @@
 """
 Скрипт для визуализации результатов анализа
+
+Графики рисуются без экрана (backend Agg): каждый график - отдельный файл
+PNG/SVG в output/charts_<время>/, файлы рисуются в пуле процессов (по
+фигуре на процесс, она перерисовывается для каждого графика). Облака
+точек больше CHART_MAX_POINTS прореживаются детерминированной выборкой, а
+крупные облака растрируются, поэтому SVG не раздувается.
+
+    python visualize_results.py                   # графики и текстовый отчет
+    python visualize_results.py --per-consumer    # еще и графики каждого клиента
+    python visualize_results.py --format png,svg --workers 4
+    python visualize_results.py --combined        # еще и все графики на одной фигуре
+    python visualize_results.py --show            # общая фигура в окне (нужен дисплей)
 """
 
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-def visualize_pricing_results(csv_file=None):
-    """Визуализация результатов ценообразования"""
-    
-    # Поиск последнего файла результатов
+import pandas as pd
+
+from consumer_reports import consumer_slug
+from recommendation_files import latest_recommendations
+from config import (OUTPUT_FOLDER, CHART_FORMATS, CHART_DPI, CHART_WORKERS,
+                    CHART_MAX_POINTS, CHART_RASTERIZE_POINTS)
+
+# Размер фигуры одного графика, дюймов
+CHART_SIZE = (7, 5)
+
+# Фигура процесса-рисовальщика (создается один раз при запуске процесса)
+_worker = {}
+
+
+def _pyplot(headless=True):
+    """matplotlib.pyplot; без экрана - с backend Agg (plt.show() не блокирует)"""
+    import matplotlib
+    if headless:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def downsample(df, max_points=CHART_MAX_POINTS):
+    """Не больше max_points строк: одна и та же выборка при каждом запуске"""
+    if len(df) <= max_points:
+        return df
+    return df.sample(n=max_points, random_state=0).sort_index()
+
+
+def _price_distribution(ax, df):
+    enabled_data = df[df['enabled'] == True]
+    if enabled_data.empty:
+        return False
+    ax.hist(enabled_data['price_rec'], bins=30, alpha=0.7, color='skyblue', edgecolor='black', histtype='stepfilled')
+    ax.set_title('Распределение рекомендуемых цен')
+    ax.set_xlabel('Цена ($)')
+    ax.set_ylabel('Количество')
+    ax.grid(True, alpha=0.3)
+
+
+def _margin_distribution(ax, df):
+    enabled_data = df[df['enabled'] == True]
+    if enabled_data.empty:
+        return False
+    ax.hist(enabled_data['target_margin'] * 100, bins=30, alpha=0.7, color='lightgreen', edgecolor='black', histtype='stepfilled')
+    ax.set_title('Распределение целевой маржи')
+    ax.set_xlabel('Маржа (%)')
+    ax.set_ylabel('Количество')
+    ax.grid(True, alpha=0.3)
+
+
+def _status(ax, df):
+    if df.empty:
+        return False
+    # Порядок подписей не зависит от того, каких товаров больше
+    status_counts = df['enabled'].astype(bool).value_counts().reindex([False, True], fill_value=0)
+    ax.pie(status_counts.values, labels=['Отключено', 'Включено'],
+           autopct='%1.1f%%', colors=['lightcoral', 'lightgreen'], startangle=90)
+    ax.set_title('Статус товаров')
+
+
+def _conversion_vs_price(ax, df):
+    enabled_data = df[df['enabled'] == True]
+    if enabled_data.empty:
+        return False
+    points = downsample(enabled_data)
+    scatter = ax.scatter(points['conversion_rate'] * 100, points['price_rec'],
+                         c=points['target_margin'] * 100, cmap='viridis', alpha=0.6,
+                         rasterized=len(points) > CHART_RASTERIZE_POINTS)
+    title = 'Конверсия vs Цена'
+    if len(points) < len(enabled_data):
+        title += f' (выборка {len(points):,} из {len(enabled_data):,})'
+    ax.set_title(title)
+    ax.set_xlabel('Конверсия (%)')
+    ax.set_ylabel('Цена ($)')
+    ax.grid(True, alpha=0.3)
+
+    # Добавляем цветовую шкалу
+    cbar = ax.figure.colorbar(scatter, ax=ax)
+    cbar.set_label('Маржа (%)')
+
+
+def _top_prices(ax, df):
+    enabled_data = df[df['enabled'] == True]
+    if enabled_data.empty:
+        return False
+    top_items = enabled_data.nlargest(10, 'price_rec')
+    ax.barh(range(len(top_items)), top_items['price_rec'], color='orange', alpha=0.7)
+    ax.set_title('Топ-10 товаров по цене')
+    ax.set_xlabel('Цена ($)')
+    ax.set_yticks(range(len(top_items)))
+    ax.set_yticklabels([f"{item_id[:20]}..." for item_id in top_items['item_id']], fontsize=8)
+    ax.grid(True, alpha=0.3)
+
+
+def _disabled_reasons(ax, df):
+    disabled_data = df[df['enabled'] == False]
+    if disabled_data.empty:
+        return False
+    reason_counts = disabled_data['reason'].value_counts()
+    ax.bar(range(len(reason_counts)), reason_counts.values, color='lightcoral', alpha=0.7)
+    ax.set_title('Причины отключения товаров')
+    ax.set_xlabel('Причина')
+    ax.set_ylabel('Количество')
+    ax.set_xticks(range(len(reason_counts)))
+    ax.set_xticklabels(reason_counts.index, rotation=45, ha='right', fontsize=8)
+    ax.grid(True, alpha=0.3)
+
+
+# Графики: имя файла -> (нужные колонки, функция рисования, поля фигуры);
+# функция возвращает False, если рисовать нечего (файл тогда не пишется).
+# Поля заданы заранее: bbox_inches='tight' перерисовывает фигуру второй раз
+CHARTS = {
+    'price_distribution': (['enabled', 'price_rec'], _price_distribution, {}),
+    'margin_distribution': (['enabled', 'target_margin'], _margin_distribution, {}),
+    'status': (['enabled'], _status, {}),
+    'conversion_vs_price': (['enabled', 'conversion_rate', 'price_rec', 'target_margin'], _conversion_vs_price, {}),
+    'top_prices': (['enabled', 'price_rec', 'item_id'], _top_prices, {'left': 0.26}),
+    'disabled_reasons': (['enabled', 'reason'], _disabled_reasons, {'bottom': 0.25})
+}
+
+# Поля фигуры одного графика по умолчанию (доли ширины и высоты)
+CHART_MARGINS = {'left': 0.12, 'right': 0.95, 'bottom': 0.12, 'top': 0.92}
+
+
+def _init_worker(dpi):
+    plt = _pyplot()
+    _worker['figure'] = plt.figure(figsize=CHART_SIZE, dpi=dpi)
+
+
+def _render_chart(task):
+    """Один график в файлы path.<формат>; список записанных файлов"""
+    name, frame, path, formats = task
+    _, draw, margins = CHARTS[name]
+    fig = _worker['figure']
+    fig.clf()
+    fig.subplots_adjust(**{**CHART_MARGINS, **margins})
+    if draw(fig.add_subplot(), frame) is False:
+        return []
+    files = []
+    for fmt in formats:
+        output_file = f"{path}.{fmt}"
+        # Запись через временный файл: читатель не увидит недорисованный график
+        fig.savefig(output_file + '.tmp', format=fmt)
+        os.replace(output_file + '.tmp', output_file)
+        files.append(output_file)
+    return files
+
+
+def chart_tasks(df, folder, formats=CHART_FORMATS, per_consumer=False):
+    """Задачи рисования: общие графики и (по желанию) графики каждого клиента"""
+    frames = [(folder, df)]
+    if per_consumer:
+        for (consumer_id, consumer_name), consumer_df in df.groupby(['consumer_id', 'consumer_name'], sort=False):
+            frames.append((os.path.join(folder, 'consumers', consumer_slug(consumer_id, consumer_name)), consumer_df))
+
+    tasks = []
+    for frame_folder, frame in frames:
+        os.makedirs(frame_folder, exist_ok=True)
+        for name, (columns, _, _) in CHARTS.items():
+            # В процесс передаются только колонки графика
+            tasks.append((name, frame[columns], os.path.join(frame_folder, name), formats))
+    return tasks
+
+
+def render_charts(csv_file=None, folder=None, formats=CHART_FORMATS, per_consumer=False,
+                  workers=CHART_WORKERS, dpi=CHART_DPI):
+    """Файл на график без экрана; список записанных файлов"""
     if csv_file is None:
-        output_files = [f for f in os.listdir('output') if f.startswith('weekly_pricing_recos_') and f.endswith('.csv')]
-        if not output_files:
+        csv_file = latest_recommendations()
+        if csv_file is None:
             print("❌ Не найдено файлов результатов в папке output/")
-            return
-        
-        csv_file = os.path.join('output', sorted(output_files)[-1])
-    
-    print(f"📊 Загружаем результаты из {csv_file}")
+            return []
+    if folder is None:
+        folder = os.path.join(OUTPUT_FOLDER, f"charts_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+    started = datetime.now()
     df = pd.read_csv(csv_file)
-    
-    # Настройка стиля
-    plt.style.use('default')
-    sns.set_palette("husl")
-    
-    # Создание фигуры с несколькими графиками
-    fig, axes = plt.subplots(2, 3, figsize=(18, 12))
-    fig.suptitle('Анализ рекомендаций по ценообразованию', fontsize=16, fontweight='bold')
-    
-    # 1. Распределение рекомендуемых цен
+    tasks = chart_tasks(df, folder, formats, per_consumer)
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+
+    if workers <= 1:
+        _init_worker(dpi)
+        parts = [_render_chart(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dpi,)) as executor:
+            parts = list(executor.map(_render_chart, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    files = [output_file for part in parts for output_file in part]
+    seconds = (datetime.now() - started).total_seconds()
+    print(f"📊 Графиков: {len(files)} файлов за {seconds:.1f} c ({workers} процессов): {folder}")
+    return files
+
+
+def print_summary(df):
+    """Сводная статистика в консоль"""
     enabled_data = df[df['enabled'] == True]
-    if not enabled_data.empty:
-        axes[0, 0].hist(enabled_data['price_rec'], bins=30, alpha=0.7, color='skyblue', edgecolor='black')
-        axes[0, 0].set_title('Распределение рекомендуемых цен')
-        axes[0, 0].set_xlabel('Цена ($)')
-        axes[0, 0].set_ylabel('Количество')
-        axes[0, 0].grid(True, alpha=0.3)
-    
-    # 2. Распределение маржи
-    if not enabled_data.empty:
-        axes[0, 1].hist(enabled_data['target_margin'] * 100, bins=30, alpha=0.7, color='lightgreen', edgecolor='black')
-        axes[0, 1].set_title('Распределение целевой маржи')
-        axes[0, 1].set_xlabel('Маржа (%)')
-        axes[0, 1].set_ylabel('Количество')
-        axes[0, 1].grid(True, alpha=0.3)
-    
-    # 3. Статус товаров (включено/отключено)
-    status_counts = df['enabled'].value_counts()
-    colors = ['lightcoral', 'lightgreen']
-    axes[0, 2].pie(status_counts.values, labels=['Отключено', 'Включено'], 
-                   autopct='%1.1f%%', colors=colors, startangle=90)
-    axes[0, 2].set_title('Статус товаров')
-    
-    # 4. Конверсия vs Цена
-    if not enabled_data.empty:
-        scatter = axes[1, 0].scatter(enabled_data['conversion_rate'] * 100, 
-                                   enabled_data['price_rec'], 
-                                   c=enabled_data['target_margin'] * 100, 
-                                   cmap='viridis', alpha=0.6)
-        axes[1, 0].set_title('Конверсия vs Цена')
-        axes[1, 0].set_xlabel('Конверсия (%)')
-        axes[1, 0].set_ylabel('Цена ($)')
-        axes[1, 0].grid(True, alpha=0.3)
-        
-        # Добавляем цветовую шкалу
-        cbar = plt.colorbar(scatter, ax=axes[1, 0])
-        cbar.set_label('Маржа (%)')
-    
-    # 5. Топ-10 товаров по цене
-    if not enabled_data.empty:
-        top_items = enabled_data.nlargest(10, 'price_rec')
-        axes[1, 1].barh(range(len(top_items)), top_items['price_rec'], color='orange', alpha=0.7)
-        axes[1, 1].set_title('Топ-10 товаров по цене')
-        axes[1, 1].set_xlabel('Цена ($)')
-        axes[1, 1].set_yticks(range(len(top_items)))
-        axes[1, 1].set_yticklabels([f"{row['item_id'][:20]}..." for _, row in top_items.iterrows()], fontsize=8)
-        axes[1, 1].grid(True, alpha=0.3)
-    
-    # 6. Причины отключения товаров
     disabled_data = df[df['enabled'] == False]
-    if not disabled_data.empty:
-        reason_counts = disabled_data['reason'].value_counts()
-        axes[1, 2].bar(range(len(reason_counts)), reason_counts.values, color='lightcoral', alpha=0.7)
-        axes[1, 2].set_title('Причины отключения товаров')
-        axes[1, 2].set_xlabel('Причина')
-        axes[1, 2].set_ylabel('Количество')
-        axes[1, 2].set_xticks(range(len(reason_counts)))
-        axes[1, 2].set_xticklabels(reason_counts.index, rotation=45, ha='right', fontsize=8)
-        axes[1, 2].grid(True, alpha=0.3)
-    
-    plt.tight_layout()
-    
-    # Сохранение графика
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = os.path.join('output', f'pricing_analysis_{timestamp}.png')
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
-    print(f"📊 График сохранен: {output_file}")
-    
-    # Показываем график
-    plt.show()
-    
-    # Выводим сводную статистику
     print(f"\n📈 СВОДНАЯ СТАТИСТИКА:")
     print(f"   Всего товаров: {len(df)}")
     print(f"   Включено: {len(enabled_data)} ({len(enabled_data)/len(df)*100:.1f}%)")
     print(f"   Отключено: {len(disabled_data)} ({len(disabled_data)/len(df)*100:.1f}%)")
-    
+
     if not enabled_data.empty:
         print(f"   Средняя рекомендуемая цена: ${enabled_data['price_rec'].mean():.4f}")
         print(f"   Медианная рекомендуемая цена: ${enabled_data['price_rec'].median():.4f}")
@@ -116,17 +230,57 @@ def visualize_pricing_results(csv_file=None):
         print(f"   Медианная маржа: {enabled_data['target_margin'].median()*100:.1f}%")
         print(f"   Общая прибыль: ${enabled_data['profit'].sum():,.2f}")
 
+
+def visualize_pricing_results(csv_file=None, show=False):
+    """Все графики на одной фигуре (pricing_analysis_*.png, CHART_DPI)
+
+    Фигура рисуется в текущем процессе после render_charts, поэтому только
+    по запросу (--combined или --show). Без show - без экрана; с show
+    открывается окно.
+    """
+    plt = _pyplot(headless=not show)
+
+    # Поиск последнего файла результатов
+    if csv_file is None:
+        csv_file = latest_recommendations()
+        if csv_file is None:
+            print("❌ Не найдено файлов результатов в папке output/")
+            return
+
+    print(f"📊 Загружаем результаты из {csv_file}")
+    df = pd.read_csv(csv_file)
+
+    # Создание фигуры с несколькими графиками
+    plt.style.use('default')
+    fig, axes = plt.subplots(2, 3, figsize=(18, 12))
+    fig.suptitle('Анализ рекомендаций по ценообразованию', fontsize=16, fontweight='bold')
+    for ax, (columns, draw, _) in zip(axes.flat, CHARTS.values()):
+        draw(ax, df[columns])
+
+    plt.tight_layout()
+
+    # Сохранение графика
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_file = os.path.join('output', f'pricing_analysis_{timestamp}.png')
+    plt.savefig(output_file, dpi=CHART_DPI)
+    print(f"📊 График сохранен: {output_file}")
+
+    if show:
+        plt.show()
+    plt.close(fig)
+
+    print_summary(df)
+    return output_file
+
 def create_summary_report(csv_file=None):
     """Создание текстового отчета"""
     
     # Поиск последнего файла результатов
     if csv_file is None:
-        output_files = [f for f in os.listdir('output') if f.startswith('weekly_pricing_recos_') and f.endswith('.csv')]
-        if not output_files:
+        csv_file = latest_recommendations()
+        if csv_file is None:
             print("❌ Не найдено файлов результатов в папке output/")
             return
-        
-        csv_file = os.path.join('output', sorted(output_files)[-1])
     
     df = pd.read_csv(csv_file)
     
@@ -178,15 +332,32 @@ def create_summary_report(csv_file=None):
     
     print(f"📄 Отчет сохранен: {report_file}")
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Графики и отчет по рекомендациям")
+    parser.add_argument('--file', help="файл рекомендаций (по умолчанию последний в output/)")
+    parser.add_argument('--format', default=','.join(CHART_FORMATS), help="форматы файлов графиков: png,svg")
+    parser.add_argument('--per-consumer', action='store_true', help="графики каждого клиента")
+    parser.add_argument('--workers', type=int, default=CHART_WORKERS, help="процессов (по умолчанию по числу ядер)")
+    parser.add_argument('--combined', action='store_true', help="еще и все графики на одной фигуре")
+    parser.add_argument('--show', action='store_true', help="показать общую фигуру в окне (включает --combined)")
+    args = parser.parse_args(argv)
+
     # Проверяем наличие папки output
     if not os.path.exists('output'):
         print("❌ Папка output/ не найдена. Сначала запустите weekly_pricing.py")
-        exit(1)
-    
-    # Визуализация
-    visualize_pricing_results()
-    
-    # Создание отчета
-    create_summary_report()
+        return 1
 
+    # Графики по одному в файл, общая фигура (по запросу) и отчет
+    render_charts(args.file, formats=args.format.split(','), per_consumer=args.per_consumer, workers=args.workers)
+    if args.combined or args.show:
+        visualize_pricing_results(args.file, show=args.show)
+    else:
+        csv_file = args.file or latest_recommendations()
+        if csv_file is not None:
+            print_summary(pd.read_csv(csv_file))
+    create_summary_report(args.file)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -2,148 +2,322 @@
 Основной скрипт для еженедельного анализа и генерации рекомендаций по ценообразованию
 """
 
-import pandas as pd
-import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sys
 
-from data_loader import DataLoader
+from data_loader import DataLoader, resolve_csv_files
 from pricing_algorithm import PricingAlgorithm
+from aggregate_store import WeeklyAggregateStore
+from result_cache import ResultCache
+from instrumentation import RECORDER, instrumented, stage
+from structured_logging import INFO, get_logger, setup_logging
 from config import (
-    DATA_FOLDER, OUTPUT_FOLDER, BACKUP_FOLDER,
-    LOOKBACK_WEEKS, CURRENT_WEEK_DAYS,
-    DATE_FORMAT
+    DATA_FOLDER, OUTPUT_FOLDER, BACKUP_FOLDER, PARQUET_FOLDER,
+    LOOKBACK_WEEKS, CURRENT_WEEK_DAYS, INCREMENTAL_AGGREGATES,
+    STREAMING_MODE, DATE_FORMAT, RESULT_CACHE, RUN_REPORT, PROMETHEUS_TEXTFILE, CONSUMER_REPORTS
 )
 
+# Колонки итогового отчета
+REPORT_COLUMNS = [
+    'consumer_id', 'consumer_name', 'item_id', 'enabled', 'price_rec',
+    'baseline_cost', 'target_margin', 'reason', 'reqs', 'sales',
+    'reqs_hist', 'sales_hist', 'conversion_rate', 'conversion_rate_hist', 'profit'
+]
+
+# Сводки запуска в логах (поля - ключи get_data_summary и get_summary_stats)
+DATA_SUMMARY_MESSAGE = (
+    "\n📈 СВОДКА ПО ДАННЫМ:"
+    "\n   Всего строк: {total_rows:,}"
+    "\n   Период: {date_range[0]:" + DATE_FORMAT + "} - {date_range[1]:" + DATE_FORMAT + "}"
+    "\n   Уникальных клиентов: {unique_consumers}"
+    "\n   Уникальных поставщиков: {unique_suppliers}"
+    "\n   Уникальных товаров: {unique_items}"
+    "\n   Общая прибыль: ${total_profit:,.2f}"
+    "\n   Средняя цена продажи: ${avg_sell_price:.2f}"
+    "\n   Средняя цена закупки: ${avg_buy_price:.2f}"
+)
+STATS_MESSAGE = (
+    "\n📊 СТАТИСТИКА РЕКОМЕНДАЦИЙ:"
+    "\n   Всего товаров: {total_items}"
+    "\n   Включить: {enabled_items}"
+    "\n   Отключить: {disabled_items}"
+    "\n   Средняя рекомендуемая цена: ${avg_recommended_price}"
+    "\n   Средняя целевая маржа: {avg_target_margin:.1%}"
+    "\n   Общая прибыль: ${total_profit:,.2f}"
+)
+
+log = get_logger('weekly_pricing')
+
+
+def build_final_report(recommendations, consumer_mapping):
+    """Итоговый отчет: имена клиентов и колонки в удобном порядке"""
+    final_report = recommendations.copy()
+    
+    # Добавляем человеко-читаемые названия
+    if 'consumer_id' in final_report.columns:
+        final_report['consumer_name'] = final_report['consumer_id'].map(consumer_mapping)
+    
+    # Оставляем только существующие колонки
+    existing_columns = [col for col in REPORT_COLUMNS if col in final_report.columns]
+    return final_report[existing_columns]
+
+
+def save_report(final_report, output_file):
+    """Атомарная запись отчета: читатели не увидят недописанный файл"""
+    with stage('write_report', rows_in=len(final_report)):
+        tmp_file = output_file + '.tmp'
+        final_report.to_csv(tmp_file, index=False, encoding='utf-8')
+        os.replace(tmp_file, output_file)
+    return output_file
+
+
+def save_run_report(timestamp):
+    """Замеры этапов запуска: JSON в OUTPUT_FOLDER и файл Prometheus, если задан"""
+    if RUN_REPORT:
+        report_file = RECORDER.save_json(os.path.join(OUTPUT_FOLDER, f"run_report_{timestamp}.json"))
+        log.info("💾 Замеры этапов: {path}", path=report_file)
+    if PROMETHEUS_TEXTFILE:
+        RECORDER.save_prometheus(PROMETHEUS_TEXTFILE, labels={'job': 'weekly_pricing'})
+    
+    if log.isEnabledFor(INFO):
+        totals = [total for total in RECORDER.totals() if total['stage'] != 'select_window']
+        lines = "".join(
+            f"\n   {total['stage']:<36} {total['wall_seconds']:8.2f} c  CPU {total['cpu_seconds']:8.2f} c"
+            for total in totals
+        )
+        log.info("⏱️ Время этапов:{lines}", lines=lines, stages=totals)
+
+
+def analyze_files(source, output_file, progress=None, dictionary=None):
+    """Полный анализ CSV (папка, шаблон или файл) с записью отчета в output_file
+
+    progress(stage, fraction) вызывается перед каждым этапом. Возвращает
+    сводку по рекомендациям. Используется фоновыми заданиями сервиса.
+    """
+    def report(stage, fraction):
+        if progress is not None:
+            progress(stage, fraction)
+    
+    RECORDER.reset()
+    loader = DataLoader()
+    if dictionary is not None:
+        loader.dictionary = dictionary
+    algorithm = PricingAlgorithm()
+    
+    report('loading', 0.1)
+    loader.load_files(source, workers=1)
+    report('preparing', 0.3)
+    loader.prepare_data()
+    
+    report('aggregating', 0.5)
+    weekly_data = loader.get_weekly_data(weeks_back=1)
+    if weekly_data.empty:
+        raise ValueError("Нет данных за последнюю неделю")
+    historical_data = loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)
+    
+    report('recommending', 0.7)
+    recommendations = algorithm.generate_recommendations(weekly_data, historical_data)
+    
+    report('writing', 0.9)
+    save_report(build_final_report(recommendations, loader.consumer_mapping()), output_file)
+    return algorithm.get_summary_stats()
+
+
+def input_files():
+    """Входные файлы анализа: недельный Parquet, если он есть, иначе CSV из DATA_FOLDER"""
+    if os.path.isdir(PARQUET_FOLDER) and os.listdir(PARQUET_FOLDER):
+        return sorted(
+            os.path.join(root, name) for root, _, names in os.walk(PARQUET_FOLDER)
+            for name in names if name.endswith('.parquet')
+        )
+    return resolve_csv_files(DATA_FOLDER)
+
+
+@instrumented('compute_recommendations')
+def compute_recommendations(loader, algorithm):
+    """Загрузка, подготовка и расчет рекомендаций (None - нет данных за неделю)"""
+    store = WeeklyAggregateStore() if INCREMENTAL_AGGREGATES else None
+    covered_from = None
+    streamed = None
+    
+    if algorithm.backend == 'duckdb' and store is None:
+        # DuckDB агрегирует прямо по файлам, DataFrame не строится
+        files = input_files()
+        log.info("\n🦆 Агрегируем {file_count} файлов в DuckDB...", file_count=len(files), input_files=files)
+        aggregator = algorithm._duckdb()
+        streamed = aggregator.aggregate_files(files, LOOKBACK_WEEKS, loader.dictionary)
+        loader.stream_summary = aggregator.data_summary()
+    elif os.path.isdir(PARQUET_FOLDER) and os.listdir(PARQUET_FOLDER):
+        # Недельный Parquet: читаются только нужные недели и колонки
+        weeks_to_load = LOOKBACK_WEEKS
+        if store is not None:
+            # Прошлые недели уже есть в хранилище агрегатов
+            end_date = loader.parquet_max_date().normalize()
+            weeks_to_load = store.weeks_to_load(end_date, LOOKBACK_WEEKS)
+            covered_from = end_date - timedelta(weeks=weeks_to_load)
+        log.info("📦 Загружаем Parquet-данные из {folder} за {weeks} недель...", folder=PARQUET_FOLDER, weeks=weeks_to_load)
+        df = loader.load_parquet(weeks_back=weeks_to_load)
+    else:
+        csv_files = resolve_csv_files(DATA_FOLDER)
+        if log.isEnabledFor(INFO):
+            log.info("📁 Найдено CSV файлов: {file_count}{names}", file_count=len(csv_files),
+                     names="".join(f"\n   - {os.path.basename(file)}" for file in csv_files),
+                     input_files=csv_files)
+        
+        if STREAMING_MODE:
+            # Файлы читаются блоками и сразу сворачиваются в агрегаты
+            log.info("\n🌊 Потоковая обработка {file_count} файлов...", file_count=len(csv_files))
+            streamed = loader.stream_aggregates(DATA_FOLDER, weeks_back=LOOKBACK_WEEKS)
+        else:
+            # Загружаем все CSV файлы параллельно
+            log.info("\n📊 Загружаем данные из {file_count} файлов...", file_count=len(csv_files))
+            df = loader.load_files(DATA_FOLDER)
+    
+    # Подготовка данных
+    if streamed is None:
+        df = loader.prepare_data()
+    
+    # Получение сводки по данным
+    if log.isEnabledFor(INFO):
+        log.info(DATA_SUMMARY_MESSAGE, **loader.get_data_summary())
+    
+    if streamed is not None:
+        supplier_costs, consumer_metrics = streamed
+        if consumer_metrics.empty:
+            log.error("❌ Нет данных за последнюю неделю!")
+            return None
+        
+        log.info("\n🎯 Генерируем рекомендации...")
+        recommendations = algorithm.recommend_from_aggregates(supplier_costs, consumer_metrics)
+    else:
+        # Получение данных за текущую неделю
+        log.info("\n📅 Анализируем данные за последнюю неделю...")
+        weekly_data = loader.get_weekly_data(weeks_back=1)
+        
+        if weekly_data.empty:
+            log.error("❌ Нет данных за последнюю неделю!")
+            return None
+        
+        # Генерация рекомендаций
+        if store is not None:
+            log.info("\n🎯 Генерируем рекомендации (история из {folder})...", folder=store.folder)
+            recommendations = algorithm.generate_recommendations_incremental(
+                weekly_data, df, store, LOOKBACK_WEEKS, covered_from=covered_from
+            )
+        else:
+            # Получение исторических данных
+            log.info("📚 Загружаем исторические данные за {weeks} недель...", weeks=LOOKBACK_WEEKS)
+            historical_data = loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)
+            
+            log.info("\n🎯 Генерируем рекомендации...")
+            recommendations = algorithm.generate_recommendations(weekly_data, historical_data)
+    
+    return recommendations
+
+
 def main():
     """Основная функция для запуска анализа"""
-    print("=" * 60)
-    print("АНАЛИЗ АРБИТРАЖА - ЕЖЕНЕДЕЛЬНЫЕ РЕКОМЕНДАЦИИ")
-    print("=" * 60)
+    setup_logging()
+    log.info("=" * 60 + "\nАНАЛИЗ АРБИТРАЖА - ЕЖЕНЕДЕЛЬНЫЕ РЕКОМЕНДАЦИИ\n" + "=" * 60)
     
     # Проверяем наличие папок
     for folder in [DATA_FOLDER, OUTPUT_FOLDER, BACKUP_FOLDER]:
         if not os.path.exists(folder):
             os.makedirs(folder)
-            print(f"Создана папка: {folder}")
+            log.info("Создана папка: {folder}", folder=folder)
     
     # Инициализация
+    RECORDER.reset()
     loader = DataLoader()
     algorithm = PricingAlgorithm()
     
     try:
-        # Поиск CSV файлов в папке data
-        csv_files = [f for f in os.listdir(DATA_FOLDER) if f.endswith('.csv')]
-        if not csv_files:
-            print(f"❌ В папке {DATA_FOLDER} не найдено CSV файлов!")
-            print("Поместите ваши CSV файлы в папку data/ и запустите скрипт снова.")
-            return
-        
-        print(f"📁 Найдено CSV файлов: {len(csv_files)}")
-        for file in csv_files:
-            print(f"   - {file}")
-        
-        # Загружаем первый CSV файл (можно расширить для обработки нескольких файлов)
-        main_file = csv_files[0]
-        print(f"\n📊 Загружаем данные из {main_file}...")
-        
-        # Загрузка и подготовка данных
-        df = loader.load_csv(main_file)
-        df = loader.prepare_data()
-        
-        # Получение сводки по данным
-        summary = loader.get_data_summary()
-        print(f"\n📈 СВОДКА ПО ДАННЫМ:")
-        print(f"   Всего строк: {summary['total_rows']:,}")
-        print(f"   Период: {summary['date_range'][0].strftime(DATE_FORMAT)} - {summary['date_range'][1].strftime(DATE_FORMAT)}")
-        print(f"   Уникальных клиентов: {summary['unique_consumers']}")
-        print(f"   Уникальных поставщиков: {summary['unique_suppliers']}")
-        print(f"   Уникальных товаров: {summary['unique_items']}")
-        print(f"   Общая прибыль: ${summary['total_profit']:,.2f}")
-        print(f"   Средняя цена продажи: ${summary['avg_sell_price']:.2f}")
-        print(f"   Средняя цена закупки: ${summary['avg_buy_price']:.2f}")
-        
-        # Получение данных за текущую неделю
-        print(f"\n📅 Анализируем данные за последнюю неделю...")
-        weekly_data = loader.get_weekly_data(weeks_back=1)
-        
-        if weekly_data.empty:
-            print("❌ Нет данных за последнюю неделю!")
+        files = input_files()
+        if not files:
+            log.error("❌ В папке {folder} не найдено CSV файлов!\n"
+                      "Поместите ваши CSV файлы в папку data/ и запустите скрипт снова.", folder=DATA_FOLDER)
             return
         
-        # Получение исторических данных
-        print(f"📚 Загружаем исторические данные за {LOOKBACK_WEEKS} недель...")
-        historical_data = loader.get_historical_data(weeks_back=LOOKBACK_WEEKS)
+        # Те же входные файлы и настройки - рекомендации берутся из кеша
+        cache = ResultCache() if RESULT_CACHE else None
+        with stage('cache_lookup'):
+            cache_key = cache.key(files) if cache is not None else None
+            cached = cache.get(cache_key) if cache is not None else None
         
-        # Генерация рекомендаций
-        print(f"\n🎯 Генерируем рекомендации...")
-        recommendations = algorithm.generate_recommendations(weekly_data, historical_data)
+        if cached is not None:
+            log.info("\n♻️ Входные данные и настройки не менялись: рекомендации из кеша {folder} ({key:.12})",
+                     folder=cache.folder, key=cache_key, input_files=files)
+            recommendations = algorithm.recommendations = cached['recommendations']
+        else:
+            recommendations = compute_recommendations(loader, algorithm)
+            if recommendations is None:
+                return
+            if cache is not None:
+                with stage('cache_store', rows_in=len(recommendations)):
+                    cache.put(cache_key, {
+                        'supplier_costs': algorithm.supplier_costs,
+                        'consumer_metrics': algorithm.consumer_metrics,
+                        'recommendations': recommendations
+                    }, input_files=len(files))
         
         # Статистика по рекомендациям
-        stats = algorithm.get_summary_stats()
-        print(f"\n📊 СТАТИСТИКА РЕКОМЕНДАЦИЙ:")
-        print(f"   Всего товаров: {stats['total_items']}")
-        print(f"   Включить: {stats['enabled_items']}")
-        print(f"   Отключить: {stats['disabled_items']}")
-        print(f"   Средняя рекомендуемая цена: ${stats['avg_recommended_price']}")
-        print(f"   Средняя целевая маржа: {stats['avg_target_margin']:.1%}")
-        print(f"   Общая прибыль: ${stats['total_profit']:,.2f}")
+        if log.isEnabledFor(INFO):
+            log.info(STATS_MESSAGE, **algorithm.get_summary_stats())
         
         # Сохранение результатов
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_file = os.path.join(OUTPUT_FOLDER, f"weekly_pricing_recos_{timestamp}.csv")
         
         # Подготовка финального отчета
-        final_report = recommendations.copy()
-        
-        # Добавляем человеко-читаемые названия
-        if 'consumer_id' in final_report.columns:
-            # Создаем маппинг ID -> название клиента
-            consumer_mapping = df.groupby('consumer_id')['consumerName'].first().to_dict()
-            final_report['consumer_name'] = final_report['consumer_id'].map(consumer_mapping)
-        
-        # Переупорядочиваем колонки для удобства
-        columns_order = [
-            'consumer_id', 'consumer_name', 'item_id', 'enabled', 'price_rec',
-            'baseline_cost', 'target_margin', 'reason', 'reqs', 'sales',
-            'reqs_hist', 'sales_hist', 'conversion_rate', 'conversion_rate_hist', 'profit'
-        ]
+        final_report = build_final_report(recommendations, loader.consumer_mapping())
         
-        # Оставляем только существующие колонки
-        existing_columns = [col for col in columns_order if col in final_report.columns]
-        final_report = final_report[existing_columns]
-        
-        # Сохранение
-        final_report.to_csv(output_file, index=False, encoding='utf-8')
-        print(f"\n💾 Результаты сохранены в: {output_file}")
+        # Сохранение (атомарно: сервис цен не должен увидеть недописанный файл)
+        save_report(final_report, output_file)
+        log.info("\n💾 Результаты сохранены в: {path}", path=output_file, rows=len(final_report))
         
         # Создание резервной копии
         backup_file = os.path.join(BACKUP_FOLDER, f"backup_{timestamp}.csv")
         final_report.to_csv(backup_file, index=False, encoding='utf-8')
-        print(f"💾 Резервная копия: {backup_file}")
+        log.info("💾 Резервная копия: {path}", path=backup_file)
+        
+        # Состав входных файлов
+        if loader.manifest is not None:
+            manifest_file = loader.save_manifest(os.path.join(OUTPUT_FOLDER, f"manifest_{timestamp}.json"))
+            log.info("💾 Состав входных файлов: {path}", path=manifest_file)
+        
+        # Отчет каждому клиенту (изменения цен - против рекомендаций прошлой недели)
+        if CONSUMER_REPORTS:
+            from consumer_reports import write_consumer_reports, previous_recommendations, read_previous
+            previous_file = previous_recommendations(output_file)
+            with stage('consumer_reports', rows_in=len(final_report)):
+                write_consumer_reports(final_report, read_previous(previous_file),
+                                       source=output_file, previous_source=previous_file)
         
-        # Показываем топ-5 рекомендаций
-        print(f"\n🏆 ТОП-5 РЕКОМЕНДАЦИЙ:")
-        top_recommendations = final_report[final_report['enabled'] == True].nlargest(5, 'price_rec')
-        for _, row in top_recommendations.iterrows():
-            consumer_name = row.get('consumer_name', f"Client_{row['consumer_id']}")
-            print(f"   {consumer_name} | {row['item_id']} | ${row['price_rec']} | {row['target_margin']:.1%} маржа")
+        # Топ-5 рекомендаций и причины отключения (только если их выведут)
+        if log.isEnabledFor(INFO):
+            top_recommendations = final_report[final_report['enabled'] == True].nlargest(5, 'price_rec')
+            lines = []
+            for _, row in top_recommendations.iterrows():
+                consumer_name = row.get('consumer_name', f"Client_{row['consumer_id']}")
+                lines.append(f"\n   {consumer_name} | {row['item_id']} | ${row['price_rec']} | {row['target_margin']:.1%} маржа")
+            log.info("\n🏆 ТОП-5 РЕКОМЕНДАЦИЙ:{lines}", lines="".join(lines))
+            
+            disabled_items = final_report[final_report['enabled'] == False]
+            if not disabled_items.empty:
+                reasons = disabled_items['reason'].value_counts()
+                log.info("\n❌ ТОВАРЫ ДЛЯ ОТКЛЮЧЕНИЯ ({count} шт.):{lines}", count=len(disabled_items),
+                         lines="".join(f"\n   {reason}: {count} товаров" for reason, count in reasons.items()),
+                         reasons=reasons.to_dict())
         
-        # Показываем товары для отключения
-        disabled_items = final_report[final_report['enabled'] == False]
-        if not disabled_items.empty:
-            print(f"\n❌ ТОВАРЫ ДЛЯ ОТКЛЮЧЕНИЯ ({len(disabled_items)} шт.):")
-            for reason in disabled_items['reason'].value_counts().items():
-                print(f"   {reason[0]}: {reason[1]} товаров")
+        save_run_report(timestamp)
         
-        print(f"\n✅ Анализ завершен успешно!")
-        print(f"📁 Проверьте папку {OUTPUT_FOLDER} для результатов")
+        log.info("\n✅ Анализ завершен успешно!\n📁 Проверьте папку {folder} для результатов", folder=OUTPUT_FOLDER)
         
     except Exception as e:
-        print(f"\n❌ ОШИБКА: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("\n❌ ОШИБКА: {error}", error=str(e))
+        # Замеры пригодятся и для упавшего запуска
+        save_run_report(datetime.now().strftime("%Y%m%d_%H%M%S"))
         return 1
     
     return 0